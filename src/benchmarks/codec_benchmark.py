@@ -0,0 +1,141 @@
+"""
+Проверка эквивалентности и бенчмарк кодека ссылок папок (config.crypt).
+
+Сравнивает текущий config.crypt (схема Горнера, кеш недавних ссылок) с
+прежней реализацией через рекурсивный my_pow: сначала результаты на
+граничных и случайных строках должны совпасть, затем замеряется
+пропускная способность без кеша и с кешем.
+
+Запуск из каталога src:
+    python -m benchmarks.codec_benchmark [--strings 2000] [--seed 1]
+Код возврата 1, если найдено расхождение.
+"""
+
+import argparse
+import random
+import sys
+import time
+from typing import Callable, List
+
+import config
+
+
+def legacy_my_pow(value: int, power: int) -> int:
+    """Прежнее возведение в степень (рекурсивное, для каждого символа заново)."""
+    if power == 0:
+        return 1
+    if power % 2 == 0:
+        return legacy_my_pow(value * value, power // 2)
+    else:
+        return value * legacy_my_pow(value * value, (power - 1) // 2)
+
+
+def legacy_crypt(string: str, is_encode: bool) -> str:
+    """Прежний config.crypt."""
+    length = len(string)
+    number = 0
+
+    if is_encode:
+        char_dict, output_chars, input_base, output_base = (
+            config.DICT_ALPHABET, config.SYMBOLS, len(config.ALPHABET), len(config.SYMBOLS))
+    else:
+        char_dict, output_chars, input_base, output_base = (
+            config.DICT_SYMBOLS, config.ALPHABET, len(config.SYMBOLS), len(config.ALPHABET))
+
+    for i in range(length):
+        number += char_dict[string[i]] * legacy_my_pow(input_base, length - i - 1)
+
+    result = ""
+    while number != 0:
+        result += output_chars[number % output_base]
+        number //= output_base
+
+    return result[::-1]
+
+
+def sample_strings(count: int, seed: int) -> List[str]:
+    """Граничные случаи и случайные имена папок, дополненные как в encoding_folder."""
+    rnd = random.Random(seed)
+    strings = [
+        "", " ", "  ", "F:1", "U:1", "F:0",
+        config.ALPHABET[0] * config.MAX_LEN_NAME,
+        config.ALPHABET[-1] * config.MAX_LEN_NAME,
+        " leading space".ljust(config.MAX_LEN_NAME),
+        "Папка".ljust(config.MAX_LEN_NAME),
+    ]
+    for _ in range(count):
+        length = rnd.randint(1, config.MAX_LEN_NAME)
+        name = "".join(rnd.choice(config.ALPHABET) for _ in range(length))
+        strings.append(name.ljust(config.MAX_LEN_NAME))
+        strings.append(f"F:{rnd.randint(1, 10 ** 9)}")
+    return strings
+
+
+def check_equivalence(strings: List[str]) -> int:
+    """
+    Сравнивает кодирование, декодирование и полные ссылки с прежней реализацией.
+
+    Returns:
+        int: Количество расхождений
+    """
+    mismatches = 0
+    for string in strings:
+        encoded = legacy_crypt(string, True)
+        if config.crypt(string, True) != encoded:
+            mismatches += 1
+            print(f"Кодирование отличается: {string!r}", file=sys.stderr)
+        if config.crypt(encoded, False) != legacy_crypt(encoded, False):
+            mismatches += 1
+            print(f"Декодирование отличается: {encoded!r}", file=sys.stderr)
+
+    # Ссылка целиком: формат и обратное декодирование
+    for id_ in ("F:1", "F:123456"):
+        name = "Общая папка"
+        link = config.encoding_folder(id_, name)
+        legacy_link = f"{legacy_crypt(id_, True)}:{legacy_crypt(name.ljust(config.MAX_LEN_NAME), True)}"
+        if link != legacy_link or config.decoding_folder(link) != [id_, name]:
+            mismatches += 1
+            print(f"Ссылка отличается: {link!r}", file=sys.stderr)
+    return mismatches
+
+
+def throughput(crypt: Callable[[str, bool], str], strings: List[str]) -> float:
+    """Количество пар кодирование+декодирование в секунду."""
+    encoded = [legacy_crypt(string, True) for string in strings]
+    start = time.perf_counter()
+    for string, code in zip(strings, encoded):
+        crypt(string, True)
+        crypt(code, False)
+    return len(strings) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--strings", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    strings = sample_strings(args.strings, args.seed)
+    mismatches = check_equivalence(strings)
+    print(f"Строк проверено: {len(strings)}, расхождений: {mismatches}")
+
+    # Повторные ссылки (одна и та же папка отрисовывается много раз)
+    repeated = strings[:100] * 20
+
+    config.crypt.cache_clear()
+    rows = {
+        "прежний": throughput(legacy_crypt, strings),
+        "Горнер": throughput(config.crypt.__wrapped__, strings),
+        "прежний, повторы": throughput(legacy_crypt, repeated),
+        "Горнер + кеш, повторы": throughput(config.crypt, repeated),
+    }
+    print(f"{'реализация':<24}{'пар/с':>12}")
+    for name, value in rows.items():
+        print(f"{name:<24}{value:>12.0f}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Бенчмарк основных операций database.сore на синтетическом графе папок.
+
+Замеряет create (папки и файлы), add_folder (вместе с проверкой циклов
+cycle_BFS), delete (delete_DFS + change_cnt_DFS), отрисовку папки так же,
+как send_start_message (снимок, текст и клавиатура), и кодирование
+ссылок config.crypt. База создается во временном файле генератором
+benchmarks.generator.
+
+Результат - JSON (параметры графа, версии, время операций в мс), который
+можно сохранить и сравнить со следующим запуском:
+    python -m benchmarks.core_benchmark --output base.json
+    python -m benchmarks.core_benchmark --baseline base.json [--threshold 1.2]
+
+Запуск из каталога src. С --baseline код возврата 1, если среднее время
+какой-либо операции выросло больше чем в threshold раз. С --trace в отчет
+добавляются самые дорогие запросы SQLite (database.tracing) - так видно,
+какой запрос стал причиной замедления.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import config
+import database.сore as core
+import keyboards.builders as builders
+import texts.messages as messages
+from benchmarks.generator import Graph, GraphParams, generate
+from database.tracing import QueryTracer
+
+
+def timed(samples: List[float], func: Callable[[], object]) -> None:
+    """Выполняет func и добавляет время выполнения в samples (секунды)."""
+    start = time.perf_counter()
+    try:
+        func()
+    except (KeyError, TypeError, ValueError):
+        # Отказы (дубликат, цикл, лимит глубины) - тоже часть нагрузки
+        pass
+    samples.append(time.perf_counter() - start)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Сводка по замерам в миллисекундах."""
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[max(int(len(samples) * 0.95) - 1, 0)] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def render(chat_id: int) -> None:
+    """Отрисовка текущей папки пользователя, как в bot.send_start_message."""
+    snapshot = core.get_folder_snapshot(chat_id)
+    messages.start_text(
+        chat_type="private",
+        folder_link=config.share_link(core.get_share_token(snapshot.vertex_id)),
+        folder_name=snapshot.name,
+        vertex_type=snapshot.vertex_type,
+        private_mode=snapshot.private_mode,
+        delete_mode=snapshot.delete_mode,
+        is_empty=(snapshot.children_count == 0),
+        head_text=snapshot.head_text
+    )
+    builders.inline_start_kb(
+        chat_id=chat_id,
+        autor_id=snapshot.autor_id,
+        chat_type="private",
+        vertex_type=snapshot.vertex_type,
+        private_mode=snapshot.private_mode,
+        delete_mode=snapshot.delete_mode,
+        children=snapshot.children,
+        page=snapshot.page,
+        cnt_page=snapshot.cnt_page
+    )
+
+
+def go_to(chat_id: int, folders: List[int], root: int) -> None:
+    """Переводит пользователя в папку по пути из id папок."""
+    path = [f"U:{root}"] + [f"F:{folder_id}" for folder_id in folders]
+    core.set_navigation(chat_id, path=path, pages=[1] * len(path), delete_mode=0)
+
+
+def run(graph: Graph, repeat: int, seed: int) -> Dict[str, Dict[str, float]]:
+    """Прогоняет все операции и возвращает сводку по каждой."""
+    rnd = random.Random(seed)
+    chat_ids = list(graph.roots)
+    all_folders = [folder_id for folders in graph.folders.values() for folder_id in folders]
+    samples: Dict[str, List[float]] = {
+        name: [] for name in (
+            "render_root", "render_deep", "create_folder", "create_file",
+            "add_folder", "delete", "crypt_encode", "crypt_decode"
+        )
+    }
+
+    for _ in range(repeat):
+        chat_id = rnd.choice(chat_ids)
+        root = graph.roots[chat_id]
+
+        go_to(chat_id, [], root)
+        timed(samples["render_root"], lambda: render(chat_id))
+
+        go_to(chat_id, graph.deepest_path(chat_id)[1:], root)
+        timed(samples["render_deep"], lambda: render(chat_id))
+
+        timed(samples["create_folder"], lambda: core.create(chat_id, "fold", "bench", 0))
+        timed(samples["create_file"], lambda: core.create(
+            chat_id, "file", "bench", file_id="tg_bench", file_type="document"
+        ))
+
+        # Добавление чужой папки в корень: проверка циклов по всему поддереву
+        go_to(chat_id, [], root)
+        folder_id = rnd.choice(all_folders)
+        timed(samples["add_folder"], lambda: core.add_folder(chat_id, "F", folder_id))
+
+        name = "".join(rnd.choice(config.ALPHABET) for _ in range(config.MAX_LEN_NAME))
+        timed(samples["crypt_encode"], lambda: config.crypt(name, True))
+        encoded = config.crypt(name, True)
+        timed(samples["crypt_decode"], lambda: config.crypt(encoded, False))
+
+    # Удаление меняет граф, поэтому выполняется последним
+    for chat_id in rnd.sample(chat_ids, min(repeat, len(chat_ids))):
+        root = graph.roots[chat_id]
+        go_to(chat_id, [], root)
+        for vertex in core.get_children(root)[:3]:
+            timed(samples["delete"], lambda: core.delete(chat_id, vertex))
+
+    return {name: summarize(values) for name, values in samples.items() if values}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline_path: Path, threshold: float) -> bool:
+    """
+    Сравнивает средние времена с сохраненным отчетом.
+
+    Returns:
+        bool: True если ни одна операция не замедлилась больше чем в threshold раз
+    """
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    ok = True
+    for name, row in results.items():
+        if name not in baseline:
+            continue
+        ratio = row["mean_ms"] / baseline[name]["mean_ms"]
+        if ratio > threshold:
+            ok = False
+            print(f"Замедление {name}: x{ratio:.2f}", file=sys.stderr)
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--sharing", type=float, default=0.1)
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--trace", action="store_true", help="Добавить в отчет самые дорогие запросы")
+    args = parser.parse_args()
+
+    params = GraphParams(
+        users=args.users,
+        depth=args.depth,
+        fanout=args.fanout,
+        sharing=args.sharing,
+        files=args.files,
+        seed=args.seed
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        graph = generate(db_path, params)
+        # Порог медленных запросов бесконечный: нужна только сводка
+        tracer = QueryTracer(slow_ms=float("inf")) if args.trace else None
+        core.init_pool(db_path, tracer=tracer)
+        try:
+            results = run(graph, args.repeat, args.seed)
+        finally:
+            core.close_pool()
+
+    report = {
+        "params": params.as_dict(),
+        "graph": {
+            "folders": graph.folder_count,
+            "files": graph.file_count,
+            "edges": graph.edge_count,
+        },
+        "env": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cache_enabled": core.cache.enabled,
+        },
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if tracer is not None:
+        report["statements"] = tracer.top(20)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    print(text)
+
+    if args.baseline and not compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Микро-бенчмарк проверки циклов при добавлении папки (core.cycle_BFS).
+
+Сравнивает прежний обход (один запрос на вершину, без множества
+посещенных вершин) с рекурсивным SQL-запросом на синтетических графах:
+глубокая цепочка, широкая папка и "ромбы" (каждая папка слоя ссылается
+на все папки следующего слоя - общие поддеревья).
+
+Запуск из каталога src:
+    python -m benchmarks.cycle_benchmark [--repeat 5]
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import database.initializer as initializer
+import database.сore as core
+
+
+def legacy_cycle_BFS(vertices_id: List[int], path_id: List[int]) -> bool:
+    """Прежний алгоритм: запрос на каждую вершину и повторный обход общих поддеревьев."""
+    if not vertices_id:
+        return True
+
+    next_vertices_id: List[int] = []
+    for vertex_id in vertices_id:
+        if vertex_id in path_id:
+            return False
+        next_vertices_id += [
+            int(vertex.split(":")[-1])
+            for vertex in core.get_children(vertex_id)
+            if vertex.split(":")[0] == "F"
+        ]
+
+    return legacy_cycle_BFS(next_vertices_id, path_id)
+
+
+def build_graph(db_path: Path, edges: List[Tuple[int, int]], folders: int) -> None:
+    """Заполняет базу папками 1..folders и ребрами (родитель, ребенок)."""
+    initializer.create_db(str(db_path))
+    with sqlite3.connect(db_path) as con:
+        con.executemany(
+            "INSERT INTO Folders (id, name, autor_id, private_mode) VALUES (?, ?, 1, 0)",
+            [(i, f"folder_{i}") for i in range(1, folders + 1)]
+        )
+        con.executemany(
+            "INSERT INTO Edges (parent_id, child_type, child_id, position) VALUES (?, 'F', ?, ?)",
+            [(parent, child, position) for position, (parent, child) in enumerate(edges)]
+        )
+
+
+def deep_chain(depth: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Цепочка 1 -> 2 -> ... -> depth."""
+    return [(i, i + 1) for i in range(1, depth)], depth
+
+
+def wide_folder(width: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Папка 1 с width дочерними папками, у каждой - по две своих."""
+    edges = [(1, i) for i in range(2, width + 2)]
+    next_id = width + 2
+    for parent in range(2, width + 2):
+        edges += [(parent, next_id), (parent, next_id + 1)]
+        next_id += 2
+    return edges, next_id - 1
+
+
+def diamonds(layers: int, width: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Слои по width папок, каждая ссылается на все папки следующего слоя."""
+    edges = [(1, child) for child in range(2, width + 2)]
+    for layer in range(layers - 1):
+        first = 2 + layer * width
+        for parent in range(first, first + width):
+            edges += [(parent, child) for child in range(first + width, first + 2 * width)]
+    return edges, 1 + layers * width
+
+
+def measure(check: Callable[[List[int], List[int]], bool], repeat: int) -> float:
+    """Среднее время проверки добавления папки 1 в папку, не лежащую в графе."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        check([1], [10 ** 9])
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    graphs: Dict[str, Tuple[List[Tuple[int, int]], int]] = {
+        "цепочка 95": deep_chain(95),
+        "ширина 5000": wide_folder(5000),
+        "ромбы 8x3": diamonds(8, 3),
+        "ромбы 30x10": diamonds(30, 10),
+    }
+
+    print(f"{'граф':<14}{'ребер':>8}{'прежний, мс':>14}{'CTE, мс':>10}")
+    for name, (edges, folders) in graphs.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "bench.db"
+            build_graph(db_path, edges, folders)
+            core.init_pool(db_path)
+
+            # На больших "ромбах" прежний обход экспоненциален - не запускаем
+            legacy = "-"
+            if len(edges) < 1000 or name.startswith("цепочка") or name.startswith("ширина"):
+                legacy = f"{measure(legacy_cycle_BFS, args.repeat):.2f}"
+            cte = measure(core.cycle_BFS, args.repeat)
+            core.close_pool()
+
+        print(f"{name:<14}{len(edges):>8}{legacy:>14}{cte:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
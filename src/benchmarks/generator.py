@@ -0,0 +1,157 @@
+"""
+Генератор синтетических графов пользователей и папок для бенчмарков.
+
+У каждого пользователя строится собственное дерево папок заданной глубины
+и ширины, в папки кладутся файлы, а затем добавляются ссылки на
+общие папки (их доля от числа ребер - sharing). Общие ссылки всегда
+ведут к папке с большим id, поэтому граф остается ациклическим, а
+count_of_users считается так же, как его поддерживает database.сore
+(число путей от корней пользователей).
+
+Использование:
+    params = GraphParams(users=50, depth=4, fanout=3, sharing=0.1, files=2)
+    graph = generate(db_path, params)
+"""
+
+import contextlib
+import random
+import sqlite3
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import database.initializer as initializer
+
+
+@dataclass
+class GraphParams:
+    """Параметры синтетического графа."""
+    users: int = 50  # Количество пользователей (корневых папок)
+    depth: int = 4  # Глубина дерева каждого пользователя
+    fanout: int = 3  # Дочерних папок у каждой папки
+    sharing: float = 0.1  # Доля дополнительных ссылок на чужие папки
+    files: int = 2  # Файлов в каждой папке
+    seed: int = 1
+
+    def as_dict(self) -> Dict[str, float]:
+        """Параметры для JSON-отчета."""
+        return asdict(self)
+
+
+@dataclass
+class Graph:
+    """Описание сгенерированного графа для выбора операций бенчмарка."""
+    roots: Dict[int, int] = field(default_factory=dict)  # chat_id -> id корня
+    folders: Dict[int, List[int]] = field(default_factory=dict)  # chat_id -> папки пользователя
+    children: Dict[int, List[int]] = field(default_factory=lambda: defaultdict(list))
+    folder_count: int = 0
+    file_count: int = 0
+    edge_count: int = 0
+
+    def deepest_path(self, chat_id: int) -> List[int]:
+        """Путь от корня пользователя по первым дочерним папкам до листа."""
+        path = [self.roots[chat_id]]
+        while self.children[path[-1]]:
+            path.append(self.children[path[-1]][0])
+        return path
+
+
+def generate(db_path: Path, params: GraphParams) -> Graph:
+    """
+    Создает базу по пути db_path и заполняет ее синтетическим графом.
+
+    Args:
+        db_path: Путь к файлу базы (обычно во временном каталоге)
+        params: Параметры графа
+
+    Returns:
+        Graph: Корни, папки пользователей и ребра между папками
+    """
+    rnd = random.Random(params.seed)
+    # Сообщение о создании базы не должно попасть в JSON-отчет на stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        initializer.create_db(str(db_path))
+
+    graph = Graph()
+    folders: List[Tuple[int, str, int, int]] = []  # id, имя, автор, private_mode
+    edges: List[Tuple[int, str, int]] = []  # родитель, тип, ребенок
+    next_id = 1
+
+    # Деревья пользователей (id детей всегда больше id родителя)
+    for chat_id in range(1, params.users + 1):
+        root = next_id
+        next_id += 1
+        folders.append((root, f"user_{chat_id}", chat_id, 1))
+        graph.roots[chat_id] = root
+        graph.folders[chat_id] = [root]
+
+        level = [root]
+        for _ in range(params.depth):
+            next_level = []
+            for parent in level:
+                for _ in range(params.fanout):
+                    folders.append((next_id, f"folder_{next_id}", chat_id, rnd.randint(0, 1)))
+                    edges.append((parent, "F", next_id))
+                    graph.children[parent].append(next_id)
+                    graph.folders[chat_id].append(next_id)
+                    next_level.append(next_id)
+                    next_id += 1
+            level = next_level
+
+    # Общие папки: ссылка на случайную папку с большим id (граф без циклов)
+    total = next_id - 1
+    for _ in range(int(len(edges) * params.sharing)):
+        parent = rnd.randint(1, total - 1)
+        child = rnd.randint(parent + 1, total)
+        if child not in graph.children[parent]:
+            edges.append((parent, "F", child))
+            graph.children[parent].append(child)
+
+    # count_of_users - число путей от корней (id уже в топологическом порядке)
+    counts = {folder_id: 0 for folder_id, *_ in folders}
+    for root in graph.roots.values():
+        counts[root] = 1
+    for folder_id in sorted(counts):
+        for child in graph.children[folder_id]:
+            counts[child] += counts[folder_id]
+
+    files: List[Tuple[int, str, str, str]] = []
+    file_id = 1
+    for folder_id, *_ in folders:
+        for _ in range(params.files):
+            files.append((file_id, f"file_{file_id}", f"tg_file_{file_id}", "document"))
+            edges.append((folder_id, "D", file_id))
+            file_id += 1
+
+    positions: Dict[int, int] = defaultdict(int)
+    edge_rows = []
+    for parent, child_type, child in edges:
+        positions[parent] += 1
+        edge_rows.append((parent, child_type, child, positions[parent]))
+
+    with sqlite3.connect(db_path) as con:
+        con.executemany(
+            "INSERT INTO Folders (id, name, autor_id, private_mode, count_of_users) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(id_, name, autor, mode, counts[id_]) for id_, name, autor, mode in folders]
+        )
+        con.executemany(
+            "INSERT INTO Files (id, name, file_id, file_type) VALUES (?, ?, ?, ?)",
+            files
+        )
+        con.executemany(
+            "INSERT INTO Edges (parent_id, child_type, child_id, position) VALUES (?, ?, ?, ?)",
+            edge_rows
+        )
+        con.executemany(
+            "INSERT INTO Users (chat_id, path, pages) VALUES (?, ?, '1')",
+            [(chat_id, f"U:{root}") for chat_id, root in graph.roots.items()]
+        )
+    con.close()
+
+    graph.folder_count = len(folders)
+    graph.file_count = len(files)
+    graph.edge_count = len(edge_rows)
+    return graph
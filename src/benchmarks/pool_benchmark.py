@@ -0,0 +1,176 @@
+"""
+Бенчмарк пула соединений database.сore.
+
+Сравнивает число открытий соединений и задержку на одно обновление
+(нажатие кнопки с отрисовкой папки, как в bot.inline_callback) без переиспользования
+соединений (size=0) и с пулом.
+
+Режим "до пула" повторяет исходную отрисовку: по соединению sqlite3.connect на
+каждый из запросов get_value_db/get_full_parameters/set_value_db, дочерние
+элементы - строкой Folders.next_vertices. С ним сравниваются числа из описания
+изменения, добавившего пул; остальные режимы идут через текущее ядро (снимок
+папки, кеш, сессии), поэтому меняются вместе с ним.
+
+Запуск из каталога src:
+    python -m benchmarks.pool_benchmark [--updates 500] [--children 15] [--pool-size 4]
+"""
+
+import argparse
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import database.initializer as initializer
+import database.сore as core
+
+
+def prepare_db(db_path: Path, children: int) -> int:
+    """
+    Создает базу с одним пользователем и папкой из children дочерних папок.
+    
+    Returns:
+        int: chat_id созданного пользователя
+    """
+    initializer.create_db(str(db_path))
+    core.init_pool(db_path, size=1)
+
+    chat_id = 1
+    core.create_user(chat_id, "private", "bench")
+    for i in range(children):
+        core.create(chat_id, "fold", f"folder_{i}", private_mode=0)
+
+    core.close_pool()
+    return chat_id
+
+
+def render_update(chat_id: int) -> None:
+    """Повторяет обращения к базе одного нажатия кнопки (inline_callback + отрисовка)."""
+    core.get_folder_snapshot(chat_id, with_children=False)
+    core.get_folder_snapshot(chat_id)
+
+
+def legacy_query(db_path: Path, sql: str, params: Tuple[Any, ...]) -> Any:
+    """Один запрос на новом соединении, как в ядре до появления пула."""
+    with sqlite3.connect(db_path) as con:
+        cur = con.cursor()
+        cur.execute(sql, params)
+        row = cur.fetchone()
+    return row
+
+
+def legacy_update(db_path: Path, chat_id: int) -> int:
+    """
+    Повторяет запросы исходной отрисовки папки.
+    
+    Returns:
+        int: Сколько соединений было открыто
+    """
+    opens = 0
+
+    def query(sql: str, *params: Any) -> Any:
+        nonlocal opens
+        opens += 1
+        return legacy_query(db_path, sql, params)
+
+    path = query("SELECT path FROM Users WHERE chat_id = ?", chat_id)[0]
+    vertex_id = int(path.split("\\")[-1].split(":")[-1])
+
+    query("SELECT delete_mode FROM Users WHERE chat_id = ?", chat_id)
+    query("SELECT private_mode FROM Folders WHERE id = ?", vertex_id)
+    query("SELECT autor_id FROM Folders WHERE id = ?", vertex_id)
+    folder_params = query(
+        "SELECT name, autor_id, private_mode, next_vertices, head_text FROM Folders WHERE id = ?",
+        vertex_id
+    )
+
+    next_vertices = folder_params[3].split(";")
+    for vertex in next_vertices:
+        query("SELECT id FROM Folders WHERE id = ?", int(vertex.split(":")[-1]))
+    query("UPDATE Folders SET next_vertices = ? WHERE id = ?", ";".join(next_vertices), vertex_id)
+
+    query("SELECT pages FROM Users WHERE chat_id = ?", chat_id)
+    for vertex in next_vertices[:10]:
+        query("SELECT name FROM Folders WHERE id = ?", int(vertex.split(":")[-1]))
+    return opens
+
+
+def run_legacy(db_path: Path, chat_id: int, updates: int) -> Dict[str, float]:
+    """Прогоняет updates отрисовок исходным способом (соединение на запрос)."""
+    # Исходная схема хранила дочерние элементы строкой в Folders.next_vertices
+    with sqlite3.connect(db_path) as con:
+        con.execute(
+            "UPDATE Folders SET next_vertices = COALESCE(("
+            "SELECT group_concat(child, ';') FROM ("
+            "SELECT child_type || ':' || child_id AS child FROM Edges "
+            "WHERE parent_id = Folders.id ORDER BY position)), '')"
+        )
+    con.close()
+
+    opens = 0
+    latencies: List[float] = []
+    for _ in range(updates):
+        start = time.perf_counter()
+        opens += legacy_update(db_path, chat_id)
+        latencies.append(time.perf_counter() - start)
+
+    return summarize(opens, latencies)
+
+
+def run(db_path: Path, chat_id: int, pool_size: int, updates: int) -> Dict[str, float]:
+    """Прогоняет updates отрисовок с пулом заданного размера."""
+    pool = core.init_pool(db_path, size=pool_size)
+    latencies: List[float] = []
+
+    for _ in range(updates):
+        start = time.perf_counter()
+        render_update(chat_id)
+        latencies.append(time.perf_counter() - start)
+
+    stats = pool.stats()
+    core.close_pool()
+    return summarize(stats["opened"], latencies)
+
+
+def summarize(opens: int, latencies: List[float]) -> Dict[str, float]:
+    """Открытия соединений на обновление и перцентили задержки."""
+    updates = len(latencies)
+    latencies.sort()
+
+    return {
+        "opens_per_update": opens / updates,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--children", type=int, default=15)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        chat_id = prepare_db(db_path, args.children)
+
+        results = {
+            "до пула": run_legacy(db_path, chat_id, args.updates),
+            "без пула": run(db_path, chat_id, 0, args.updates),
+            f"пул ({args.pool_size})": run(db_path, chat_id, args.pool_size, args.updates),
+        }
+
+    print(f"{'режим':<12}{'opens/upd':>12}{'mean, мс':>12}{'p50, мс':>12}{'p99, мс':>12}")
+    for name, row in results.items():
+        print(
+            f"{name:<12}{row['opens_per_update']:>12.2f}{row['mean_ms']:>12.3f}"
+            f"{row['p50_ms']:>12.3f}{row['p99_ms']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
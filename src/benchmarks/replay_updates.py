@@ -0,0 +1,127 @@
+"""
+Отправка записанных обновлений на локальный webhook (BOT_MODE=webhook).
+
+Читает обновления Telegram из файла (по одному JSON-объекту в строке) или
+генерирует синтетические (/start и нажатия кнопок пагинации от разных
+чатов) и отправляет их POST-запросами с заданной параллельностью.
+Печатает распределение кодов ответа и задержку приема.
+
+Запуск из каталога src (бот запущен с BOT_MODE=webhook):
+    python -m benchmarks.replay_updates --file updates.jsonl
+    python -m benchmarks.replay_updates --synthetic 1000 --chats 50 --concurrency 20
+
+Синтетические чаты не существуют в Telegram, поэтому вызовы Bot API из
+обработчиков будут завершаться ошибками - проверяется прием и очередь.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+import aiohttp
+
+import config
+import webhook
+
+
+def synthetic_updates(count: int, chats: int, seed: int) -> List[Dict[str, Any]]:
+    """Сообщения /start и нажатия кнопок от chats приватных чатов."""
+    rnd = random.Random(seed)
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = rnd.randint(1, chats)
+        chat = {"id": chat_id, "type": "private", "username": f"user_{chat_id}"}
+        user = {"id": chat_id, "is_bot": False, "first_name": f"user_{chat_id}"}
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }
+        if rnd.random() < 0.5:
+            updates.append({"update_id": update_id, "message": message})
+        else:
+            updates.append({
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": user,
+                    "chat_instance": str(chat_id),
+                    "message": {**message, "from": {**user, "is_bot": True}},
+                    "data": rnd.choice(["pagina_next", "pagina_back", "pagina_view"]),
+                },
+            })
+    return updates
+
+
+async def replay(
+    updates: List[Dict[str, Any]],
+    url: str,
+    secret: str,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Отправляет обновления и собирает коды ответа и задержки."""
+    headers = {webhook.SECRET_HEADER: secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Counter = Counter()
+    latencies: List[float] = []
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def send(update: Dict[str, Any]) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, json=update) as response:
+                        statuses[response.status] += 1
+                except aiohttp.ClientError:
+                    statuses["error"] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "updates": len(updates),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "updates_per_s": len(updates) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--file", type=Path, help="Файл с обновлениями (JSON в каждой строке)")
+    parser.add_argument("--synthetic", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--url",
+        default=f"http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+    )
+    parser.add_argument("--secret", default=config.WEBHOOK_SECRET)
+    args = parser.parse_args()
+
+    if args.file:
+        lines = args.file.read_text(encoding="utf-8").splitlines()
+        updates = [json.loads(line) for line in lines if line.strip()]
+    else:
+        updates = synthetic_updates(args.synthetic, args.chats, args.seed)
+
+    result = asyncio.run(replay(updates, args.url, args.secret, args.concurrency))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
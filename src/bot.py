@@ -9,38 +9,110 @@
 """
 
 import asyncio
-from math import ceil
-from typing import Optional, Union
+from typing import Awaitable, Callable, List, Optional, Union
 
 import keyboards.builders as builders
 import config
 import database.сore as core
+import database.async_core as acore
+import database.initializer as initializer
+import database.data_migrations as data_migrations
+from database.fsm_storage import SQLiteStorage
 import texts.messages as messages
+import sharding
+import webhook
+from services import metrics, tracing
+from services.compaction import Compactor
+from services.cleanup import ChatCleaner, IncomingMessagesMiddleware, OutgoingMessagesMiddleware
+from services.albums import AlbumCollector
+from services.folder_sender import FolderSender, send_file
+from services.render_cache import RenderCache
+from services.search import SearchQueries
+from services.scheduler import RequestScheduler
 
-from dotenv import load_dotenv
-import os
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import CallbackQuery, Message
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
-
-
-# Загрузка BOT_TOKEN из .env файла
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
+from aiogram.exceptions import TelegramBadRequest
 
 
 # Инициализация бота с HTML-разметкой по умолчанию
 bot = Bot(
-    token=BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    token=config.BOT_TOKEN,
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    session=AiohttpSession(proxy=config.BOT_PROXY) if config.BOT_PROXY else None
 )
-dp = Dispatcher()
+
+# Состояния FSM переживают перезапуск и видны всем процессам (sharding)
+if config.FSM_STORAGE == "sqlite":
+    storage = SQLiteStorage(
+        lambda: core.get_pool().connection(),
+        maxsize=config.FSM_CACHE_SIZE,
+        ttl=config.FSM_STATE_TTL,
+        flush_interval=config.FSM_FLUSH_INTERVAL
+    )
+else:
+    storage = MemoryStorage()
+dp = Dispatcher(storage=storage)
+
+# Все запросы к Bot API проходят через очередь с ограничением частоты
+scheduler = RequestScheduler(
+    global_rate=config.API_WORKER_GLOBAL_RATE,
+    chat_rate=config.API_CHAT_RATE,
+    chat_burst=config.API_CHAT_BURST,
+    group_rate=config.API_GROUP_RATE
+)
+bot.session.middleware(scheduler)
+
+# Очистка приватных чатов: запоминаем сообщения и удаляем их пачками
+cleaner = ChatCleaner(bot, concurrency=config.CLEANUP_CONCURRENCY)
+bot.session.middleware(OutgoingMessagesMiddleware(cleaner))
+dp.message.outer_middleware(IncomingMessagesMiddleware(cleaner))
+
+# Отправка всех файлов папки альбомами в фоне
+sender = FolderSender(bot)
+
+# Фоновая очистка графа папок вместо проверок при отрисовке
+compactor = Compactor(batch_size=config.COMPACTION_BATCH, interval=config.COMPACTION_INTERVAL)
+
+# Последние отрисованные меню: одинаковый edit_text не отправляется
+renders = RenderCache()
+
+# Последние запросы /search (для кнопок страниц результатов)
+searches = SearchQueries()
+
+# Метки обновлений для журнала медленных запросов
+if core.tracer is not None:
+    tracing.install(dp)
+
+# Метрики подключаются последними: запросы к Bot API учитываются после очереди
+if config.METRICS_ENABLED:
+    metrics.install(dp, bot, core, db_exclude=("init_pool", "get_pool", "close_pool"))
+    for prefix, stats, counters in (
+        ("bot_db_pool", lambda: core.get_pool().stats(),
+         ("opened", "reused", "health_failures", "commits", "rollbacks")),
+        ("bot_db_cache", core.cache.stats, ("hits", "misses", "evictions", "stale")),
+        ("bot_sessions", core.sessions.stats, ("loads", "flushes", "flushed_rows")),
+        ("bot_api_scheduler", scheduler.stats, ("granted", "delayed", "retries")),
+        ("bot_cleanup", cleaner.stats, ("cleanups", "deleted", "calls", "failed_calls")),
+        ("bot_render", renders.stats, ("rendered", "skipped")),
+        ("bot_search", searches.stats, ("searches", "expired")),
+    ):
+        metrics.registry.add_collector(metrics.stats_collector(prefix, stats, counters))
+    metrics.registry.add_collector(metrics.stats_collector(
+        "bot_compaction", compactor.stats,
+        ("batches", "passes", "removed_edges", "removed_files", "removed_folders")
+    ))
+    if isinstance(storage, SQLiteStorage):
+        metrics.registry.add_collector(metrics.stats_collector(
+            "bot_fsm", storage.stats, ("loads", "flushes", "flushed_rows", "expired")
+        ))
 
 
 class OrderAdd(StatesGroup):
@@ -53,20 +125,6 @@ class OrderAdd(StatesGroup):
     set_head_text = State()
 
 
-async def clear_chat(chat_id: int, message_id: int) -> None:
-    """Очистка чата от предыдущих сообщений.
-    
-    Args:
-        chat_id: ID чата
-        message_id: ID сообщения, от которого очищаем
-    """
-    try:
-        for i in range(message_id, 0, -1):
-            await bot.delete_message(chat_id, i)
-    except TelegramBadRequest:
-        pass
-
-
 async def check_user_in_table(message: Message) -> None:
     """Проверка наличия пользователя в базе данных.
     
@@ -76,8 +134,7 @@ async def check_user_in_table(message: Message) -> None:
     chat_type = message.chat.type
     name = message.chat.title or message.chat.username
 
-    if not core.is_user_in_table(chat_id):
-        core.create_user(chat_id, chat_type, name)
+    await acore.ensure_user(chat_id, chat_type, name)
 
 async def send_start_message(
     level_message_type: str,
@@ -113,114 +170,75 @@ async def send_start_message(
         chat_type = callback.message.chat.type  # type: ignore
         chat_id = callback.message.chat.id  # type: ignore
 
-    # Получаем текущий путь пользователя
-    try:
-        path = core.get_value_db("Users", "path", chat_id)
-        vertex_type, vertex_id = path.split("\\")[-1].split(":")
-        vertex_id = int(vertex_id)
-    except (ValueError, AttributeError) as ex:
-        print(f"Ошибка разбора пути: {ex}")
-        # Сбрасываем путь к корневой папке
-        path = core.get_value_db("Users", "path", chat_id).split("\\")
-        core.set_value_db("Users", "path", chat_id, path[0])
-        core.set_value_db("Users", "pages", chat_id, "1")
-        await send_start_message(level_message_type="callback", callback=callback)
-        return
-
-    # Получаем параметры текущей папки
+    # Получаем снимок текущей папки
     try:
-        delete_mode = core.get_value_db("Users", "delete_mode", chat_id)
-        private_mode = core.get_value_db("Folders", "private_mode", vertex_id)
-        autor_id = core.get_value_db("Folders", "autor_id", vertex_id)
-        folder_params = core.get_full_parameters(vertex_id)
-    except Exception as ex:
+        snapshot = await acore.get_folder_snapshot(chat_id, change_page=change_page)
+    except (ValueError, LookupError) as ex:
         print(f"Ошибка получения параметров: {ex}")
-        # Сбрасываем настройки
-        path = core.get_value_db("Users", "path", chat_id).split("\\")
-        core.set_value_db("Users", "path", chat_id, path[0])
-        core.set_value_db("Users", "pages", chat_id, "1")
-        await send_start_message(level_message_type="callback", callback=callback)
+        # Сбрасываем путь к корневой папке
+        await acore.reset_navigation(chat_id)
+        await send_start_message(level_message_type, message=message, callback=callback)
         return
 
-    # Обрабатываем список дочерних элементов
-    next_vertices = (
-        [] if folder_params[3].split(";")[0] == "" 
-        else folder_params[3].split(";")
-    )
-
-    # Проверяем существование дочерних элементов
-    i = 0
-    while i < len(next_vertices):
-        try:
-            vert_type, vert_id = next_vertices[i].split(":")
-            if vert_type != "D":
-                # Проверяем существование папки
-                _ = core.get_value_db("Folders", "id", int(vert_id))
-        except Exception as ex:
-            print(f"Ошибка проверки элемента: {ex}")
-            next_vertices.pop(i)
-        else:
-            i += 1
-
-    # Обновляем список вершин
-    core.set_value_db(
-        "Folders", 
-        "next_vertices", 
-        vertex_id, 
-        ";".join(next_vertices)
-    )
-
-    # Обрабатываем пагинацию
-    pages = [
-        int(page) for page in 
-        core.get_value_db("Users", "pages", chat_id).split("\\")
-    ]
-    
-    if change_page != 0:
-        pages[-1] += change_page
-        core.set_value_db(
-            "Users", 
-            "pages", 
-            chat_id, 
-            "\\".join(str(page) for page in pages)
-        )
-    
-    # Сбрасываем режим удаления если нет элементов
-    if not next_vertices:
-        core.set_value_db("Users", "delete_mode", chat_id, 0)
-        delete_mode = 0
+    # Ссылка на папку не показывается только в корне личного чата
+    folder_link = ""
+    if not (snapshot.vertex_type == "U" and chat_type == "private"):
+        folder_link = config.share_link(await acore.get_share_token(snapshot.vertex_id))
 
     # Формируем сообщение и клавиатуру
     text_message = messages.start_text(
         chat_type=chat_type,
-        folder_link=config.encoding_folder(f"{vertex_type}:{vertex_id}", folder_params[0]),
-        folder_name=folder_params[0],
-        vertex_type=vertex_type,
-        private_mode=folder_params[2],
-        delete_mode=delete_mode,
-        is_empty=(len(next_vertices) == 0),
-        head_text=folder_params[4]
+        folder_link=folder_link,
+        folder_name=snapshot.name,
+        vertex_type=snapshot.vertex_type,
+        private_mode=snapshot.private_mode,
+        delete_mode=snapshot.delete_mode,
+        is_empty=(snapshot.children_count == 0),
+        head_text=snapshot.head_text
     )
     
     reply_markup = builders.inline_start_kb(
         chat_id=chat_id,
-        autor_id=autor_id,
+        autor_id=snapshot.autor_id,
         chat_type=chat_type,
-        vertex_type=vertex_type,
-        private_mode=private_mode,
-        delete_mode=delete_mode,
-        next_vertices=next_vertices
+        vertex_type=snapshot.vertex_type,
+        private_mode=snapshot.private_mode,
+        delete_mode=snapshot.delete_mode,
+        children=snapshot.children,
+        page=snapshot.page,
+        cnt_page=snapshot.cnt_page
+    )
+
+    fingerprint = renders.fingerprint(
+        text_message,
+        snapshot.autor_id == chat_id,
+        snapshot.vertex_type,
+        snapshot.private_mode,
+        snapshot.delete_mode,
+        tuple(snapshot.children),
+        snapshot.page,
+        snapshot.cnt_page
     )
 
     # Отправляем сообщение
     if level_message_type == "message":
-        await message.answer(text=text_message, reply_markup=reply_markup)  # type: ignore
+        sent = await message.answer(text=text_message, reply_markup=reply_markup)  # type: ignore
+        renders.remember(chat_id, sent.message_id, fingerprint)
     else:
-        await callback.message.edit_text(text=text_message, reply_markup=reply_markup)  # type: ignore
-
-    # Очищаем чат
+        message_id = callback.message.message_id  # type: ignore
+        if renders.is_same(chat_id, message_id, fingerprint):
+            return
+        try:
+            await callback.message.edit_text(text=text_message, reply_markup=reply_markup)  # type: ignore
+        except TelegramBadRequest as ex:
+            # Меню не изменилось, но отпечатка еще не было (например, после перезапуска)
+            if "message is not modified" not in ex.message:
+                raise
+        renders.remember(chat_id, message_id, fingerprint)
+
+    # Очищаем чат в фоне, оставляя только новое меню
     if level_message_type == "message" and chat_type == "private":
-        await clear_chat(chat_id, message.message_id)  # type: ignore
+        cleaner.schedule(chat_id, keep=[sent.message_id])
 
 
 @dp.message(CommandStart())
@@ -236,6 +254,77 @@ async def help_command(message: Message) -> None:
     await message.answer(text=messages.HELP_INSTRUCTION)
 
 
+@dp.message(Command('revoke_link'))
+async def revoke_link_command(message: Message) -> None:
+    """Обработчик команды /revoke_link: отзывает ссылки на текущую папку."""
+    chat_id = message.chat.id
+    try:
+        snapshot = await acore.get_folder_snapshot(chat_id, with_children=False)
+    except (ValueError, LookupError):
+        await send_start_message(level_message_type="message", message=message)
+        return
+
+    # Отзывать ссылки может только создатель папки
+    if snapshot.autor_id != chat_id:
+        await message.answer(text=messages.REVOKE_LINK_FORBIDDEN_ERROR)
+        return
+
+    await acore.revoke_share_tokens(snapshot.vertex_id)
+    await message.answer(text=messages.REVOKE_LINK_TEXT)
+    await send_start_message(level_message_type="message", message=message)
+
+
+async def send_search_page(
+    chat_id: int,
+    query: str,
+    page: int,
+    message: Message | None = None,
+    callback: CallbackQuery | None = None
+) -> None:
+    """
+    Отправляет (по команде) или перерисовывает (по кнопке) страницу результатов поиска.
+    
+    Args:
+        chat_id: Идентификатор чата
+        query: Текст запроса
+        page: Номер страницы (с 1)
+        message: Сообщение с командой /search
+        callback: Нажатие кнопки страницы результатов
+    """
+    if page < 1:
+        await callback.answer(text=messages.FIRST_PAGE_ANSWER)  # type: ignore
+        return
+
+    hits = await acore.search(chat_id, query, limit=core.PAGE_SIZE, offset=(page - 1) * core.PAGE_SIZE)
+    if not hits:
+        if callback is not None:
+            await callback.answer(text=messages.LAST_PAGE_ANSWER if page > 1 else messages.SEARCH_EMPTY_TEXT)
+        else:
+            await message.answer(text=messages.SEARCH_EMPTY_TEXT)  # type: ignore
+        return
+
+    text = messages.search_results_text(query, page)
+    reply_markup = builders.inline_search_kb(hits, page)
+    if callback is not None:
+        await callback.answer()
+        await callback.message.edit_text(text=text, reply_markup=reply_markup)  # type: ignore
+    else:
+        await message.answer(text=text, reply_markup=reply_markup)  # type: ignore
+
+
+@dp.message(Command('search'))
+async def search_command(message: Message, command: CommandObject) -> None:
+    """Обработчик команды /search: поиск по папкам, достижимым из корня чата."""
+    await check_user_in_table(message)
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer(text=messages.SEARCH_USAGE_TEXT)
+        return
+
+    searches.remember(message.chat.id, query)
+    await send_search_page(message.chat.id, query, 1, message=message)
+
+
 @dp.message(Command('made_by'))
 async def made_by_command(message: Message) -> None:
     """Обработчик команды /made_by."""
@@ -250,23 +339,16 @@ async def inline_callback(callback: CallbackQuery, state: FSMContext) -> None:
     call = str(callback.data)
 
     try:
-        # Получаем текущий путь
-        path = core.get_value_db("Users", "path", chat_id)
-        vertex_type, vertex_id = path.split("\\")[-1].split(":")
-        vertex_id = int(vertex_id)
-        
-        next_vertices = core.get_value_db("Folders", "next_vertices", vertex_id).split(";")
+        # Получаем текущий путь и пагинацию
+        snapshot = await acore.get_folder_snapshot(chat_id, with_children=False)
     except Exception:
         # Сброс при ошибке
-        path = core.get_value_db("Users", "path", chat_id).split("\\")
-        core.set_value_db("Users", "path", chat_id, path[0])
-        core.set_value_db("Users", "pages", chat_id, 1)
+        await acore.reset_navigation(chat_id)
         await send_start_message(level_message_type="callback", callback=callback)
         return
 
-    next_vertices = [] if next_vertices[0] == "" else next_vertices
-    page = int(core.get_value_db("Users", "pages", chat_id).split("\\")[-1])
-    cnt_page = ceil(len(next_vertices) / 10)
+    path, pages = snapshot.path, snapshot.pages
+    page, cnt_page = snapshot.page, snapshot.cnt_page
 
     match call:
         case 'head':
@@ -289,12 +371,12 @@ async def inline_callback(callback: CallbackQuery, state: FSMContext) -> None:
 
         case 'delete':
             await callback.answer()
-            core.set_value_db("Users", "delete_mode", chat_id, 1)
+            await acore.set_navigation(chat_id, delete_mode=1)
             await send_start_message(level_message_type="callback", callback=callback)
 
         case 'delete_back':
             await callback.answer()
-            core.set_value_db("Users", "delete_mode", chat_id, 0)
+            await acore.set_navigation(chat_id, delete_mode=0)
             await send_start_message(level_message_type="callback", callback=callback)
 
         case 'pagina_back':
@@ -322,25 +404,55 @@ async def inline_callback(callback: CallbackQuery, state: FSMContext) -> None:
                     change_page=1
                 )
 
+        case "send_all":
+            files = await acore.get_folder_files(snapshot.vertex_id)
+            if not files:
+                await callback.answer(text=messages.SEND_ALL_EMPTY_ANSWER)
+            elif not sender.start(chat_id, [(file_id, file_type) for _, file_id, _, file_type in files]):
+                await callback.answer(text=messages.SEND_ALL_BUSY_ANSWER)
+            else:
+                await callback.answer()
+
+        case "send_all_cancel":
+            await callback.answer()
+            if not sender.cancel(chat_id):
+                # Отправка уже закончилась (например, после перезапуска бота)
+                await callback.message.edit_reply_markup(reply_markup=None)
+
+        case "search_view":
+            await callback.answer()
+
+        case _ if call.startswith("search_page:"):
+            query = searches.get(chat_id)
+            if query is None:
+                await callback.answer(text=messages.SEARCH_EXPIRED_ANSWER)
+            else:
+                await send_search_page(chat_id, query, int(call.split(":")[1]), callback=callback)
+
+        case _ if call.startswith("search_open:"):
+            try:
+                path = await acore.get_folder_path(chat_id, int(call.split(":")[1]))
+            except LookupError:
+                await callback.answer(text=messages.SEARCH_NOT_FOUND_ANSWER)
+            else:
+                await callback.answer()
+                await acore.set_navigation(chat_id, path=path, pages=[1] * len(path), delete_mode=0)
+                await send_start_message(level_message_type="callback", callback=callback)
+
         case "back":
             await callback.answer()
-            path = core.get_value_db("Users", "path", chat_id).split("\\")
-            pages = core.get_value_db("Users", "pages", chat_id).split("\\")
             path.pop()
             pages.pop()
-            core.set_value_db("Users", "path", chat_id, "\\".join(path))
-            core.set_value_db("Users", "pages", chat_id, "\\".join(pages))
+            await acore.set_navigation(chat_id, path=path, pages=pages)
             await send_start_message(level_message_type="callback", callback=callback)
 
         case _:
             await callback.answer()
             vertex_type, vertex_id = call.split(":")
             vertex_id = int(vertex_id)
-            delete_mode = core.get_value_db("Users", "delete_mode", chat_id)
-
-            if delete_mode:
+            if snapshot.delete_mode:
                 try:
-                    core.delete(chat_id, call)
+                    await acore.delete(chat_id, call)
                 except Exception:
                     pass
                 finally:
@@ -349,65 +461,89 @@ async def inline_callback(callback: CallbackQuery, state: FSMContext) -> None:
 
             if vertex_type == "F":
                 try:
-                    core.get_value_db("Folders", "id", vertex_id)
+                    await acore.get_value_db("Folders", "id", vertex_id)
                 except Exception:
                     pass
                 else:
-                    path = core.get_value_db("Users", "path", chat_id).split("\\")
-                    pages = core.get_value_db("Users", "pages", chat_id).split("\\")
                     path.append(call)
-                    pages.append("1")
-                    core.set_value_db("Users", "path", chat_id, "\\".join(path))
-                    core.set_value_db("Users", "pages", chat_id, "\\".join(pages))
+                    pages.append(1)
+                    await acore.set_navigation(chat_id, path=path, pages=pages)
                 await send_start_message(level_message_type="callback", callback=callback)
 
             else:
                 try:
-                    file_type = core.get_value_db("Files", "file_type", vertex_id)
-                    file_id = core.get_value_db("Files", "file_id", vertex_id)
+                    file_id, _, file_type = await acore.get_file(vertex_id)
                 except Exception:
                     await send_start_message(level_message_type="callback", callback=callback)
                 else:
-                    match file_type:
-                        case "photo":
-                            await bot.send_photo(chat_id=chat_id, photo=file_id)
-                        case "video":
-                            await bot.send_video(chat_id=chat_id, video=file_id)
-                        case "document":
-                            await bot.send_document(chat_id=chat_id, document=file_id)
-                        case "audio":
-                            await bot.send_audio(chat_id=chat_id, audio=file_id)
-                        case "voice":
-                            await bot.send_voice(chat_id=chat_id, voice=file_id)
-                        case "sticker":
-                            await bot.send_sticker(chat_id=chat_id, sticker=file_id)
-                        case "video_note":
-                            await bot.send_video_note(chat_id=chat_id, video_note=file_id)
-                        case _:
-                            await callback.message.answer(text="Произошла ошибка в отправке файла.")
+                    try:
+                        await send_file(bot, chat_id, file_id, file_type)
+                    except ValueError:
+                        await callback.message.answer(text="Произошла ошибка в отправке файла.")
 
 
-@dp.message(F.text.regexp(config.REGEX), OrderAdd.new_vertices)
-async def regex_link_add_private(message: Message, state: FSMContext) -> None:
-    """Обработка добавления папки по ссылке."""
+async def add_folder_by_link(
+    message: Message,
+    state: FSMContext,
+    new_vertex_type: str,
+    new_vertex_id: int
+) -> None:
+    """Добавляет папку по ссылке в текущую папку пользователя и перерисовывает меню."""
     chat_id = message.chat.id
-    decode = config.decoding_folder(message.text)
-    new_vertex_type, new_vertex_id = decode[0].split(":")
-    new_vertex_id = int(new_vertex_id)
 
     try:
-        core.add_folder(chat_id, new_vertex_type, new_vertex_id)
+        await acore.add_folder(chat_id, new_vertex_type, new_vertex_id)
     except TypeError:
         await message.answer(text=messages.LINK_IS_NOT_VALID_ERROR)
     except KeyError:
         await message.answer(text=messages.DOUBLICATE_FOLDER_ERROR)
+    except ValueError:
+        await message.answer(text=messages.DEPTH_LIMIT_ERROR)
     else:
-        await message.answer(f"Добавлена папка: {decode[-1]}")
+        name = await acore.get_value_db("Folders", "name", new_vertex_id)
+        await message.answer(f"Добавлена папка: {name}")
 
     await state.clear()
     await send_start_message(level_message_type="message", message=message)
 
 
+@dp.message(F.text.regexp(config.SHARE_REGEX), OrderAdd.new_vertices)
+async def share_link_add(message: Message, state: FSMContext) -> None:
+    """Обработка добавления папки по короткой ссылке (токену)."""
+    try:
+        folder_id = await acore.resolve_share_token(config.parse_share_link(message.text))
+    except LookupError:
+        await message.answer(text=messages.LINK_IS_NOT_VALID_ERROR)
+        await state.clear()
+        await send_start_message(level_message_type="message", message=message)
+        return
+
+    await add_folder_by_link(message, state, "F", folder_id)
+
+
+@dp.message(F.text.regexp(config.REGEX), OrderAdd.new_vertices)
+async def regex_link_add_private(message: Message, state: FSMContext) -> None:
+    """Обработка добавления папки по ссылке прежнего формата (с закодированным именем)."""
+    if not config.LEGACY_LINKS_ENABLED:
+        await message.answer(text=messages.LINK_IS_NOT_VALID_ERROR)
+        await state.clear()
+        await send_start_message(level_message_type="message", message=message)
+        return
+
+    decode = config.decoding_folder(message.text)
+    new_vertex_type, new_vertex_id = decode[0].split(":")
+
+    # После /revoke_link прежний формат для папки не действует: его можно
+    # собрать заново по id и имени
+    if new_vertex_type == "F" and await acore.legacy_links_revoked(int(new_vertex_id)):
+        await message.answer(text=messages.LINK_IS_NOT_VALID_ERROR)
+        await state.clear()
+        await send_start_message(level_message_type="message", message=message)
+        return
+
+    await add_folder_by_link(message, state, new_vertex_type, int(new_vertex_id))
+
+
 @dp.message(F.text, OrderAdd.new_vertices)
 async def folder_name_chosen(message: Message, state: FSMContext) -> None:
     """Обработка названия новой папки."""
@@ -433,7 +569,7 @@ async def private_chosen(message: Message, state: FSMContext) -> None:
     if message.text in ['Приватная', 'Публичная']:
         private_mode = 1 if message.text == 'Приватная' else 0
         try:
-            core.create(chat_id, "fold", user_data['folder_name'], private_mode)
+            await acore.create(chat_id, "fold", user_data['folder_name'], private_mode)
         except Exception:
             await message.answer(text=messages.LONG_NAME_ERROR)
         else:
@@ -453,18 +589,17 @@ async def private_chosen(message: Message, state: FSMContext) -> None:
     await send_start_message(level_message_type="message", message=message)
 
 
-@dp.message(OrderAdd.new_vertices)
-async def send_media(message: Message, state: FSMContext) -> None:
-    """Обработка добавления медиафайлов."""
-    user_id = message.chat.id
-    user_data = await state.get_data()
-    cnt = user_data["cnt"]
-
-    if message.text == "Завершить добавление":
-        await state.clear()
-        await send_start_message(level_message_type="message", message=message)
-        return
-
+def get_media(message: Message, cnt: int) -> Optional[list[str]]:
+    """
+    Извлекает файл из сообщения.
+    
+    Args:
+        message: Входящее сообщение
+        cnt: Номер файла (для имени файлов без имени)
+        
+    Returns:
+        [telegram file_id, имя, тип файла] или None, если в сообщении нет медиа
+    """
     media = None
     if message.photo:
         media = [message.photo[2].file_id, f"photo_{cnt}", "photo"]
@@ -480,12 +615,58 @@ async def send_media(message: Message, state: FSMContext) -> None:
         media = [message.sticker.file_id, f"sticker_{cnt}", "sticker"]
     elif message.video_note:
         media = [message.video_note.file_id, f"video_note_{cnt}", "video_note"]
+    return media
+
+
+async def add_album(album: List[Message], numbers: List[int], state: FSMContext) -> None:
+    """Сохраняет альбом одной транзакцией и отвечает один раз."""
+    # Номера частей зарезервированы в send_media, FSM здесь не меняется:
+    # за время окна пользователь мог добавить другие файлы или выйти из режима
+    files, last = [], None
+    for message, number in zip(album, numbers):
+        media = get_media(message, number)
+        if media:
+            files.append(tuple(media))
+            last = number
+
+    if not files:
+        await album[-1].answer(text=messages.INCORRECTLY_MEDIA_ERROR)
+        return
+
+    await acore.create_files(album[0].chat.id, files)
+    await album[-1].answer(text=f"{last} медиа добавлено")
+
+
+# Части альбома копятся и сохраняются вместе
+albums = AlbumCollector(add_album, window=config.ALBUM_WINDOW)
+
+
+@dp.message(OrderAdd.new_vertices)
+async def send_media(message: Message, state: FSMContext) -> None:
+    """Обработка добавления медиафайлов."""
+    user_id = message.chat.id
+
+    if message.text == "Завершить добавление":
+        await state.clear()
+        await send_start_message(level_message_type="message", message=message)
+        return
+
+    user_data = await state.get_data()
+    cnt = user_data["cnt"]
+
+    if message.media_group_id:
+        # Номер резервируется сразу, а не в конце окна альбома
+        await state.update_data(cnt=cnt + 1)
+        albums.add(message, state, cnt)
+        return
+
+    media = get_media(message, cnt)
 
     if not media:
         await message.answer(text=messages.INCORRECTLY_MEDIA_ERROR)
         return
 
-    core.create(user_id, "file", media[1], file_id=media[0], file_type=media[2])
+    await acore.create(user_id, "file", media[1], file_id=media[0], file_type=media[2])
     await state.update_data(cnt=cnt + 1)
     await message.answer(text=f"{cnt} медиа добавлено")
 
@@ -494,12 +675,12 @@ async def send_media(message: Message, state: FSMContext) -> None:
 async def set_head_text(message: Message, state: FSMContext) -> None:
     """Установка заголовочного текста для папки."""
     chat_id = message.chat.id
-    vertex_id = int(core.get_value_db("Users", "path", chat_id).split("\\")[-1].split(":")[-1])
+    vertex_id = (await acore.get_session(chat_id)).folder_id
 
     if message.text == "Очистить текст":
-        core.set_value_db("Folders", "head_text", vertex_id, "")
+        await acore.set_value_db("Folders", "head_text", vertex_id, "")
     else:
-        core.set_value_db("Folders", "head_text", vertex_id, message.text)
+        await acore.set_value_db("Folders", "head_text", vertex_id, message.text)
         await message.answer(text=messages.COMPLETE_HEAD_TEXT)
 
     await state.clear()
@@ -513,9 +694,83 @@ async def other_text(message: Message) -> None:
         await message.answer(text=messages.INCORRECTLY_TEXT_ERROR)
 
 
+def prepare_db() -> None:
+    """Создает таблицы и переносит данные прежнего формата (один раз при запуске)."""
+    if not initializer.create_db(str(core.DB_PATH)):
+        raise RuntimeError("Не удалось подготовить базу данных")
+    for result in data_migrations.run_all(str(core.DB_PATH)):
+        if result.rows:
+            print(f"Перенос {result.name}: строк {result.rows}, проблем {result.issues}")
+
+
+async def receive_updates() -> None:
+    """Получает и обрабатывает обновления в режиме config.BOT_MODE."""
+    if config.BOT_MODE == "webhook":
+        await webhook.run_webhook(bot, dp)
+    else:
+        # Webhook, оставшийся от прошлого запуска, мешает getUpdates
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
+
+
+async def serve(
+    receive: Callable[[], Awaitable[None]],
+    metrics_port: int = config.METRICS_PORT,
+    compaction: bool = True
+) -> None:
+    """
+    Запускает фоновые задачи, получает обновления и корректно все останавливает.
+    
+    Args:
+        receive: Получение обновлений (polling, webhook или очередь воркера)
+        metrics_port: Порт HTTP-сервера метрик (если METRICS_ENABLED)
+        compaction: Запускать ли фоновую очистку базы (если COMPACTION_INTERVAL)
+    """
+    metrics_runner = None
+    if config.METRICS_ENABLED:
+        metrics_runner = await metrics.start_server(config.METRICS_HOST, metrics_port)
+
+    # Навигация пишется в базу пачками, последний сброс - при остановке
+    flusher = asyncio.create_task(acore.flush_sessions_periodically(config.SESSION_FLUSH_INTERVAL))
+    background = [flusher]
+    if isinstance(storage, SQLiteStorage):
+        background.append(asyncio.create_task(storage.flush_periodically()))
+    if compaction and config.COMPACTION_INTERVAL:
+        background.append(asyncio.create_task(compactor.run()))
+    try:
+        await receive()
+    finally:
+        for task in background:
+            task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await albums.close()
+        print(f"Альбомы: {albums.stats()}")
+        await sender.close()
+        print(f"Отправка файлов папок: {sender.stats()}")
+        print(f"Отрисовка меню: {renders.stats()}")
+        print(f"Фоновая очистка: {compactor.stats()}")
+        await cleaner.close()
+        print(f"Очистка чатов: {cleaner.stats()}")
+        print(f"Запросы к Bot API: {scheduler.stats()}")
+        await storage.close()
+        core.flush_sessions()
+        acore.shutdown()
+        core.close_pool()
+        if core.tracer is not None:
+            print(f"Самые дорогие запросы:\n{core.tracer.report()}")
+
+
 async def main() -> None:
     """Основная функция запуска бота."""
-    await dp.start_polling(bot)
+    prepare_db()
+
+    if config.SHARD_WORKERS:
+        # Фронтовый процесс раздает обновления процессам-воркерам
+        await sharding.run_front(bot, dp)
+        return
+
+    await serve(receive_updates)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,100 @@
+import os
+import secrets
+from functools import lru_cache
 from typing import Dict, List
 
-# Регулярное выражение для проверки закодированных строк
+from dotenv import load_dotenv
+
+
+# Загрузка настроек из .env файла
+load_dotenv()
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_PROXY = os.getenv("BOT_PROXY", "")  # Прокси для запросов к Bot API (пусто - без прокси)
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес (пусто - webhook не регистрируется)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")  # Внешний адрес (0.0.0.0) - только с секретом
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Проверяется в X-Telegram-Bot-Api-Secret-Token; при заданном WEBHOOK_URL без
+# секрета генерируется случайный (он же передается в setWebhook при запуске)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or (secrets.token_urlsafe(32) if WEBHOOK_URL else "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))  # Максимум необработанных обновлений
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))  # Параллельно обрабатываемых обновлений
+
+# Шардирование: фронтовый процесс раздает обновления по chat.id воркерам (0 - один процесс)
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+SHARD_INFLIGHT = int(os.getenv("SHARD_INFLIGHT", "64"))  # Обновлений в обработке у одного воркера
+SHARD_HEARTBEAT_TIMEOUT = float(os.getenv("SHARD_HEARTBEAT_TIMEOUT", "30"))  # Воркер без пульса перезапускается
+SHARD_CACHE_TTL = float(os.getenv("SHARD_CACHE_TTL", "2"))  # Кеш воркера не видит чужие изменения (0 - без кеша)
+
+# Настройки базы данных
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # Размер пула соединений
+DB_READERS = int(os.getenv("DB_READERS", "0"))  # Потоков-читателей (0 - по размеру пула)
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))  # Ожидание блокировки другим процессом (с)
+MAX_FOLDER_DEPTH = int(os.getenv("MAX_FOLDER_DEPTH", "100"))  # Максимальная глубина вложенности
+
+# Профиль PRAGMA каждого соединения (database/initializer.py)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")  # WAL - читатели не ждут писателя
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL безопасен в режиме WAL
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # Байт базы в mmap (0 - выкл.)
+DB_PAGE_CACHE_KB = int(os.getenv("DB_PAGE_CACHE_KB", "16384"))  # Кеш страниц соединения
+
+# Трассировка запросов SQLite (database/tracing.py): журнал медленных запросов
+# и сводка самых дорогих запросов при остановке
+DB_TRACE_ENABLED = os.getenv("DB_TRACE_ENABLED", "0") == "1"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "50"))  # Порог медленного запроса
+DB_SLOW_QUERY_LOG = os.getenv("DB_SLOW_QUERY_LOG", "")  # Файл журнала (пусто - консоль)
+
+# Интервал записи навигации пользователей в базу (секунды)
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "5"))
+
+# Хранилище состояний FSM (database/fsm_storage.py): sqlite - в базе бота, memory - в памяти
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))  # Записей в памяти процесса
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))  # Время жизни брошенного состояния (0 - бессрочно)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))  # Период записи изменений
+
+# Ограничение частоты запросов к Bot API (services/scheduler.py)
+# API_GLOBAL_RATE - лимит всего бота: при SHARD_WORKERS=N каждый воркер получает
+# API_GLOBAL_RATE / N (чаты закреплены за воркерами, поэтому лимиты чатов не делятся)
+API_GLOBAL_RATE = float(os.getenv("API_GLOBAL_RATE", "30"))  # Запросов в секунду на бота
+API_WORKER_GLOBAL_RATE = API_GLOBAL_RATE / max(SHARD_WORKERS, 1)  # Доля одного процесса
+API_CHAT_RATE = float(os.getenv("API_CHAT_RATE", "1"))  # Запросов в секунду в личный чат
+API_CHAT_BURST = float(os.getenv("API_CHAT_BURST", "3"))  # Запросов в личный чат подряд
+API_GROUP_RATE = float(os.getenv("API_GROUP_RATE", str(20 / 60)))  # Запросов в секунду в группу
+
+# Сколько секунд ждать следующую часть альбома (services/albums.py)
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "0.5"))
+
+# Метрики Prometheus (services/metrics.py): GET /metrics на METRICS_HOST:METRICS_PORT;
+# воркеры при шардировании слушают METRICS_PORT + 1 + номер воркера
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Одновременных вызовов deleteMessages при очистке чатов
+CLEANUP_CONCURRENCY = int(os.getenv("CLEANUP_CONCURRENCY", "4"))
+
+# Фоновая очистка графа папок (services/compaction.py): висячие ребра, файлы-сироты, мертвые папки
+COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", "1"))  # Пауза между пачками (0 - выключена)
+COMPACTION_BATCH = int(os.getenv("COMPACTION_BATCH", "500"))  # Папок или файлов в пачке
+
+# Кеш папок и файлов (DB_CACHE_ENABLED=0 отключает кеш для отладки)
+DB_CACHE_ENABLED = os.getenv("DB_CACHE_ENABLED", "1") == "1"
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "2048"))  # Максимум записей
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "300"))  # Время жизни записи в секундах
+
+# Ссылки на папки: короткий токен из таблицы ShareTokens ("f_" + 11 символов)
+SHARE_PREFIX = "f_"
+SHARE_REGEX = r"^\s*f_[A-Za-z0-9_-]{11}\s*$"
+SHARE_TOKEN_TTL = int(os.getenv("SHARE_TOKEN_TTL", "0"))  # Время жизни в секундах (0 - бессрочно)
+# Прежние ссылки с закодированным именем принимаются на переходный период
+LEGACY_LINKS_ENABLED = os.getenv("LEGACY_LINKS_ENABLED", "1") == "1"
+
+# Регулярное выражение для проверки закодированных строк (прежний формат ссылок)
 REGEX = r"[A-z0-9@$%&]{4,16}:[A-z0-9@$%&]{58,64}"
 
 # Наборы символов для кодирования/декодирования
@@ -17,32 +111,21 @@ DICT_ALPHABET: Dict[str, int] = {char: idx for idx, char in enumerate(ALPHABET)}
 
 # Константы
 MAX_LEN_NAME = 50  # Максимальная длина имени папки
+LINK_CACHE_SIZE = 4096  # Сколько недавних результатов crypt хранить в памяти
 
 
-def my_pow(value: int, power: int) -> int:
-    """
-    Эффективное возведение в степень через возведение в квадрат (рекурсивная реализация).
-    
-    Args:
-        value: Основание
-        power: Показатель степени
-        
-    Returns:
-        Результат value^power
-    """
-    if power == 0:
-        return 1
-    if power % 2 == 0:
-        return my_pow(value * value, power // 2)
-    else:
-        return value * my_pow(value * value, (power - 1) // 2)
-
-
+@lru_cache(maxsize=LINK_CACHE_SIZE)
 def crypt(string: str, is_encode: bool) -> str:
     """
     Кодирует или декодирует строку с использованием пользовательского алгоритма 
     преобразования между системами счисления.
     
+    Строка читается как число в системе с основанием len(ALPHABET)
+    (или len(SYMBOLS) при декодировании) по схеме Горнера и переводится
+    в другую систему делением с остатком - линейное число операций.
+    Результаты недавних вызовов кешируются (ссылки папок строятся при
+    каждой отрисовке).
+    
     Args:
         string: Входная строка для кодирования/декодирования
         is_encode: True для кодирования, False для декодирования
@@ -50,9 +133,6 @@ def crypt(string: str, is_encode: bool) -> str:
     Returns:
         Закодированная/раскодированная строка
     """
-    length = len(string)
-    number = 0
-    
     # Выбираем соответствующий набор символов в зависимости от операции
     if is_encode:
         char_dict, output_chars, input_base, output_base = (
@@ -62,16 +142,27 @@ def crypt(string: str, is_encode: bool) -> str:
             DICT_SYMBOLS, ALPHABET, len(SYMBOLS), len(ALPHABET))
 
     # Преобразуем строку в числовое представление
-    for i in range(length):
-        number += char_dict[string[i]] * my_pow(input_base, length - i - 1)
-
-    # Конвертируем число в новую систему счисления
-    result = ""
-    while number != 0:
-        result += output_chars[number % output_base]
-        number //= output_base
-    
-    return result[::-1]  # Разворачиваем строку
+    number = 0
+    for char in string:
+        number = number * input_base + char_dict[char]
+
+    # Конвертируем число в новую систему счисления (цифры с младшей)
+    digits = []
+    while number:
+        number, digit = divmod(number, output_base)
+        digits.append(output_chars[digit])
+
+    return "".join(reversed(digits))
+
+
+def share_link(token: str) -> str:
+    """Формирует текст ссылки на папку из токена."""
+    return f"{SHARE_PREFIX}{token}"
+
+
+def parse_share_link(link: str) -> str:
+    """Извлекает токен из текста ссылки (проверенного SHARE_REGEX)."""
+    return link.strip()[len(SHARE_PREFIX):]
 
 
 def encoding_folder(id: str, folder_name: str) -> str:
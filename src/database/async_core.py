@@ -0,0 +1,253 @@
+"""
+Асинхронный API базы данных для обработчиков aiogram.
+
+Функции повторяют database.сore, но выполняются вне event loop:
+чтение - в пуле потоков-читателей, изменения - в единственном
+потоке-писателе (SQLite все равно допускает одного писателя за раз).
+Медленная запись на диск больше не останавливает обработку других чатов.
+
+Синхронный API database.сore остается доступным для скриптов.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, TypeVar
+
+import config
+import database.сore as core
+
+T = TypeVar("T")
+
+_readers: Optional[ThreadPoolExecutor] = None
+_writer: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _executors() -> tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    """Лениво создает пулы потоков для чтения и записи."""
+    global _readers, _writer
+    if _readers is None or _writer is None:
+        with _lock:
+            if _readers is None or _writer is None:
+                # Один поток пула соединений оставляем писателю
+                pool_size = core.get_pool().size
+                default_readers = max(1, pool_size - 1) if pool_size else 4
+                readers = config.DB_READERS or default_readers
+
+                _readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+                _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+    return _readers, _writer
+
+
+async def _run(executor: ThreadPoolExecutor, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет функцию в пуле потоков, сохраняя контекст вызова."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(ctx.run, func, *args, **kwargs)
+    )
+
+
+async def run_read(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет читающую функцию в пуле потоков-читателей."""
+    return await _run(_executors()[0], func, *args, **kwargs)
+
+
+async def run_write(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет изменяющую функцию в потоке-писателе."""
+    return await _run(_executors()[1], func, *args, **kwargs)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Останавливает пулы потоков (например, при остановке бота)."""
+    global _readers, _writer
+    with _lock:
+        for executor in (_readers, _writer):
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        _readers = _writer = None
+
+
+async def is_user_in_table(chat_id: int) -> bool:
+    """Асинхронная версия core.is_user_in_table."""
+    return await run_read(core.is_user_in_table, chat_id)
+
+
+async def get_value_db(table: str, column: str, id: int) -> str | int:
+    """Асинхронная версия core.get_value_db."""
+    return await run_read(core.get_value_db, table, column, id)
+
+
+async def get_full_parameters(folder_id: int) -> Optional[tuple[str, int, int, str, str]]:
+    """Асинхронная версия core.get_full_parameters."""
+    return await run_read(core.get_full_parameters, folder_id)
+
+
+async def get_file(file_id: int) -> tuple[str, str, str]:
+    """Асинхронная версия core.get_file."""
+    return await run_read(core.get_file, file_id)
+
+
+async def get_folder_files(folder_id: int) -> List[tuple[int, str, str, str]]:
+    """Асинхронная версия core.get_folder_files."""
+    return await run_read(core.get_folder_files, folder_id)
+
+
+async def get_share_token(folder_id: int) -> str:
+    """Асинхронная версия core.get_share_token."""
+    # Может создать токен, поэтому идет через писателя
+    return await run_write(core.get_share_token, folder_id)
+
+
+async def resolve_share_token(token: str) -> int:
+    """Асинхронная версия core.resolve_share_token."""
+    return await run_read(core.resolve_share_token, token)
+
+
+async def revoke_share_tokens(folder_id: int) -> int:
+    """Асинхронная версия core.revoke_share_tokens."""
+    return await run_write(core.revoke_share_tokens, folder_id)
+
+
+async def legacy_links_revoked(folder_id: int) -> bool:
+    """Асинхронная версия core.legacy_links_revoked."""
+    return await run_read(core.legacy_links_revoked, folder_id)
+
+
+async def search(chat_id: int, query: str, limit: int = core.PAGE_SIZE, offset: int = 0) -> List[tuple[str, int, str, int]]:
+    """Асинхронная версия core.search."""
+    return await run_read(core.search, chat_id, query, limit, offset)
+
+
+async def get_folder_path(chat_id: int, folder_id: int) -> List[str]:
+    """Асинхронная версия core.get_folder_path."""
+    return await run_read(core.get_folder_path, chat_id, folder_id)
+
+
+async def get_folder_snapshot(
+    chat_id: int,
+    change_page: int = 0,
+    with_children: bool = True
+) -> core.FolderSnapshot:
+    """Асинхронная версия core.get_folder_snapshot."""
+    return await run_read(core.get_folder_snapshot, chat_id, change_page, with_children)
+
+
+async def reset_navigation(chat_id: int) -> None:
+    """Асинхронная версия core.reset_navigation."""
+    await run_write(core.reset_navigation, chat_id)
+
+
+async def set_navigation(
+    chat_id: int,
+    path: Optional[List[str]] = None,
+    pages: Optional[List[int]] = None,
+    delete_mode: Optional[int] = None
+) -> None:
+    """Асинхронная версия core.set_navigation."""
+    # Запись в базу отложена, читаем сессию только при первом обращении
+    await run_read(core.set_navigation, chat_id, path, pages, delete_mode)
+
+
+async def get_session(chat_id: int) -> core.Session:
+    """Асинхронная версия core.get_session."""
+    return await run_read(core.get_session, chat_id)
+
+
+async def track_messages(chat_id: int, message_ids: List[int]) -> None:
+    """Асинхронная версия core.track_messages."""
+    await run_read(core.track_messages, chat_id, message_ids)
+
+
+async def take_messages(chat_id: int, keep: List[int]) -> List[int]:
+    """Асинхронная версия core.take_messages."""
+    return await run_read(core.take_messages, chat_id, keep)
+
+
+async def flush_sessions() -> int:
+    """Асинхронная версия core.flush_sessions."""
+    return await run_write(core.flush_sessions)
+
+
+async def flush_sessions_periodically(interval: float) -> None:
+    """Периодически записывает навигационные сессии в базу (фоновая задача)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_sessions()
+        except Exception as ex:
+            print(f"Ошибка сохранения сессий: {ex}")
+
+
+async def set_value_db(table: str, column: str, id: int, new_value: str | int) -> None:
+    """Асинхронная версия core.set_value_db."""
+    await run_write(core.set_value_db, table, column, id, new_value)
+
+
+def _ensure_user(chat_id: int, chat_type: str, name: str) -> bool:
+    """Создает пользователя, если его еще нет (выполняется в потоке-писателе)."""
+    if core.is_user_in_table(chat_id):
+        return False
+    core.create_user(chat_id, chat_type, name)
+    return True
+
+
+async def ensure_user(chat_id: int, chat_type: str, name: str) -> bool:
+    """
+    Атомарно проверяет наличие пользователя и создает его при необходимости.
+
+    Returns:
+        bool: True если пользователь был создан
+    """
+    return await run_write(_ensure_user, chat_id, chat_type, name)
+
+
+async def create_user(chat_id: int, chat_type: str, name: str) -> int:
+    """Асинхронная версия core.create_user."""
+    return await run_write(core.create_user, chat_id, chat_type, name)
+
+
+async def create(
+    chat_id: int,
+    lvl: str,
+    name: str,
+    private_mode: Optional[int] = None,
+    file_id: Optional[str] = None,
+    file_type: Optional[str] = None
+) -> int:
+    """Асинхронная версия core.create."""
+    return await run_write(core.create, chat_id, lvl, name, private_mode, file_id, file_type)
+
+
+async def create_files(chat_id: int, files: List[tuple[str, str, str]]) -> List[int]:
+    """Асинхронная версия core.create_files."""
+    return await run_write(core.create_files, chat_id, files)
+
+
+async def add_folder(chat_id: int, new_vertex_type: str, new_vertex_id: int) -> None:
+    """Асинхронная версия core.add_folder."""
+    await run_write(core.add_folder, chat_id, new_vertex_type, new_vertex_id)
+
+
+async def delete(chat_id: int, vertex: str) -> None:
+    """Асинхронная версия core.delete."""
+    await run_write(core.delete, chat_id, vertex)
+
+
+async def collect_dangling_edges(after_id: int, limit: int) -> tuple[Optional[int], int]:
+    """Асинхронная версия core.collect_dangling_edges."""
+    return await run_write(core.collect_dangling_edges, after_id, limit)
+
+
+async def collect_orphan_files(after_id: int, limit: int) -> tuple[Optional[int], int]:
+    """Асинхронная версия core.collect_orphan_files."""
+    return await run_write(core.collect_orphan_files, after_id, limit)
+
+
+async def collect_dead_folders(after_id: int, limit: int) -> tuple[Optional[int], int]:
+    """Асинхронная версия core.collect_dead_folders."""
+    return await run_write(core.collect_dead_folders, after_id, limit)
@@ -0,0 +1,176 @@
+"""
+Ограниченный LRU-кеш с временем жизни записей.
+
+Используется модулем database.сore для строк папок, страниц дочерних
+элементов и метаданных файлов. Все изменяющие функции ядра сами
+сбрасывают затронутые записи (write-through инвалидация).
+
+Читатель может загрузить строки из базы до изменения, а положить их в кеш
+уже после сброса - тогда в кеше остались бы старые данные. Поэтому каждый
+сброс увеличивает поколение ключа: читатель берет generation() до запроса
+к базе и передает его в set(), а set() пропускает запись, если поколение
+за это время изменилось.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Поколение ключа: (ключ, эпоха кеша, номер сброса ключа)
+Generation = Tuple[Hashable, int, int]
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кеш со счетчиками попаданий, промахов и вытеснений."""
+
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: Optional[float] = None,
+        enabled: bool = True
+    ) -> None:
+        """
+        Args:
+            maxsize: Максимальное количество записей
+            ttl: Время жизни записи в секундах (None - без ограничения)
+            enabled: Выключенный кеш ничего не хранит (удобно для отладки)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Номера сбросов ключей; эпоха меняется, когда сбрасываются все поколения
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Получает значение из кеша.
+
+        Returns:
+            Кортеж (найдено ли значение, значение)
+        """
+        if not self.enabled:
+            return False, None
+
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return False, None
+
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return False, None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def generation(self, key: Hashable) -> Generation:
+        """
+        Запоминает текущее поколение ключа (берется до чтения из базы).
+        
+        Args:
+            key: Ключ, сброс которого делает загруженные данные устаревшими
+            
+        Returns:
+            Поколение для передачи в set()
+        """
+        with self._lock:
+            return key, self._epoch, self._generations.get(key, 0)
+
+    def set(self, key: Hashable, value: Any, generation: Optional[Generation] = None) -> None:
+        """
+        Сохраняет значение, вытесняя самые давние записи при переполнении.
+        
+        Args:
+            key: Ключ записи
+            value: Значение
+            generation: Поколение из generation(), взятое до загрузки значения;
+                если с тех пор ключ сбрасывался, значение не сохраняется
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if generation is not None:
+                guard, epoch, number = generation
+                if epoch != self._epoch or self._generations.get(guard, 0) != number:
+                    self.stale += 1
+                    return
+
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Возвращает значение из кеша или загружает и сохраняет его."""
+        found, value = self.get(key)
+        if not found:
+            generation = self.generation(key)
+            value = loader()
+            self.set(key, value, generation)
+        return value
+
+    def _new_epoch(self) -> None:
+        """Делает устаревшими все выданные поколения."""
+        self._epoch += 1
+        self._generations.clear()
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Удаляет записи с указанными ключами и увеличивает их поколения."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+            # Счетчики ключей не должны расти без ограничения
+            if len(self._generations) > self.maxsize:
+                self._new_epoch()
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool], new_epoch: bool = True) -> None:
+        """
+        Удаляет все записи, ключи которых удовлетворяют условию.
+        
+        Args:
+            predicate: Условие на ключ
+            new_epoch: Сбросить поколения всех ключей (ключи, которых сейчас
+                нет в кеше, условием не перебрать). False - если загрузка таких
+                записей защищена поколением другого ключа
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+            if new_epoch:
+                self._new_epoch()
+
+    def clear(self) -> None:
+        """Очищает кеш."""
+        with self._lock:
+            self._data.clear()
+            self._new_epoch()
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счетчики кеша."""
+        return {
+            "enabled": int(self.enabled),
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+        }
@@ -0,0 +1,351 @@
+"""
+Потоковый перенос данных из строковых столбцов прежнего формата.
+
+Схему меняют миграции database.initializer, а данные в больших базах
+переносятся здесь: строки читаются пачками по ключу (keyset: key > последний
+обработанный, без OFFSET), каждая строка проверяется, а результат пачки и
+контрольная точка (таблица DataMigrations) записываются одной короткой
+транзакцией. Прерванный перенос продолжается с последней точки, память не
+зависит от размера базы (в памяти одна пачка), найденные проблемы пишутся
+в таблицу DataMigrationIssues.
+
+Переносы:
+    next_vertices - Folders.next_vertices ("F:12;D:34") в таблицу Edges;
+        ссылки на несуществующие папки и файлы не переносятся (раньше их
+        убирал send_start_message при отрисовке страницы);
+    navigation - проверка Users.path ("U:1\\F:5") и Users.pages ("1\\2"):
+        путь обрезается перед первой поврежденной или удаленной папкой,
+        стек страниц выравнивается по длине пути.
+
+Онлайн (бот работает): между пачками делается пауза --pause, а писатель
+ждет блокировку не дольше DB_BUSY_TIMEOUT. Офлайн - без пауз.
+
+Запуск из каталога src:
+    python -m database.data_migrations              # все переносы
+    python -m database.data_migrations --status     # состояние и проблемы
+    python -m database.data_migrations --only navigation --restart
+"""
+
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import config
+import database.initializer as initializer
+
+# Проблема строки: (ключ строки, описание)
+Issue = Tuple[int, str]
+# Обработчик пачки: получает курсор в открытой транзакции и строки пачки,
+# записывает результат и возвращает найденные проблемы
+ChunkProcessor = Callable[[sqlite3.Cursor, List[tuple]], List[Issue]]
+
+
+@dataclass
+class DataMigration:
+    """Описание переноса: какие строки читать и как их обработать."""
+    name: str
+    table: str
+    key: str
+    columns: str
+    where: str
+    process: ChunkProcessor
+
+
+@dataclass
+class MigrationResult:
+    """Итог одного запуска переноса."""
+    name: str
+    rows: int = 0
+    chunks: int = 0
+    issues: int = 0
+    finished: bool = False
+
+
+def _parse_vertex(vertex: str, allowed: str) -> Optional[Tuple[str, int]]:
+    """Разбирает "T:id"; None если формат неверный или тип не из allowed."""
+    type_, sep, id_ = vertex.partition(":")
+    if not sep or type_ not in allowed or not id_.lstrip("-").isdigit():
+        return None
+    return type_, int(id_)
+
+
+def _process_next_vertices(cur: sqlite3.Cursor, rows: List[tuple]) -> List[Issue]:
+    """Переносит дочерние элементы пачки папок в Edges."""
+    issues: List[Issue] = []
+    edges = []
+    for folder_id, next_vertices in rows:
+        children = next_vertices.split(";")
+        # Старые элементы получают позиции <= 0 и остаются перед добавленными позже
+        for position, child in enumerate(children, start=1 - len(children)):
+            vertex = _parse_vertex(child, "FD")
+            if vertex is None:
+                issues.append((folder_id, f"неверный элемент {child!r}"))
+                continue
+            edges.append((folder_id, *vertex, position))
+
+    cur.executemany(
+        "INSERT OR IGNORE INTO Edges (parent_id, child_type, child_id, position) "
+        "VALUES (?, ?, ?, ?)",
+        edges
+    )
+
+    # Ссылки на удаленные папки и файлы - одним запросом по диапазону пачки
+    first, last = rows[0][0], rows[-1][0]
+    cur.execute(
+        "SELECT e.parent_id, e.position, e.child_type, e.child_id FROM Edges e "
+        "LEFT JOIN Folders f ON e.child_type = 'F' AND f.id = e.child_id "
+        "LEFT JOIN Files d ON e.child_type = 'D' AND d.id = e.child_id "
+        "WHERE e.parent_id BETWEEN ? AND ? AND e.position <= 0 "
+        "AND f.id IS NULL AND d.id IS NULL",
+        (first, last)
+    )
+    # В диапазон попадают и папки, перенесенные раньше, - их не трогаем
+    chunk_ids = {folder_id for folder_id, _ in rows}
+    dangling = [row for row in cur.fetchall() if row[0] in chunk_ids]
+    cur.executemany(
+        "DELETE FROM Edges WHERE parent_id = ? AND position = ?",
+        [(parent_id, position) for parent_id, position, _, _ in dangling]
+    )
+    issues += [
+        (parent_id, f"ссылка на удаленный элемент {type_}:{id_}")
+        for parent_id, _, type_, id_ in dangling
+    ]
+
+    cur.executemany(
+        "UPDATE Folders SET next_vertices = '' WHERE id = ?",
+        [(folder_id,) for folder_id, _ in rows]
+    )
+    return issues
+
+
+def _process_navigation(cur: sqlite3.Cursor, rows: List[tuple]) -> List[Issue]:
+    """Проверяет и исправляет пути и стеки страниц пачки пользователей."""
+    issues: List[Issue] = []
+    parsed = []
+    folder_ids = set()
+    for chat_id, path, pages in rows:
+        vertices = [_parse_vertex(vertex, "UF") for vertex in path.split("\\")]
+        parsed.append((chat_id, path, pages, vertices))
+        folder_ids.update(vertex[1] for vertex in vertices if vertex is not None)
+
+    # Существующие папки пачки - одним запросом (id не больше, чем элементов путей пачки)
+    existing = set()
+    ids = list(folder_ids)
+    for start in range(0, len(ids), 500):
+        part = ids[start:start + 500]
+        cur.execute(
+            f"SELECT id FROM Folders WHERE id IN ({', '.join('?' * len(part))})",
+            part
+        )
+        existing.update(id_ for id_, in cur.fetchall())
+
+    updates = []
+    for chat_id, path, pages, vertices in parsed:
+        if not vertices or vertices[0] is None or vertices[0][0] != "U" or vertices[0][1] not in existing:
+            issues.append((chat_id, f"нет корневой папки в пути {path!r}"))
+            continue
+
+        # Путь до первой поврежденной или удаленной папки
+        valid = 1
+        while (
+            valid < len(vertices)
+            and vertices[valid] is not None
+            and vertices[valid][0] == "F"
+            and vertices[valid][1] in existing
+        ):
+            valid += 1
+        if valid < len(vertices):
+            issues.append((chat_id, f"путь обрезан до {valid} элементов: {path!r}"))
+
+        page_list = [int(page) if page.isdigit() and int(page) > 0 else 1 for page in pages.split("\\")]
+        page_list = (page_list + [1] * valid)[:valid]
+        new_path = "\\".join(f"{type_}:{id_}" for type_, id_ in vertices[:valid])
+        new_pages = "\\".join(map(str, page_list))
+        if (new_path, new_pages) != (path, pages):
+            updates.append((new_path, new_pages, chat_id))
+
+    cur.executemany("UPDATE Users SET path = ?, pages = ? WHERE chat_id = ?", updates)
+    return issues
+
+
+MIGRATIONS: List[DataMigration] = [
+    DataMigration(
+        name="next_vertices",
+        table="Folders",
+        key="id",
+        columns="next_vertices",
+        where="next_vertices != ''",
+        process=_process_next_vertices
+    ),
+    DataMigration(
+        name="navigation",
+        table="Users",
+        key="chat_id",
+        columns="path, pages",
+        where="1",
+        process=_process_navigation
+    ),
+]
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """Соединение в режиме autocommit с профилем PRAGMA бота."""
+    con = sqlite3.connect(db_path, timeout=config.DB_BUSY_TIMEOUT, isolation_level=None)
+    initializer.apply_pragmas(con, initializer.PRAGMA_PROFILE)
+    return con
+
+
+def run_migration(
+    db_path: str,
+    migration: DataMigration,
+    chunk_size: int = 500,
+    pause: float = 0.0,
+    max_chunks: Optional[int] = None,
+    restart: bool = False
+) -> MigrationResult:
+    """
+    Выполняет (или продолжает) перенос пачками.
+
+    Args:
+        db_path: Путь к файлу базы данных
+        migration: Описание переноса
+        chunk_size: Строк в одной транзакции
+        pause: Пауза между пачками в секундах (онлайн-режим)
+        max_chunks: Остановиться после стольких пачек (None - до конца)
+        restart: Начать сначала, забыв контрольную точку и проблемы
+
+    Returns:
+        MigrationResult: Итог запуска
+    """
+    result = MigrationResult(migration.name)
+    con = _connect(db_path)
+    try:
+        cur = con.cursor()
+        if restart:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("DELETE FROM DataMigrations WHERE name = ?", (migration.name,))
+            cur.execute("DELETE FROM DataMigrationIssues WHERE name = ?", (migration.name,))
+            cur.execute("COMMIT")
+
+        cur.execute(
+            "SELECT last_key, finished FROM DataMigrations WHERE name = ?",
+            (migration.name,)
+        )
+        checkpoint = cur.fetchone()
+        if checkpoint is not None and checkpoint[1]:
+            result.finished = True
+            return result
+        last_key = checkpoint[0] if checkpoint is not None else None
+
+        while max_chunks is None or result.chunks < max_chunks:
+            # Пачка читается и записывается в одной транзакции вместе с контрольной точкой
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    f"SELECT {migration.key}, {migration.columns} FROM {migration.table} "
+                    f"WHERE (? IS NULL OR {migration.key} > ?) AND ({migration.where}) "
+                    f"ORDER BY {migration.key} LIMIT ?",
+                    (last_key, last_key, chunk_size)
+                )
+                rows = cur.fetchall()
+                issues = migration.process(cur, rows) if rows else []
+                if rows:
+                    last_key = rows[-1][0]
+                cur.executemany(
+                    "INSERT INTO DataMigrationIssues (name, row_key, problem) VALUES (?, ?, ?)",
+                    [(migration.name, key, problem) for key, problem in issues]
+                )
+                cur.execute(
+                    "INSERT INTO DataMigrations (name, last_key, rows, issues, finished, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET last_key = excluded.last_key, "
+                    "rows = rows + excluded.rows, issues = issues + excluded.issues, "
+                    "finished = excluded.finished, updated_at = excluded.updated_at",
+                    (migration.name, last_key, len(rows), len(issues), int(not rows), int(time.time()))
+                )
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+            if not rows:
+                result.finished = True
+                break
+            result.rows += len(rows)
+            result.issues += len(issues)
+            result.chunks += 1
+            if pause:
+                time.sleep(pause)
+    finally:
+        con.close()
+
+    return result
+
+
+def run_all(db_path: str, **options) -> List[MigrationResult]:
+    """Выполняет все незавершенные переносы по порядку (см. run_migration)."""
+    return [run_migration(db_path, migration, **options) for migration in MIGRATIONS]
+
+
+def status(db_path: str, issues_limit: int = 20) -> Dict[str, object]:
+    """Контрольные точки переносов и последние найденные проблемы."""
+    con = _connect(db_path)
+    try:
+        cur = con.cursor()
+        cur.execute("SELECT name, last_key, rows, issues, finished, updated_at FROM DataMigrations")
+        checkpoints = [
+            dict(zip(("name", "last_key", "rows", "issues", "finished", "updated_at"), row))
+            for row in cur.fetchall()
+        ]
+        cur.execute(
+            "SELECT name, row_key, problem FROM DataMigrationIssues ORDER BY id DESC LIMIT ?",
+            (issues_limit,)
+        )
+        issues = [dict(zip(("name", "row_key", "problem"), row)) for row in cur.fetchall()]
+    finally:
+        con.close()
+    return {"checkpoints": checkpoints, "issues": issues}
+
+
+def main() -> None:
+    from database.сore import DB_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--only", choices=[migration.name for migration in MIGRATIONS])
+    parser.add_argument("--chunk", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между пачками (онлайн)")
+    parser.add_argument("--max-chunks", type=int)
+    parser.add_argument("--restart", action="store_true", help="Начать сначала")
+    parser.add_argument("--status", action="store_true", help="Показать состояние")
+    args = parser.parse_args()
+
+    if not initializer.create_db(args.db):
+        raise SystemExit(1)
+
+    if args.status:
+        for key, rows in status(args.db).items():
+            print(f"{key}:")
+            for row in rows:
+                print(f"  {row}")
+        return
+
+    for migration in MIGRATIONS:
+        if args.only and migration.name != args.only:
+            continue
+        start = time.perf_counter()
+        result = run_migration(
+            args.db,
+            migration,
+            chunk_size=args.chunk,
+            pause=args.pause,
+            max_chunks=args.max_chunks,
+            restart=args.restart
+        )
+        print(f"{result} за {time.perf_counter() - start:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Хранилище состояний FSM aiogram в базе бота.
+
+MemoryStorage по умолчанию теряет состояния OrderAdd и данные
+(state.update_data) при перезапуске и не разделяется между процессами.
+SQLiteStorage хранит их в таблице FsmStates:
+- горячий уровень - LRU в памяти процесса (не больше maxsize сохраненных
+  записей), обращения к нему не ходят в базу;
+- изменения копятся в памяти и записываются пачкой раз в flush_interval
+  секунд одной транзакцией (и при остановке);
+- записи, не менявшиеся дольше ttl секунд (брошенные диалоги), считаются
+  пустыми и удаляются из базы фоновой очисткой;
+- при запуске ничего не загружается: запись читается при первом обращении.
+
+Обновления одного чата обрабатывает один процесс (sharding), поэтому
+горячий уровень процесса не расходится с базой.
+
+Данные FSM сериализуются в JSON - в state.update_data можно класть только
+строки, числа, списки и словари.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import AbstractContextManager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import database.async_core as acore
+
+
+class _Record:
+    """Состояние и данные одного ключа FSM."""
+
+    __slots__ = ("state", "data", "updated", "dirty")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated: float) -> None:
+        self.state = state
+        self.data = data
+        self.updated = updated
+        self.dirty = False
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице FsmStates с LRU-кешем и отложенной записью."""
+
+    def __init__(
+        self,
+        connection: Callable[[], AbstractContextManager[sqlite3.Connection]],
+        maxsize: int = 10000,
+        ttl: float = 86400.0,
+        flush_interval: float = 1.0,
+        key_builder: Optional[KeyBuilder] = None
+    ) -> None:
+        """
+        Args:
+            connection: Фабрика соединений с транзакцией (например, pool.connection)
+            maxsize: Сколько сохраненных записей держать в памяти
+            ttl: Через сколько секунд без изменений состояние забывается (0 - никогда)
+            flush_interval: Период записи изменений в базу в секундах
+            key_builder: Построение строкового ключа из StorageKey
+        """
+        self._connection = connection
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._records: "OrderedDict[str, _Record]" = OrderedDict()
+
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.expired = 0
+
+    def _is_expired(self, record: _Record, now: float) -> bool:
+        return bool(self.ttl) and now - record.updated > self.ttl
+
+    def _load(self, key: str) -> Optional[Tuple[Optional[str], str, float]]:
+        """Читает запись из базы (выполняется в потоке-читателе)."""
+        with self._connection() as con:
+            return con.execute(
+                "SELECT state, data, updated_at FROM FsmStates WHERE key = ?", (key,)
+            ).fetchone()
+
+    async def _get(self, key: StorageKey) -> Tuple[str, _Record]:
+        """Возвращает запись ключа, загружая ее из базы при первом обращении."""
+        name = self.key_builder.build(key)
+        now = time.time()
+        record = self._records.get(name)
+        if record is None:
+            row = await acore.run_read(self._load, name)
+            self.loads += 1
+            # Запись могли создать, пока шло чтение - оставляем ее
+            record = self._records.get(name)
+            if record is None:
+                if row is None:
+                    record = _Record(None, {}, now)
+                else:
+                    record = _Record(row[0], json.loads(row[1]), row[2])
+                self._records[name] = record
+
+        if self._is_expired(record, now):
+            # Брошенный диалог: начинаем с чистого состояния
+            record.state, record.data, record.updated = None, {}, now
+            record.dirty = True
+            self.expired += 1
+
+        self._records.move_to_end(name)
+        return name, record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, record = await self._get(key)
+        state = state.state if isinstance(state, State) else state
+        # state.clear() на каждое нажатие не должен порождать запись в базу
+        if state == record.state:
+            return
+        record.state = state
+        record.updated = time.time()
+        record.dirty = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Данные FSM должны быть словарем, а не {type(data).__name__}")
+        _, record = await self._get(key)
+        if data == record.data:
+            return
+        record.data = data.copy()
+        record.updated = time.time()
+        record.dirty = True
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._get(key)
+        return record.data.copy()
+
+    def _write(self, upserts: List[tuple], deletes: List[tuple], expire_before: Optional[float]) -> int:
+        """Записывает пачку изменений и удаляет устаревшие записи (поток-писатель)."""
+        with self._connection() as con:
+            con.executemany(
+                "INSERT INTO FsmStates (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                upserts
+            )
+            con.executemany("DELETE FROM FsmStates WHERE key = ?", deletes)
+            if expire_before is None:
+                return 0
+            return con.execute(
+                "DELETE FROM FsmStates WHERE updated_at < ?", (expire_before,)
+            ).rowcount
+
+    async def flush(self, expire: bool = False) -> int:
+        """
+        Записывает измененные записи в базу одной транзакцией.
+
+        Args:
+            expire: Заодно удалить из базы и памяти записи старше ttl
+
+        Returns:
+            int: Количество записанных (или удаленных) ключей
+        """
+        now = time.time()
+        dirty = [(name, record) for name, record in self._records.items() if record.dirty]
+        upserts, deletes = [], []
+        for name, record in dirty:
+            if record.state is None and not record.data:
+                # Пустое состояние (state.clear()) в базе не храним
+                deletes.append((name,))
+            else:
+                upserts.append((name, record.state, json.dumps(record.data, ensure_ascii=False), record.updated))
+            record.dirty = False
+
+        expire_before = now - self.ttl if expire and self.ttl else None
+        if not dirty and expire_before is None:
+            # Чтения тоже добавляют записи - выгружаем лишние и без изменений
+            self._trim()
+            return 0
+
+        try:
+            await acore.run_write(self._write, upserts, deletes, expire_before)
+        except Exception:
+            # Изменения не потеряны - запишем при следующем сбросе
+            for _, record in dirty:
+                record.dirty = True
+            raise
+
+        if dirty:
+            self.flushes += 1
+            self.flushed_rows += len(dirty)
+        if expire_before is not None:
+            for name in [name for name, record in self._records.items()
+                         if not record.dirty and self._is_expired(record, now)]:
+                del self._records[name]
+        self._trim()
+        return len(dirty)
+
+    async def flush_periodically(self) -> None:
+        """Периодически записывает изменения и очищает устаревшие записи (фоновая задача)."""
+        last_expire = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # Устаревшие записи достаточно удалять раз в несколько минут
+            expire = time.monotonic() - last_expire > min(self.ttl, 300) if self.ttl else False
+            try:
+                await self.flush(expire=expire)
+            except Exception as ex:
+                print(f"Ошибка сохранения состояний FSM: {ex}")
+            else:
+                if expire:
+                    last_expire = time.monotonic()
+
+    def _trim(self) -> None:
+        """Выгружает самые давние сохраненные записи сверх maxsize."""
+        extra = len(self._records) - self.maxsize
+        if extra <= 0:
+            return
+        victims = []
+        for name, record in self._records.items():
+            if len(victims) >= extra:
+                break
+            if not record.dirty:
+                victims.append(name)
+        for name in victims:
+            del self._records[name]
+
+    async def close(self) -> None:
+        """Записывает несохраненные изменения (aiogram вызывает при остановке)."""
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики хранилища."""
+        return {
+            "records": len(self._records),
+            "dirty": sum(record.dirty for record in self._records.values()),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "expired": self.expired,
+        }
@@ -1,76 +1,324 @@
+"""
+Создание и обновление схемы базы данных.
+
+Схема описывается упорядоченным списком миграций MIGRATIONS. Номер
+последней примененной миграции хранится в PRAGMA user_version; при запуске
+create_db применяет недостающие миграции по порядку, каждую в своей
+транзакции вместе с новым user_version. Миграции идемпотентны (IF NOT
+EXISTS), поэтому базы, созданные до появления версий (user_version = 0),
+обновляются без ошибок.
+
+Чтобы изменить схему, добавьте в конец MIGRATIONS новую функцию -
+существующие миграции не меняются.
+
+Там же - профиль PRAGMA (PRAGMA_PROFILE), который пул соединений
+применяет к каждому новому соединению: WAL (читатели не ждут писателя),
+synchronous, mmap_size, cache_size, busy_timeout.
+"""
+
 import sqlite3
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import config
+
+# Профиль PRAGMA для каждого соединения (значения из config)
+PRAGMA_PROFILE: Dict[str, Any] = {
+    "journal_mode": config.DB_JOURNAL_MODE,
+    "synchronous": config.DB_SYNCHRONOUS,
+    "mmap_size": config.DB_MMAP_SIZE,
+    "cache_size": -config.DB_PAGE_CACHE_KB,  # Отрицательное значение - в КиБ
+    "busy_timeout": int(config.DB_BUSY_TIMEOUT * 1000),
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(con: sqlite3.Connection, profile: Dict[str, Any]) -> None:
+    """
+    Применяет профиль PRAGMA к соединению.
+    
+    Args:
+        con: Соединение (вне транзакции - journal_mode в транзакции не меняется)
+        profile: Имена и значения PRAGMA
+    """
+    for name, value in profile.items():
+        con.execute(f"PRAGMA {name} = {value}").fetchall()
+
+
+def effective_pragmas(con: sqlite3.Connection, names: List[str]) -> Dict[str, Any]:
+    """Фактические значения PRAGMA (SQLite может не принять запрошенное)."""
+    return {name: con.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
+
+
+def _create_base_tables(cur: sqlite3.Cursor) -> None:
+    """Пользователи, папки и файлы."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Users (
+            chat_id INTEGER PRIMARY KEY,
+            messages_id TEXT NOT NULL DEFAULT "",
+            pages TEXT NOT NULL DEFAULT "1",
+            delete_mode INTEGER NOT NULL DEFAULT 0,
+            path TEXT NOT NULL DEFAULT ""
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Folders (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT "None",
+            autor_id INTEGER,
+            private_mode INTEGER NOT NULL,
+            count_of_users INTEGER NOT NULL DEFAULT 1,
+            next_vertices TEXT NOT NULL DEFAULT "",
+            head_text TEXT NOT NULL DEFAULT ""
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Files (
+            id INTEGER PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            file_type TEXT NOT NULL
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_folders_autor_id 
+        ON Folders(autor_id)
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_path 
+        ON Users(path)
+    """)
+
+
+def _create_edges(cur: sqlite3.Cursor) -> None:
+    """Ребра графа папок вместо строки Folders.next_vertices."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Edges (
+            parent_id INTEGER NOT NULL,
+            child_type TEXT NOT NULL,
+            child_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (parent_id, position)
+        ) WITHOUT ROWID
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_edges_child 
+        ON Edges(child_type, child_id)
+    """)
+
+
+def _create_share_tokens(cur: sqlite3.Cursor) -> None:
+    """Короткие ссылки на папки."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ShareTokens (
+            token TEXT PRIMARY KEY,
+            folder_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER,
+            revoked INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_share_tokens_folder 
+        ON ShareTokens(folder_id)
+    """)
+
+
+def _create_data_migrations(cur: sqlite3.Cursor) -> None:
+    """Контрольные точки и найденные проблемы переноса данных (database.data_migrations)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS DataMigrations (
+            name TEXT PRIMARY KEY,
+            last_key INTEGER,
+            rows INTEGER NOT NULL DEFAULT 0,
+            issues INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS DataMigrationIssues (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            row_key INTEGER NOT NULL,
+            problem TEXT NOT NULL
+        )
+    """)
+
+
+def _create_search_index(cur: sqlite3.Cursor) -> None:
+    """
+    Полнотекстовый индекс FTS5 по именам и текстам папок и именам файлов.
+
+    rowid индекса: 2 * id для папки и 2 * id + 1 для файла. Индекс
+    обновляется триггерами, поэтому любое изменение Folders и Files
+    (в том числе через set_value_db) сразу видно в поиске.
+    """
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS SearchIndex USING fts5(
+            name,
+            head_text,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+
+    triggers = {
+        "trg_folders_search_insert": """
+            AFTER INSERT ON Folders BEGIN
+                INSERT INTO SearchIndex (rowid, name, head_text)
+                VALUES (2 * new.id, new.name, new.head_text);
+            END
+        """,
+        "trg_folders_search_update": """
+            AFTER UPDATE OF name, head_text ON Folders BEGIN
+                UPDATE SearchIndex SET name = new.name, head_text = new.head_text
+                WHERE rowid = 2 * old.id;
+            END
+        """,
+        "trg_folders_search_delete": """
+            AFTER DELETE ON Folders BEGIN
+                DELETE FROM SearchIndex WHERE rowid = 2 * old.id;
+            END
+        """,
+        "trg_files_search_insert": """
+            AFTER INSERT ON Files BEGIN
+                INSERT INTO SearchIndex (rowid, name, head_text)
+                VALUES (2 * new.id + 1, new.name, '');
+            END
+        """,
+        "trg_files_search_update": """
+            AFTER UPDATE OF name ON Files BEGIN
+                UPDATE SearchIndex SET name = new.name WHERE rowid = 2 * old.id + 1;
+            END
+        """,
+        "trg_files_search_delete": """
+            AFTER DELETE ON Files BEGIN
+                DELETE FROM SearchIndex WHERE rowid = 2 * old.id + 1;
+            END
+        """,
+    }
+    for name, body in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    # Индекс только что создан - заполняем его существующими папками и файлами
+    cur.execute("""
+        INSERT INTO SearchIndex (rowid, name, head_text)
+        SELECT 2 * id, name, head_text FROM Folders
+    """)
+    cur.execute("""
+        INSERT INTO SearchIndex (rowid, name, head_text)
+        SELECT 2 * id + 1, name, '' FROM Files
+    """)
+
+
+def _create_fsm_states(cur: sqlite3.Cursor) -> None:
+    """Состояния FSM aiogram (database.fsm_storage)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS FsmStates (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated 
+        ON FsmStates(updated_at)
+    """)
+
+
+# Миграции по порядку: (версия, описание, функция). Версии идут подряд с 1
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "Таблицы Users, Folders, Files", _create_base_tables),
+    (2, "Таблица Edges", _create_edges),
+    (3, "Таблица ShareTokens", _create_share_tokens),
+    (4, "Таблицы DataMigrations, DataMigrationIssues", _create_data_migrations),
+    (5, "Полнотекстовый индекс SearchIndex", _create_search_index),
+    (6, "Таблица FsmStates", _create_fsm_states),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(con: sqlite3.Connection) -> List[int]:
+    """
+    Применяет недостающие миграции.
+    
+    Каждая миграция выполняется в транзакции BEGIN IMMEDIATE вместе с
+    обновлением user_version: версия перечитывается под блокировкой, так что
+    несколько одновременно запущенных процессов не применят миграцию дважды.
+    
+    Args:
+        con: Соединение в режиме autocommit (isolation_level=None)
+        
+    Returns:
+        List[int]: Номера примененных миграций
+        
+    Raises:
+        ValueError: Если база новее кода (user_version больше SCHEMA_VERSION)
+    """
+    applied = []
+    for version, description, func in MIGRATIONS:
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            current = cur.execute("PRAGMA user_version").fetchone()[0]
+            if current > SCHEMA_VERSION:
+                raise ValueError(
+                    f"Версия схемы базы {current} новее поддерживаемой {SCHEMA_VERSION}"
+                )
+            if current >= version:
+                cur.execute("COMMIT")
+                continue
+
+            func(cur)
+            cur.execute(f"PRAGMA user_version = {version}")
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+
+        applied.append(version)
+        print(f"Применена миграция {version}: {description}")
+    return applied
 
 
 def create_db(db_path: str = 'database.db') -> bool:
     """
-    Создает базу данных SQLite с необходимыми таблицами.
+    Создает базу данных SQLite или обновляет ее схему до SCHEMA_VERSION.
     
     Args:
         db_path: Путь к файлу базы данных (по умолчанию 'database.db')
         
     Returns:
         bool: True если создание прошло успешно, иначе False
-        
-    Raises:
-        sqlite3.Error: В случае ошибок работы с базой данных
     """
     try:
         # Создаем директорию для базы данных, если её нет
         db_file = Path(db_path)
         db_file.parent.mkdir(parents=True, exist_ok=True)
 
-        with sqlite3.connect(db_path) as con:
-            cur = con.cursor()
-            
-            # Создание таблицы Users
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS Users (
-                    chat_id INTEGER PRIMARY KEY,
-                    messages_id TEXT NOT NULL DEFAULT "",
-                    pages TEXT NOT NULL DEFAULT "1",
-                    delete_mode INTEGER NOT NULL DEFAULT 0,
-                    path TEXT NOT NULL DEFAULT ""
-                )
-            """)
-            
-            # Создание таблицы Folders
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS Folders (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL DEFAULT "None",
-                    autor_id INTEGER,
-                    private_mode INTEGER NOT NULL,
-                    count_of_users INTEGER NOT NULL DEFAULT 1,
-                    next_vertices TEXT NOT NULL DEFAULT "",
-                    head_text TEXT NOT NULL DEFAULT ""
-                )
-            """)
-            
-            # Создание таблицы Files
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS Files (
-                    id INTEGER PRIMARY KEY,
-                    file_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    file_type TEXT NOT NULL
-                )
-            """)
-            
-            # Создание индексов для улучшения производительности
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_folders_autor_id 
-                ON Folders(autor_id)
-            """)
-            
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_users_path 
-                ON Users(path)
-            """)
-            
-            con.commit()
-            
-        print(f"База данных успешно создана: {db_path}")
+        con = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            # journal_mode=WAL сохраняется в файле базы
+            apply_pragmas(con, PRAGMA_PROFILE)
+            migrate(con)
+            settings = effective_pragmas(con, list(PRAGMA_PROFILE))
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            con.close()
+
+        print(f"База данных успешно создана: {db_path} (версия схемы {version})")
+        print(f"Настройки SQLite: {settings}")
         return True
         
     except sqlite3.Error as ex:
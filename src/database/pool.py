@@ -0,0 +1,286 @@
+"""
+Пул соединений SQLite.
+
+Соединения открываются лениво, переиспользуются между вызовами и
+проверяются перед выдачей, если долго простаивали. Каждое соединение
+держит собственный кеш подготовленных выражений (cached_statements),
+поэтому повторяющиеся запросы модуля database.сore не компилируются заново.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Protocol, Tuple
+
+from database.initializer import apply_pragmas
+from database.tracing import QueryTracer, TracedConnection, TracedCursor
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class PoolObserver(Protocol):
+    """Получатель событий пула (services.metrics); вызывается в потоке запроса."""
+
+    def statement(self) -> None:
+        """Выполнен запрос (execute или executemany)."""
+
+    def commit(self) -> None:
+        """Зафиксирована транзакция с изменениями."""
+
+
+def observed_connection(connection_class: type, observer: PoolObserver) -> type:
+    """
+    Класс соединения, сообщающий observer о каждом запросе.
+
+    Считаются вызовы execute/executemany, а не шаги SQLite: trace callback
+    повторяет запрос для каждого сработавшего триггера.
+
+    Args:
+        connection_class: Базовый класс (sqlite3.Connection или TracedConnection)
+        observer: Получатель событий
+
+    Returns:
+        type: Класс для sqlite3.connect(factory=...)
+    """
+    cursor_class = TracedCursor if issubclass(connection_class, TracedConnection) else sqlite3.Cursor
+
+    class ObservedCursor(cursor_class):  # type: ignore[valid-type, misc]
+        def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+            observer.statement()
+            return super().execute(sql, parameters)
+
+        def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> sqlite3.Cursor:
+            observer.statement()
+            return super().executemany(sql, seq_of_parameters)
+
+    class ObservedConnection(connection_class):  # type: ignore[valid-type, misc]
+        def cursor(self, factory: type = ObservedCursor) -> sqlite3.Cursor:  # type: ignore[override]
+            return super().cursor(factory)
+
+        # sqlite3.Connection.execute не вызывает переопределенный Cursor.execute
+        def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:  # type: ignore[override]
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> sqlite3.Cursor:  # type: ignore[override]
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+    return ObservedConnection
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений SQLite с проверкой работоспособности."""
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        size: int = 4,
+        cached_statements: int = 256,
+        health_check_interval: float = 30.0,
+        timeout: float = 5.0,
+        busy_timeout: float = 5.0,
+        wal: bool = False,
+        immediate: bool = False,
+        tracer: Optional[QueryTracer] = None,
+        pragmas: Optional[Dict[str, Any]] = None,
+        observer: Optional[PoolObserver] = None
+    ) -> None:
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            size: Максимальное число открытых соединений
+                (0 - соединения не переиспользуются, как без пула)
+            cached_statements: Размер кеша подготовленных выражений соединения
+            health_check_interval: Через сколько секунд простоя соединение
+                проверяется запросом SELECT 1 перед выдачей
+            timeout: Время ожидания свободного соединения в секундах
+            busy_timeout: Сколько секунд ждать снятия блокировки базы другим
+                процессом, прежде чем вернуть "database is locked"
+            wal: Включить журнал WAL (читатели не блокируют писателя)
+            immediate: Начинать транзакции с BEGIN IMMEDIATE - блокировка
+                записи берется сразу, поэтому транзакции разных процессов
+                не упираются друг в друга посередине
+            tracer: Трассировка запросов (None - обычные соединения)
+            pragmas: Профиль PRAGMA для каждого нового соединения
+                (см. database.initializer.PRAGMA_PROFILE)
+            observer: Получатель событий о запросах и фиксациях
+                (None - соединения не оборачиваются)
+        """
+        self.db_path = str(db_path)
+        self.size = size
+        self.cached_statements = cached_statements
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.wal = wal
+        self.immediate = immediate
+        self.tracer = tracer
+        self.pragmas = pragmas or {}
+        self.observer = observer
+
+        factory = tracer.connection_factory if tracer else sqlite3.Connection
+        self._factory = observed_connection(factory, observer) if observer else factory
+
+        self._idle: "queue.LifoQueue[Tuple[sqlite3.Connection, float]]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._created = 0
+        self._closed = False
+
+        # Счетчики для бенчмарков и мониторинга
+        self.opened = 0
+        self.reused = 0
+        self.health_failures = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def _open(self) -> sqlite3.Connection:
+        """Открывает новое соединение."""
+        con = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            isolation_level="IMMEDIATE" if self.immediate else "",
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self._factory
+        )
+        apply_pragmas(con, self.pragmas)
+        if self.wal:
+            con.execute("PRAGMA journal_mode=WAL")
+        self.opened += 1
+        return con
+
+    def _is_alive(self, con: sqlite3.Connection) -> bool:
+        """Проверяет, что соединение еще работоспособно."""
+        try:
+            con.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            self.health_failures += 1
+            return False
+        return True
+
+    def _discard(self, con: sqlite3.Connection) -> None:
+        """Закрывает соединение и освобождает место в пуле."""
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Выдает соединение из пула, при необходимости открывая новое.
+
+        Returns:
+            sqlite3.Connection: Готовое к работе соединение
+
+        Raises:
+            PoolTimeoutError: Если все соединения заняты дольше timeout
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+
+        while True:
+            try:
+                con, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self.size == 0 or self._created < self.size
+                    if can_open:
+                        self._created += 1
+                if can_open:
+                    try:
+                        return self._open()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                try:
+                    con, released_at = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений ({self.size}) за {self.timeout} с"
+                    ) from None
+
+            idle_for = time.monotonic() - released_at
+            if idle_for >= self.health_check_interval and not self._is_alive(con):
+                self._discard(con)
+                continue
+
+            self.reused += 1
+            return con
+
+    def release(self, con: sqlite3.Connection) -> None:
+        """Возвращает соединение в пул."""
+        if con.in_transaction:
+            con.rollback()
+        if self.size == 0 or self._closed:
+            self._discard(con)
+            return
+        self._idle.put((con, time.monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Контекстный менеджер соединения с транзакцией.
+
+        При успешном выходе изменения фиксируются, при исключении - откатываются.
+        Вложенные вызовы в том же потоке используют то же соединение и
+        фиксируются один раз внешним блоком.
+
+        Yields:
+            sqlite3.Connection: Соединение из пула
+        """
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            self._local.depth += 1
+            try:
+                yield con
+            finally:
+                self._local.depth -= 1
+            return
+
+        con = self.acquire()
+        self._local.con, self._local.depth = con, 1
+        try:
+            yield con
+            changed = con.in_transaction
+            con.commit()
+            self.commits += 1
+            if changed and self.observer is not None:
+                self.observer.commit()
+        except BaseException:
+            con.rollback()
+            self.rollbacks += 1
+            raise
+        finally:
+            self._local.con, self._local.depth = None, 0
+            self.release(con)
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счетчики пула."""
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": self._idle.qsize(),
+            "opened": self.opened,
+            "reused": self.reused,
+            "health_failures": self.health_failures,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+        }
+
+    def close(self) -> None:
+        """Закрывает все простаивающие соединения пула."""
+        self._closed = True
+        while True:
+            try:
+                con, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(con)
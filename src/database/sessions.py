@@ -0,0 +1,253 @@
+"""
+Хранилище навигационных сессий пользователей.
+
+Путь по папкам, стек страниц и режим удаления хранятся в памяти как
+обычные списки и числа, а в столбцы Users.path, Users.pages и
+Users.delete_mode (а также id сообщений для очистки чата - Users.messages_id)
+записываются пачками (write-behind): периодически и
+при остановке бота. Нажатия пагинации и переходы по папкам больше не
+требуют синхронной записи в базу.
+
+Восстановление после сбоя: каждая запись пачки выполняется в одной
+транзакции, поэтому в базе всегда лежит согласованное состояние на момент
+последнего сброса (теряется не более интервала сброса навигации). При
+загрузке стек страниц выравнивается по длине пути, а путь к удаленной
+папке сбрасывается к корню при отрисовке (core.reset_navigation).
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import AbstractContextManager
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+
+@dataclass
+class Session:
+    """Навигационное состояние пользователя."""
+    path: List[str]
+    pages: List[int]
+    delete_mode: int
+    message_ids: List[int] = field(default_factory=list)
+    dirty: bool = False
+
+    @property
+    def vertex_type(self) -> str:
+        """Тип текущей вершины ('U' - корень, 'F' - папка)."""
+        return self.path[-1].split(":")[0]
+
+    @property
+    def folder_id(self) -> int:
+        """Идентификатор текущей папки."""
+        return int(self.path[-1].split(":")[-1])
+
+
+def parse_session(path: str, pages: str, delete_mode: int, messages_id: str = "") -> Session:
+    """
+    Разбирает строки Users.path ("U:1\\F:5"), Users.pages ("1\\2")
+    и Users.messages_id ("10\\11").
+
+    Стек страниц выравнивается по длине пути (недостающие страницы - 1).
+
+    Raises:
+        ValueError: Если путь поврежден
+    """
+    path_list = path.split("\\")
+    for vertex in path_list:
+        _, vertex_id = vertex.split(":")
+        int(vertex_id)
+
+    pages_list = [int(page) for page in pages.split("\\") if page][:len(path_list)]
+    pages_list += [1] * (len(path_list) - len(pages_list))
+
+    # Поврежденные id сообщений не мешают навигации - просто пропускаем их
+    message_ids = [int(id_) for id_ in messages_id.split("\\") if id_.isdigit()]
+    return Session(
+        path=path_list,
+        pages=pages_list,
+        delete_mode=delete_mode,
+        message_ids=message_ids
+    )
+
+
+class SessionStore:
+    """Кеш навигационных сессий с отложенной пакетной записью в Users."""
+
+    def __init__(
+        self,
+        connection: Callable[[], AbstractContextManager[sqlite3.Connection]],
+        maxsize: int = 10000
+    ) -> None:
+        """
+        Args:
+            connection: Фабрика соединений с транзакцией (например, pool.connection)
+            maxsize: Сколько чистых (уже сохраненных) сессий держать в памяти
+        """
+        self._connection = connection
+        self.maxsize = maxsize
+        self._sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def get(self, chat_id: int) -> Session:
+        """
+        Возвращает сессию пользователя, загружая ее из базы при первом обращении.
+
+        Raises:
+            LookupError: Если пользователя нет в таблице Users
+            ValueError: Если сохраненный путь поврежден
+        """
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                self._sessions.move_to_end(chat_id)
+                return session
+
+        with self._connection() as con:
+            row = con.execute(
+                "SELECT path, pages, delete_mode, messages_id FROM Users WHERE chat_id = ?",
+                (chat_id,)
+            ).fetchone()
+        if row is None:
+            raise LookupError(f"Пользователь {chat_id} не найден")
+
+        session = parse_session(*row)
+        with self._lock:
+            # Сессию могли загрузить параллельно - оставляем первую
+            session = self._sessions.setdefault(chat_id, session)
+            self.loads += 1
+        return session
+
+    def update(
+        self,
+        chat_id: int,
+        path: Optional[List[str]] = None,
+        pages: Optional[List[int]] = None,
+        delete_mode: Optional[int] = None
+    ) -> Session:
+        """Изменяет сессию в памяти и помечает ее для записи в базу."""
+        session = self.get(chat_id)
+        with self._lock:
+            if path is not None:
+                session.path = list(path)
+            if pages is not None:
+                session.pages = list(pages)
+            if delete_mode is not None:
+                session.delete_mode = delete_mode
+            session.dirty = True
+        return session
+
+    def add_messages(self, chat_id: int, message_ids: Iterable[int]) -> None:
+        """Запоминает id сообщений чата, которые нужно будет удалить."""
+        session = self.get(chat_id)
+        with self._lock:
+            known = set(session.message_ids)
+            new_ids = [id_ for id_ in message_ids if id_ not in known]
+            if new_ids:
+                session.message_ids.extend(new_ids)
+                session.dirty = True
+
+    def take_messages(self, chat_id: int, keep: Iterable[int] = ()) -> List[int]:
+        """
+        Забирает запомненные id сообщений чата для удаления.
+
+        Args:
+            chat_id: Идентификатор чата
+            keep: Id сообщений, которые остаются в чате (и в сессии)
+
+        Returns:
+            List[int]: Id сообщений для удаления
+        """
+        session = self.get(chat_id)
+        keep = set(keep)
+        with self._lock:
+            taken = [id_ for id_ in session.message_ids if id_ not in keep]
+            if taken:
+                session.message_ids = [id_ for id_ in session.message_ids if id_ in keep]
+                session.dirty = True
+        return taken
+
+    def flush(self, chat_id: Optional[int] = None) -> int:
+        """
+        Записывает измененные сессии в базу одной транзакцией.
+
+        Args:
+            chat_id: Сбросить только сессию этого чата
+
+        Returns:
+            int: Количество записанных сессий
+        """
+        with self._lock:
+            if chat_id is not None:
+                session = self._sessions.get(chat_id)
+                items = [(chat_id, session)] if session is not None and session.dirty else []
+            else:
+                items = [(id_, s) for id_, s in self._sessions.items() if s.dirty]
+
+            rows = [
+                (
+                    "\\".join(session.path),
+                    "\\".join(str(page) for page in session.pages),
+                    session.delete_mode,
+                    "\\".join(str(id_) for id_ in session.message_ids),
+                    id_
+                )
+                for id_, session in items
+            ]
+            for _, session in items:
+                session.dirty = False
+
+        if rows:
+            try:
+                with self._connection() as con:
+                    con.executemany(
+                        "UPDATE Users SET path = ?, pages = ?, delete_mode = ?, messages_id = ? "
+                        "WHERE chat_id = ?",
+                        rows
+                    )
+            except Exception:
+                # Не потеряли изменения - запишем при следующем сбросе
+                with self._lock:
+                    for _, session in items:
+                        session.dirty = True
+                raise
+
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+
+        self._trim()
+        return len(rows)
+
+    def forget(self, chat_id: int) -> None:
+        """Сохраняет и выгружает сессию (после прямого изменения строки Users)."""
+        self.flush(chat_id)
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def clear(self) -> None:
+        """Выгружает все сессии без записи (например, при смене базы)."""
+        with self._lock:
+            self._sessions.clear()
+
+    def _trim(self) -> None:
+        """Выгружает самые давние сохраненные сессии сверх maxsize."""
+        with self._lock:
+            extra = len(self._sessions) - self.maxsize
+            for id_ in [id_ for id_, s in self._sessions.items() if not s.dirty][:max(extra, 0)]:
+                del self._sessions[id_]
+
+    def stats(self) -> dict:
+        """Возвращает счетчики хранилища."""
+        with self._lock:
+            dirty = sum(session.dirty for session in self._sessions.values())
+            return {
+                "sessions": len(self._sessions),
+                "dirty": dirty,
+                "loads": self.loads,
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+            }
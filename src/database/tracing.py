@@ -0,0 +1,265 @@
+"""
+Трассировка запросов SQLite.
+
+Функции database.сore собирают SQL по имени таблицы и столбца
+(get_value_db, set_value_db), поэтому по коду не видно, какое обновление
+породило какие запросы. При DB_TRACE_ENABLED=1 пул открывает соединения
+через TracedConnection, и каждый запрос:
+- замеряется (выполнение и чтение результата);
+- получает метку текущего обновления и обработчика (query_tag - задается
+  middleware services.tracing и переходит в потоки database.async_core
+  вместе с контекстом);
+- оценивается по числу инструкций виртуальной машины SQLite (progress
+  handler вызывается каждые progress_steps инструкций);
+- при длительности больше порога пишется в журнал медленных запросов.
+
+Запросы, выполненные модулем sqlite3 неявно (BEGIN перед изменением),
+видны только через trace callback и учитываются без времени.
+
+Сводка report() - самые дорогие запросы по суммарному времени.
+При выключенной трассировке соединения обычные и ничего не замеряется.
+"""
+
+import contextvars
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Метка запросов: (id обновления, обработчик)
+QueryTag = Tuple[Optional[int], str]
+query_tag: contextvars.ContextVar[QueryTag] = contextvars.ContextVar(
+    "query_tag", default=(None, "-")
+)
+
+_SPACES = re.compile(r"\s+")
+# Списки параметров переменной длины: VALUES (?), (?), ... и IN (?, ?, ...)
+_REPEATED = re.compile(r"(\(\?\)|\?)(\s*,\s*(\(\?\)|\?))+")
+
+
+@dataclass
+class StatementStats:
+    """Накопленная статистика одного запроса (текста SQL)."""
+    sql: str
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    steps: int = 0
+    slow: int = 0
+    last_tag: QueryTag = (None, "-")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+            "vm_steps": self.steps,
+            "slow": self.slow,
+            "last_update": self.last_tag[0],
+            "last_handler": self.last_tag[1],
+        }
+
+
+class QueryTracer:
+    """Сбор статистики запросов и журнал медленных запросов."""
+
+    def __init__(
+        self,
+        slow_ms: float = 50.0,
+        slow_log: str = "",
+        progress_steps: int = 1000,
+        max_statements: int = 1000
+    ) -> None:
+        """
+        Args:
+            slow_ms: Порог медленного запроса в миллисекундах
+            slow_log: Файл журнала медленных запросов (пусто - вывод в консоль)
+            progress_steps: Через сколько инструкций VM вызывается progress handler
+            max_statements: Сколько разных запросов хранить (остальные не учитываются)
+        """
+        self.slow = slow_ms / 1000
+        self.slow_log = slow_log
+        self.progress_steps = progress_steps
+        self.max_statements = max_statements
+        self._stats: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+        self.queries = 0
+        self.slow_queries = 0
+
+        # Класс соединения для sqlite3.connect(factory=...)
+        self.connection_factory = type("Connection", (TracedConnection,), {"_tracer": self})
+
+    def attach(self, con: "TracedConnection") -> None:
+        """Подключает trace и progress callbacks к новому соединению."""
+        con.set_trace_callback(con._on_trace)
+        if self.progress_steps:
+            con.set_progress_handler(con._on_progress, self.progress_steps)
+
+    def record(self, sql: str, elapsed: float, steps: int) -> None:
+        """Учитывает выполненный запрос."""
+        tag = query_tag.get()
+        key = _REPEATED.sub(r"\1, ...", _SPACES.sub(" ", sql).strip())
+        with self._lock:
+            self.queries += 1
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    return
+                stats = self._stats[key] = StatementStats(key)
+            stats.calls += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.steps += steps
+            stats.last_tag = tag
+            is_slow = elapsed >= self.slow
+            if is_slow:
+                stats.slow += 1
+                self.slow_queries += 1
+
+        if is_slow:
+            self._log_slow(key, elapsed, steps, tag)
+
+    def _log_slow(self, sql: str, elapsed: float, steps: int, tag: QueryTag) -> None:
+        """Пишет медленный запрос в журнал."""
+        line = (
+            f"{time.strftime('%Y-%m-%d %H:%M:%S')} {elapsed * 1000:.1f} мс "
+            f"update={tag[0]} handler={tag[1]} steps~{steps} {sql}"
+        )
+        if not self.slow_log:
+            print(f"Медленный запрос: {line}")
+            return
+        with self._log_lock, open(self.slow_log, "a", encoding="utf-8") as log:
+            log.write(line + "\n")
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Самые дорогие запросы по суммарному времени."""
+        with self._lock:
+            rows = sorted(self._stats.values(), key=lambda stats: stats.total, reverse=True)
+            return [stats.as_dict() for stats in rows[:limit]]
+
+    def report(self, limit: int = 20) -> str:
+        """Сводка самых дорогих запросов в виде текста."""
+        lines = [f"Запросов: {self.queries}, медленных: {self.slow_queries}"]
+        for row in self.top(limit):
+            lines.append(
+                f"{row['total_ms']:9.1f} мс  {row['calls']:7d} x {row['mean_ms']:7.3f} мс  "
+                f"max {row['max_ms']:7.1f}  steps {row['vm_steps']:9d}  {row['sql']}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Сбрасывает накопленную статистику."""
+        with self._lock:
+            self._stats.clear()
+            self.queries = 0
+            self.slow_queries = 0
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий выполнение запроса и чтение его результата."""
+
+    def _traced(self, sql: str, method: Any, *args: Any) -> Any:
+        con: TracedConnection = self.connection  # type: ignore[assignment]
+        con._finish()
+        con._current, con._steps, con._elapsed = sql, 0, 0.0
+        start = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            con._elapsed += time.perf_counter() - start
+
+    def execute(self, sql: str, parameters: Any = ()) -> "TracedCursor":
+        return self._traced(sql, sqlite3.Cursor.execute, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> "TracedCursor":
+        return self._traced(sql, sqlite3.Cursor.executemany, seq_of_parameters)
+
+    def _fetch(self, method: Any, *args: Any) -> Any:
+        con: TracedConnection = self.connection  # type: ignore[assignment]
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            con._elapsed += time.perf_counter() - start
+
+    def fetchone(self) -> Any:
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size: int = 1) -> List[Any]:
+        return self._fetch(sqlite3.Cursor.fetchmany, size)
+
+    def fetchall(self) -> List[Any]:
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    Соединение с трассировкой (создается через QueryTracer.connection_factory).
+
+    Соединение пула в каждый момент используется одним потоком, поэтому
+    текущий запрос хранится прямо в соединении. Запрос учитывается, когда
+    начинается следующий или завершается транзакция.
+    """
+
+    _tracer: QueryTracer
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._current: Optional[str] = None
+        self._steps = 0
+        self._elapsed = 0.0
+        self._tracer.attach(self)
+
+    def _finish(self) -> None:
+        """Учитывает предыдущий запрос соединения."""
+        if self._current is not None:
+            sql, self._current = self._current, None
+            self._tracer.record(sql, self._elapsed, self._steps)
+
+    def _on_trace(self, sql: str) -> None:
+        # Запросы курсора учитываются сами; здесь - неявный BEGIN модуля sqlite3
+        if sql.lstrip()[:5].upper() == "BEGIN":
+            self._tracer.record(sql, 0.0, 0)
+
+    def _on_progress(self) -> int:
+        self._steps += self._tracer.progress_steps
+        return 0  # 0 - продолжить выполнение
+
+    def cursor(self, factory: type = TracedCursor) -> TracedCursor:  # type: ignore[override]
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> TracedCursor:  # type: ignore[override]
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> TracedCursor:  # type: ignore[override]
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _timed(self, name: str, method: Any) -> None:
+        self._finish()
+        start = time.perf_counter()
+        try:
+            method(self)
+        finally:
+            self._tracer.record(name, time.perf_counter() - start, 0)
+
+    def commit(self) -> None:
+        if self.in_transaction:
+            self._timed("COMMIT", sqlite3.Connection.commit)
+        else:
+            self._finish()
+
+    def rollback(self) -> None:
+        if self.in_transaction:
+            self._timed("ROLLBACK", sqlite3.Connection.rollback)
+        else:
+            self._finish()
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
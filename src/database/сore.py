@@ -1,64 +1,247 @@
+import re
+import secrets
 import sqlite3
-from typing import Union, List, Tuple, Optional, Dict
+import threading
+import time
+from dataclasses import dataclass, field
+from math import ceil
+from typing import List, Tuple, Optional, Dict
 from pathlib import Path
 
+import config
+from database.cache import LRUCache
+from database.initializer import PRAGMA_PROFILE
+from database.pool import ConnectionPool, PoolObserver
+from database.sessions import Session, SessionStore
+from database.tracing import QueryTracer
+
 # Константы для работы с базой данных
 DB_DIR = Path(__file__).parent.parent / "database"
 DB_PATH = DB_DIR / "database.db"
+PAGE_SIZE = 10  # Количество элементов на одной странице папки
+MAX_DEPTH = config.MAX_FOLDER_DEPTH  # Максимальная глубина вложенности папок
+SHARE_TOKEN_BYTES = 8  # Случайных байт в токене ссылки (11 символов base64url)
+SEARCH_MAX_TERMS = 8  # Слов запроса, учитываемых поиском
+
+# Пул соединений создается лениво при первом обращении к базе
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# Кеш строк папок ("folder", id), страниц дочерних элементов ("children", id, page)
+# метаданных файлов ("file", id) и токенов ссылок ("share", id);
+# сбрасывается всеми изменяющими функциями. Загрузка из базы сохраняется
+# только если за время запроса ключ не сбрасывали (см. LRUCache.generation)
+cache = LRUCache(
+    maxsize=config.DB_CACHE_SIZE,
+    ttl=config.DB_CACHE_TTL,
+    enabled=config.DB_CACHE_ENABLED
+)
+
+
+# Трассировка запросов (только при DB_TRACE_ENABLED)
+tracer = QueryTracer(
+    slow_ms=config.DB_SLOW_QUERY_MS,
+    slow_log=config.DB_SLOW_QUERY_LOG
+) if config.DB_TRACE_ENABLED else None
+
 
+# Учет запросов и фиксаций (services.metrics.install задает до открытия пула)
+observer: Optional[PoolObserver] = None
 
-def cycle_BFS(vertices_id: List[int], path_id: List[int]) -> bool:
+
+# Навигация пользователей (Users.path, pages, delete_mode) с отложенной записью
+sessions = SessionStore(lambda: get_pool().connection())
+
+
+def _invalidate_folders(*folder_ids: int) -> None:
+    """Сбрасывает кеш строк и страниц дочерних элементов папок."""
+    ids = set(folder_ids)
+    cache.invalidate(*(("folder", id_) for id_ in ids))
+    # Страницы загружаются с поколением строки папки, оно уже увеличено
+    cache.invalidate_where(lambda key: key[0] == "children" and key[1] in ids, new_epoch=False)
+
+
+def init_pool(
+    db_path: Optional[str | Path] = None,
+    size: Optional[int] = None,
+    **options
+) -> ConnectionPool:
     """
-    Проверяет наличие циклов в графе с помощью обхода в ширину (BFS).
+    Создает (или пересоздает) пул соединений с базой данных.
     
     Args:
-        vertices_id: Список идентификаторов вершин для проверки
-        path_id: Список идентификаторов вершин в текущем пути
+        db_path: Путь к базе данных (по умолчанию DB_PATH)
+        size: Размер пула (по умолчанию config.DB_POOL_SIZE)
+        **options: Остальные параметры ConnectionPool (wal, immediate, ...)
+        
+    Returns:
+        ConnectionPool: Новый пул соединений
+    """
+    global _pool
+    if size is None:
+        size = config.DB_POOL_SIZE
+    options.setdefault("busy_timeout", config.DB_BUSY_TIMEOUT)
+    options.setdefault("tracer", tracer)
+    options.setdefault("observer", observer)
+    options.setdefault("pragmas", PRAGMA_PROFILE)
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(db_path or DB_PATH, size=size, **options)
+
+    # Данные прежней базы больше не действительны
+    cache.clear()
+    sessions.clear()
+    return _pool
+
+
+def get_pool() -> ConnectionPool:
+    """Возвращает текущий пул соединений, создавая его при необходимости."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_PATH,
+                    size=config.DB_POOL_SIZE,
+                    busy_timeout=config.DB_BUSY_TIMEOUT,
+                    tracer=tracer,
+                    pragmas=PRAGMA_PROFILE,
+                    observer=observer
+                )
+    return _pool
+
+
+def close_pool() -> None:
+    """Закрывает пул соединений (например, при остановке бота)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_children(vertex_id: int) -> List[str]:
+    """
+    Получает дочерние элементы папки в порядке добавления.
+    
+    Args:
+        vertex_id: Идентификатор папки
         
     Returns:
-        bool: False если найден цикл, иначе True
+        Список элементов в формате ["тип:id", ...]
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT child_type, child_id FROM Edges WHERE parent_id = ? ORDER BY position",
+            (vertex_id,)
+        )
+        return [f"{type_}:{id_}" for type_, id_ in cur.fetchall()]
+
+
+def _append_edge(cur: sqlite3.Cursor, parent_id: int, child_type: str, child_id: int) -> None:
+    """Добавляет ребро в конец списка дочерних элементов папки."""
+    cur.execute(
+        "INSERT INTO Edges (parent_id, child_type, child_id, position) "
+        "SELECT ?, ?, ?, COALESCE(MAX(position), 0) + 1 FROM Edges WHERE parent_id = ?",
+        (parent_id, child_type, child_id, parent_id)
+    )
+
+
+def reachability(
+    sources: List[int],
+    targets: List[int],
+    start_depth: int = 0,
+    max_depth: int = MAX_DEPTH
+) -> Tuple[bool, int]:
     """
-    if not vertices_id:
-        return True
+    Обходит в ширину папки, достижимые из sources, одним рекурсивным запросом.
+    
+    Каждая папка попадает в результат не более одного раза на каждом уровне
+    (UNION убирает повторы), поэтому общие поддеревья не обходятся заново.
+    Обход останавливается на найденных целевых папках и на глубине max_depth + 1.
     
-    next_vertices_id: List[int] = []
-    for vertex_id in vertices_id:
-        if vertex_id in path_id:
-            return False
+    Args:
+        sources: Идентификаторы папок, с которых начинается обход
+        targets: Идентификаторы искомых папок
+        start_depth: Глубина, на которой находятся sources
+        max_depth: Ограничение глубины обхода
         
-        next_vertices = get_value_db("Folders", "next_vertices", vertex_id).split(";")
-        next_vertices = [] if next_vertices[-1] == "" else next_vertices
+    Returns:
+        Кортеж (найдена ли одна из targets, максимальная достигнутая глубина)
+    """
+    if not sources:
+        return False, start_depth
+
+    sources_sql = ", ".join("(?)" for _ in sources)
+    targets_sql = ", ".join("?" for _ in targets) or "NULL"
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            f"WITH RECURSIVE reach(id, depth) AS ("
+            f"  SELECT column1, ? FROM (VALUES {sources_sql})"
+            f"  UNION"
+            f"  SELECT e.child_id, r.depth + 1 FROM Edges e JOIN reach r ON e.parent_id = r.id"
+            f"  WHERE e.child_type = 'F' AND r.depth <= ? AND r.id NOT IN ({targets_sql})"
+            f") "
+            f"SELECT EXISTS(SELECT 1 FROM reach WHERE id IN ({targets_sql})), MAX(depth) FROM reach",
+            (start_depth, *sources, max_depth, *targets, *targets)
+        )
+        found, depth = cur.fetchone()
+
+    return bool(found), depth
 
-        next_vertices_id += [
-            int(ids.split(":")[-1]) 
-            for ids in next_vertices 
-            if ids.split(":")[0] == "F"
-        ]
 
-    return cycle_BFS(next_vertices_id, path_id)
+def cycle_BFS(
+    vertices_id: List[int],
+    path_id: List[int],
+    max_depth: int = MAX_DEPTH
+) -> bool:
+    """
+    Проверяет наличие циклов в графе с помощью обхода в ширину (BFS).
+    
+    Обход выполняется одним рекурсивным SQL-запросом (см. reachability).
+    Превышение максимальной глубины вложенности тоже считается ошибкой.
+    
+    Args:
+        vertices_id: Список идентификаторов вершин для проверки
+        path_id: Список идентификаторов вершин в текущем пути
+        max_depth: Максимальная глубина вложенности папок
+        
+    Returns:
+        bool: False если найден цикл или превышена глубина, иначе True
+    """
+    found, depth = reachability(vertices_id, path_id, len(path_id), max_depth)
+    return not found and depth <= max_depth
 
 
 def delete_DFS(
     vertex_type: str, 
     vertex_id: int, 
-    chat_id: int, 
-    fl_cnt: Optional[bool] = True
+    chat_id: Optional[int] = None
 ) -> Dict[str, List[int]]:
     """
-    Рекурсивно удаляет вершины графа с помощью обхода в глубину (DFS).
+    Находит вершины, удаляемые вместе с вершиной графа.
+    
+    Удаляется область папок с count_of_users <= 1, достижимая из вершины,
+    и файлы этих папок. Общие папки (count_of_users > 1) на границе области
+    не удаляются - у их поддеревьев только уменьшается счетчик. Вся область
+    вычисляется одним рекурсивным запросом.
     
     Args:
         vertex_type: Тип вершины ('F' - папка, 'D' - файл)
         vertex_id: Идентификатор вершины
-        chat_id: Идентификатор чата пользователя
-        fl_cnt: Флаг для управления подсчетом пользователей
+        chat_id: Идентификатор чата пользователя (не используется, оставлен для совместимости)
         
     Returns:
         Словарь с идентификаторами удаляемых элементов:
         {
             "F": [список id папок],
             "D": [список id файлов],
-            "change_cnt": [список id для изменения счетчика]
+            "change_cnt": [список id для изменения счетчика (по одному на каждую ссылку)]
         }
     """
     delete_id: Dict[str, List[int]] = {"F": [], "D": [], "change_cnt": []}
@@ -67,56 +250,116 @@ def delete_DFS(
         delete_id["D"].append(vertex_id)
         return delete_id
 
-    autor_id = get_value_db("Folders", "autor_id", vertex_id)
-    cnt = get_value_db("Folders", "count_of_users", vertex_id)
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cnt = cur.execute(
+            "SELECT count_of_users FROM Folders WHERE id = ?", (vertex_id,)
+        ).fetchone()[0]
 
-    if cnt > 1:
-        delete_id["change_cnt"].append(vertex_id)
-        fl_cnt = False
-        
-    if not fl_cnt:
-        return delete_id
-    
-    delete_id["F"].append(vertex_id)
+        if cnt > 1:
+            delete_id["change_cnt"].append(vertex_id)
+            return delete_id
 
-    next_vertices = get_value_db("Folders", "next_vertices", vertex_id).split(";")
-    next_vertices = [] if next_vertices[-1] == "" else next_vertices
+        cur.execute(
+            "WITH RECURSIVE region(id) AS ("
+            "  SELECT ?"
+            "  UNION"
+            "  SELECT e.child_id FROM Edges e JOIN region r ON e.parent_id = r.id"
+            "  JOIN Folders f ON f.id = e.child_id"
+            "  WHERE e.child_type = 'F' AND f.count_of_users <= 1"
+            ") "
+            "SELECT 'R', id, NULL FROM region "
+            "UNION ALL "
+            "SELECT e.child_type, e.child_id, f.count_of_users FROM Edges e "
+            "JOIN region r ON e.parent_id = r.id "
+            "LEFT JOIN Folders f ON e.child_type = 'F' AND f.id = e.child_id",
+            (vertex_id,)
+        )
 
-    for elem in next_vertices:
-        type_, id_ = elem.split(":")[0], int(elem.split(":")[-1])
-        result = delete_DFS(type_, id_, chat_id, fl_cnt)
-        delete_id["F"] += result["F"]
-        delete_id["D"] += result["D"]
-        delete_id["change_cnt"] += result["change_cnt"]
+        for type_, id_, child_cnt in cur.fetchall():
+            if type_ == "R":
+                delete_id["F"].append(id_)
+            elif type_ == "D":
+                delete_id["D"].append(id_)
+            elif child_cnt is not None and child_cnt > 1:
+                delete_id["change_cnt"].append(id_)
 
     return delete_id
 
 
 def change_cnt_DFS(
     vertex_type: str, 
-    vertex_id: int, 
+    vertex_id: int | List[int], 
     change: Optional[int] = 1
-) -> None:
+) -> List[int]:
     """
-    Рекурсивно изменяет счетчик пользователей для папок.
+    Изменяет счетчик пользователей для папок и всех их подпапок.
+    
+    Счетчик каждой папки меняется на change, умноженное на число путей
+    до нее от исходных папок (как при рекурсивном обходе каждого пути).
+    Подграф загружается одним рекурсивным запросом, число путей считается
+    в топологическом порядке, а изменения записываются одним executemany.
     
     Args:
         vertex_type: Тип вершины ('F' - папка, 'D' - файл)
-        vertex_id: Идентификатор вершины
+        vertex_id: Идентификатор вершины или список идентификаторов
+            (повторы учитываются как отдельные ссылки)
         change: Величина изменения счетчика
+        
+    Returns:
+        Список id папок, у которых изменился счетчик
     """
     if vertex_type == "D":
-        return
+        return []
 
-    cnt = get_value_db("Folders", "count_of_users", vertex_id)
-    set_value_db("Folders", "count_of_users", vertex_id, cnt + change)
-    
-    next_vertices = get_value_db("Folders", "next_vertices", vertex_id).split(";")
-    next_vertices = [] if next_vertices[-1] == "" else next_vertices
+    seeds = [vertex_id] if isinstance(vertex_id, int) else list(vertex_id)
+    if not seeds:
+        return []
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            f"WITH RECURSIVE reach(id) AS ("
+            f"  SELECT column1 FROM (VALUES {', '.join('(?)' for _ in seeds)})"
+            f"  UNION"
+            f"  SELECT e.child_id FROM Edges e JOIN reach r ON e.parent_id = r.id"
+            f"  WHERE e.child_type = 'F'"
+            f") "
+            f"SELECT r.id, e.child_id FROM reach r "
+            f"LEFT JOIN Edges e ON e.parent_id = r.id AND e.child_type = 'F'",
+            seeds
+        )
+
+        children: Dict[int, List[int]] = {}
+        indegree: Dict[int, int] = {}
+        for parent, child in cur.fetchall():
+            children.setdefault(parent, [])
+            indegree.setdefault(parent, 0)
+            if child is not None:
+                children[parent].append(child)
+                indegree[child] = indegree.get(child, 0) + 1
+
+        # Число путей от исходных папок до каждой папки подграфа
+        paths: Dict[int, int] = {}
+        for seed in seeds:
+            paths[seed] = paths.get(seed, 0) + 1
+
+        queue = [vertex for vertex, degree in indegree.items() if degree == 0]
+        while queue:
+            vertex = queue.pop()
+            for child in children.get(vertex, []):
+                paths[child] = paths.get(child, 0) + paths.get(vertex, 0)
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    queue.append(child)
+
+        changed = [(change * cnt, id_) for id_, cnt in paths.items() if cnt]
+        cur.executemany(
+            "UPDATE Folders SET count_of_users = count_of_users + ? WHERE id = ?",
+            changed
+        )
 
-    for elem in next_vertices:
-        type_, id_ = elem.split(":")[0], int(elem.split(":")[-1])
-        change_cnt_DFS(type_, id_, change)
+    return [id_ for _, id_ in changed]
 
 
 def is_user_in_table(chat_id: int) -> bool:
@@ -129,7 +372,7 @@ def is_user_in_table(chat_id: int) -> bool:
     Returns:
         bool: True если пользователь существует, иначе False
     """
-    with sqlite3.connect(DB_PATH) as con:
+    with get_pool().connection() as con:
         cur = con.cursor()
         cur.execute('SELECT * FROM Users WHERE chat_id = ?', (chat_id,))
         return cur.fetchone() is not None
@@ -147,36 +390,32 @@ def get_value_db(table: str, column: str, id: int) -> str | int:
     Returns:
         Значение из базы данных (str или int)
     """
-    match table:
-        case "Users":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        match table:
+            case "Users":
                 # Для таблицы Users используем chat_id как ключ
                 cur.execute(
                     f"SELECT {column} FROM Users WHERE chat_id = ?", 
                     (id,)
                 )
             
-        case "Folders":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+            case "Folders":
                 # Для таблицы Folders используем id как ключ
                 cur.execute(
                     f"SELECT {column} FROM Folders WHERE id = ?", 
                     (id,)
                 )
             
-        case "Files":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+            case "Files":
                 # Для таблицы Files используем id как ключ
                 cur.execute(
                     f"SELECT {column} FROM Files WHERE id = ?", 
                     (id,)
                 )
 
-    # Возвращаем первое значение из результата запроса
-    return cur.fetchone()[0]
+        # Возвращаем первое значение из результата запроса
+        return cur.fetchone()[0]
         
 
 def set_value_db(table: str, column: str, id: int, new_value: str | int) -> None:
@@ -189,36 +428,219 @@ def set_value_db(table: str, column: str, id: int, new_value: str | int) -> None
         id: ID записи (chat_id для Users, id для других таблиц)
         new_value: Новое значение
     """
-    match table:
-        case "Users":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+    if table == "Users":
+        # Сначала сохраняем и выгружаем сессию, чтобы она не затерла запись
+        sessions.forget(id)
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        match table:
+            case "Users":
                 # Обновление записи в таблице Users
                 cur.execute(
                     f"UPDATE Users SET {column} = ? WHERE chat_id = ?",
                     (new_value, id)
                 )
             
-        case "Folders":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+            case "Folders":
                 # Обновление записи в таблице Folders
                 cur.execute(
                     f"UPDATE Folders SET {column} = ? WHERE id = ?",
                     (new_value, id)
                 )
             
-        case "Files":
-            with sqlite3.connect(DB_PATH) as con:
-                cur = con.cursor()
+            case "Files":
                 # Обновление записи в таблице Files
                 cur.execute(
                     f"UPDATE Files SET {column} = ? WHERE id = ?",
                     (new_value, id)
                 )
 
+    match table:
+        case "Folders":
+            _invalidate_folders(id)
+        case "Files":
+            cache.invalidate(("file", id))
+
+    # Имена показываются в списках родительских папок
+    if column == "name" and table in ("Folders", "Files"):
+        cache.invalidate_where(lambda key: key[0] == "children")
+
+
+def get_file(file_id: int) -> Tuple[str, str, str]:
+    """
+    Получает метаданные файла (с кешированием).
+    
+    Args:
+        file_id: Идентификатор файла в таблице Files
+        
+    Returns:
+        Кортеж (telegram file_id, имя, тип файла)
+        
+    Raises:
+        LookupError: Если файл не найден
+    """
+    found, row = cache.get(("file", file_id))
+    if found:
+        return row
+
+    generation = cache.generation(("file", file_id))
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute("SELECT file_id, name, file_type FROM Files WHERE id = ?", (file_id,))
+        row = cur.fetchone()
+
+    if row is None:
+        raise LookupError(f"Файл {file_id} не найден")
+    cache.set(("file", file_id), row, generation)
+    return row
+
+
+def get_folder_files(folder_id: int) -> List[Tuple[int, str, str, str]]:
+    """
+    Получает все файлы папки одним запросом (в порядке добавления).
+    
+    Args:
+        folder_id: Идентификатор папки
+        
+    Returns:
+        Список (id, telegram file_id, имя, тип файла); ссылки на
+        удаленные файлы пропускаются
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT d.id, d.file_id, d.name, d.file_type "
+            "FROM Edges e JOIN Files d ON d.id = e.child_id "
+            "WHERE e.parent_id = ? AND e.child_type = 'D' ORDER BY e.position",
+            (folder_id,)
+        )
+        return cur.fetchall()
+
+
+def get_share_token(folder_id: int) -> str:
+    """
+    Возвращает действующий токен ссылки на папку, создавая его при необходимости.
+    
+    Args:
+        folder_id: Идентификатор папки
+        
+    Returns:
+        str: Токен (без префикса config.SHARE_PREFIX)
+    """
+    now = int(time.time())
+    found, item = cache.get(("share", folder_id))
+    if found:
+        token, expires_at = item
+        if expires_at is None or expires_at > now:
+            return token
+
+    generation = cache.generation(("share", folder_id))
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT token, expires_at FROM ShareTokens "
+            "WHERE folder_id = ? AND revoked = 0 AND (expires_at IS NULL OR expires_at > ?) "
+            "ORDER BY created_at DESC LIMIT 1",
+            (folder_id, now)
+        )
+        row = cur.fetchone()
+        if row is None:
+            token = secrets.token_urlsafe(SHARE_TOKEN_BYTES)
+            expires_at = now + config.SHARE_TOKEN_TTL if config.SHARE_TOKEN_TTL else None
+            cur.execute(
+                "INSERT INTO ShareTokens (token, folder_id, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (token, folder_id, now, expires_at)
+            )
+            row = (token, expires_at)
+
+    cache.set(("share", folder_id), row, generation)
+    return row[0]
+
 
-def get_full_parameters(folder_id: int) -> List[Union[str, int]]:
+def resolve_share_token(token: str) -> int:
+    """
+    Находит папку по токену ссылки (один поиск по первичному ключу).
+    
+    Args:
+        token: Токен ссылки
+        
+    Returns:
+        int: Идентификатор папки
+        
+    Raises:
+        LookupError: Если токен неизвестен, отозван или истек
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT folder_id FROM ShareTokens "
+            "WHERE token = ? AND revoked = 0 AND (expires_at IS NULL OR expires_at > ?)",
+            (token, int(time.time()))
+        )
+        row = cur.fetchone()
+
+    if row is None:
+        raise LookupError("Ссылка на папку не действительна")
+    return row[0]
+
+
+def revoke_share_tokens(folder_id: int) -> int:
+    """
+    Отзывает все ссылки на папку (при следующей отрисовке будет создана новая).
+    
+    Ссылки прежнего формата после этого тоже не принимаются
+    (см. legacy_links_revoked).
+    
+    Args:
+        folder_id: Идентификатор папки
+        
+    Returns:
+        int: Количество отозванных токенов
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "UPDATE ShareTokens SET revoked = 1 WHERE folder_id = ? AND revoked = 0",
+            (folder_id,)
+        )
+        revoked = cur.rowcount
+        if revoked == 0:
+            # Отозванная запись нужна как отметка для ссылок прежнего формата
+            cur.execute(
+                "INSERT INTO ShareTokens (token, folder_id, created_at, revoked) "
+                "VALUES (?, ?, ?, 1)",
+                (secrets.token_urlsafe(SHARE_TOKEN_BYTES), folder_id, int(time.time()))
+            )
+
+    cache.invalidate(("share", folder_id))
+    return revoked
+
+
+def legacy_links_revoked(folder_id: int) -> bool:
+    """
+    Проверяет, отзывал ли создатель ссылки на папку.
+    
+    Ссылку прежнего формата можно восстановить по id и имени папки, поэтому
+    после отзыва она для этой папки не принимается.
+    
+    Args:
+        folder_id: Идентификатор папки
+        
+    Returns:
+        bool: True, если у папки есть отозванные токены
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT 1 FROM ShareTokens WHERE folder_id = ? AND revoked = 1 LIMIT 1",
+            (folder_id,)
+        )
+        return cur.fetchone() is not None
+
+
+def get_full_parameters(folder_id: int) -> Optional[Tuple[str, int, int, str, str]]:
     """
     Получает все параметры папки по её ID.
     
@@ -226,16 +648,362 @@ def get_full_parameters(folder_id: int) -> List[Union[str, int]]:
         folder_id: Идентификатор папки
         
     Returns:
-        Список параметров папки: [name, autor_id, private_mode, next_vertices, head_text]
+        Кортеж параметров папки (name, autor_id, private_mode, next_vertices, head_text),
+        где next_vertices - дочерние элементы в формате "F:12;D:34";
+        None, если папка не найдена
     """
-    with sqlite3.connect(DB_PATH) as con:
+    with get_pool().connection() as con:
         cur = con.cursor()
         cur.execute(
-            "SELECT name, autor_id, private_mode, next_vertices, head_text "
-            "FROM Folders WHERE id = ?", 
+            "SELECT name, autor_id, private_mode, head_text FROM Folders WHERE id = ?", 
             (folder_id,)
         )
-        return cur.fetchone()
+        row = cur.fetchone()
+        if row is None:
+            return None
+        
+        name, autor_id, private_mode, head_text = row
+        return (name, autor_id, private_mode, ";".join(get_children(folder_id)), head_text)
+
+
+def _match_query(query: str) -> str:
+    """
+    Превращает текст пользователя в запрос FTS5: каждое слово ищется
+    как префикс ("отч год" найдет "Отчеты за 2023 год"), все слова обязательны.
+    Спецсимволы FTS5 в запрос не попадают.
+    """
+    words = re.findall(r"\w+", query.lower())[:SEARCH_MAX_TERMS]
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(chat_id: int, query: str, limit: int = PAGE_SIZE, offset: int = 0) -> List[Tuple[str, int, str, int]]:
+    """
+    Ищет папки и файлы по имени и тексту папки среди достижимых из корня пользователя.
+    
+    Совпадения берутся из индекса SearchIndex (FTS5), достижимые папки и
+    их файлы - одним рекурсивным запросом от корня; оба множества
+    пересекаются в SQL, а релевантность (bm25) сортирует только пересечение.
+    Для файла возвращается одна из содержащих его достижимых папок.
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        query: Текст запроса
+        limit: Количество результатов
+        offset: Сколько лучших результатов пропустить (для пагинации)
+        
+    Returns:
+        Список (тип 'F'/'D', id, имя, id папки для перехода) по убыванию
+        релевантности; пустой, если в запросе нет слов
+        
+    Raises:
+        ValueError: Если путь пользователя поврежден
+    """
+    match = _match_query(query)
+    if not match:
+        return []
+    root_id = int(sessions.get(chat_id).path[0].split(":")[1])
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        # Унарный плюс не дает планировщику использовать условие как индекс:
+        # иначе Edges читаются через idx_edges_child по всему типу, а FTS5
+        # проверяет совпадение отдельно для каждого rowid из множества
+        cur.execute(
+            "WITH RECURSIVE reach(id) AS ("
+            "  SELECT ?"
+            "  UNION"
+            "  SELECT e.child_id FROM reach r JOIN Edges e ON e.parent_id = r.id"
+            "  WHERE +e.child_type = 'F'"
+            "), "
+            "items(item) AS ("
+            "  SELECT 2 * id FROM reach"
+            "  UNION ALL"
+            "  SELECT 2 * e.child_id + 1 FROM reach r JOIN Edges e ON e.parent_id = r.id"
+            "  WHERE +e.child_type = 'D'"
+            "), "
+            "page(item, name, rank) AS ("
+            "  SELECT rowid, name, rank FROM SearchIndex"
+            "  WHERE SearchIndex MATCH ? AND +rowid IN (SELECT item FROM items)"
+            "  ORDER BY rank, rowid LIMIT ? OFFSET ?"
+            ") "
+            "SELECT CASE item % 2 WHEN 0 THEN 'F' ELSE 'D' END, item / 2, name, "
+            "CASE item % 2 WHEN 0 THEN item / 2 ELSE ("
+            "  SELECT MIN(e.parent_id) FROM Edges e"
+            "  WHERE e.child_type = 'D' AND e.child_id = item / 2 AND e.parent_id IN reach"
+            ") END "
+            "FROM page ORDER BY rank, item",
+            (root_id, match, limit, offset)
+        )
+        return cur.fetchall()
+
+
+def get_folder_path(chat_id: int, folder_id: int) -> List[str]:
+    """
+    Находит кратчайший путь от корня пользователя до папки.
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        folder_id: Идентификатор папки
+        
+    Returns:
+        Путь в формате ["U:1", "F:5", ...] (для set_navigation)
+        
+    Raises:
+        ValueError: Если путь пользователя поврежден
+        LookupError: Если папка недостижима из корня пользователя
+    """
+    root = sessions.get(chat_id).path[0]
+    root_id = int(root.split(":")[1])
+    if folder_id == root_id:
+        return [root]
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "WITH RECURSIVE reach(id) AS ("
+            "  SELECT ?"
+            "  UNION"
+            "  SELECT e.child_id FROM reach r JOIN Edges e ON e.parent_id = r.id"
+            "  WHERE +e.child_type = 'F' AND r.id != ?"
+            ") "
+            "SELECT e.parent_id, e.child_id FROM reach r JOIN Edges e ON e.parent_id = r.id "
+            "WHERE +e.child_type = 'F'",
+            (root_id, folder_id)
+        )
+        children: Dict[int, List[int]] = {}
+        for parent, child in cur.fetchall():
+            children.setdefault(parent, []).append(child)
+
+    # Обход в ширину по загруженному подграфу с запоминанием родителей
+    parents: Dict[int, int] = {root_id: root_id}
+    queue = [root_id]
+    for vertex in queue:
+        if vertex == folder_id:
+            break
+        for child in children.get(vertex, []):
+            if child not in parents:
+                parents[child] = vertex
+                queue.append(child)
+
+    if folder_id not in parents:
+        raise LookupError(f"Папка {folder_id} недоступна из корня чата {chat_id}")
+
+    path = []
+    vertex = folder_id
+    while vertex != root_id:
+        path.append(f"F:{vertex}")
+        vertex = parents[vertex]
+    path.append(root)
+    return path[::-1]
+
+
+@dataclass
+class FolderSnapshot:
+    """
+    Снимок данных для отрисовки папки: состояние навигации пользователя,
+    параметры текущей папки и дочерние элементы текущей страницы.
+    """
+    chat_id: int
+    path: List[str]
+    pages: List[int]
+    delete_mode: int
+    vertex_type: str
+    vertex_id: int
+    name: str
+    autor_id: int
+    private_mode: int
+    head_text: str
+    children_count: int
+    children: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def page(self) -> int:
+        """Текущая страница."""
+        return self.pages[-1]
+
+    @property
+    def cnt_page(self) -> int:
+        """Общее количество страниц."""
+        return ceil(self.children_count / PAGE_SIZE)
+
+
+def get_folder_snapshot(
+    chat_id: int,
+    change_page: int = 0,
+    with_children: bool = True
+) -> FolderSnapshot:
+    """
+    Получает все данные для отрисовки текущей папки пользователя
+    за постоянное число запросов (не зависит от размера папки).
+    
+    При with_children=True также исправляет номер страницы и сбрасывает режим
+    удаления для пустой папки (только в навигационной сессии). База не
+    меняется: ссылки на удаленные элементы пропускаются, а убирает их
+    фоновая очистка (см. collect_dangling_edges).
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        change_page: Изменение текущей страницы (для пагинации)
+        with_children: Загружать ли дочерние элементы текущей страницы
+        
+    Returns:
+        FolderSnapshot: Снимок текущей папки
+        
+    Raises:
+        ValueError: Если путь пользователя поврежден
+        LookupError: Если пользователь или текущая папка не найдены
+    """
+    session = sessions.get(chat_id)
+    path, pages, delete_mode = list(session.path), list(session.pages), session.delete_mode
+    vertex_type, vertex_id = session.vertex_type, session.folder_id
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+
+        # Поколение берется до запросов: сброс во время чтения не даст
+        # положить в кеш строки, прочитанные до изменения
+        generation = cache.generation(("folder", vertex_id))
+        found, folder = cache.get(("folder", vertex_id))
+        if not found:
+            # Считаются только ссылки на существующие элементы, как в запросе страницы
+            cur.execute(
+                "SELECT name, autor_id, private_mode, head_text, "
+                "(SELECT COUNT(*) FROM Edges e "
+                "LEFT JOIN Folders f ON e.child_type = 'F' AND f.id = e.child_id "
+                "LEFT JOIN Files d ON e.child_type = 'D' AND d.id = e.child_id "
+                "WHERE e.parent_id = Folders.id AND COALESCE(f.id, d.id) IS NOT NULL) "
+                "FROM Folders WHERE id = ?",
+                (vertex_id,)
+            )
+            folder = cur.fetchone()
+            if folder is None:
+                raise LookupError(f"Папка {vertex_id} не найдена")
+            cache.set(("folder", vertex_id), folder, generation)
+
+        snapshot = FolderSnapshot(
+            chat_id=chat_id,
+            path=path,
+            pages=pages,
+            delete_mode=delete_mode,
+            vertex_type=vertex_type,
+            vertex_id=vertex_id,
+            name=folder[0],
+            autor_id=folder[1],
+            private_mode=folder[2],
+            head_text=folder[3],
+            children_count=folder[4]
+        )
+        if not with_children:
+            return snapshot
+
+        # Номер страницы всегда в пределах [1, cnt_page]
+        page = min(max(pages[-1] + change_page, 1), max(snapshot.cnt_page, 1))
+        found, rows = cache.get(("children", vertex_id, page))
+        if not found:
+            cur.execute(
+                "SELECT e.position, e.child_type, e.child_id, COALESCE(f.name, d.name) "
+                "FROM Edges e "
+                "LEFT JOIN Folders f ON e.child_type = 'F' AND f.id = e.child_id "
+                "LEFT JOIN Files d ON e.child_type = 'D' AND d.id = e.child_id "
+                "WHERE e.parent_id = ? AND COALESCE(f.id, d.id) IS NOT NULL "
+                "ORDER BY e.position LIMIT ? OFFSET ?",
+                (vertex_id, PAGE_SIZE, (page - 1) * PAGE_SIZE)
+            )
+            rows = cur.fetchall()
+            cache.set(("children", vertex_id, page), rows, generation)
+
+        # Ссылки на удаленные элементы не показываются и не считаются - их
+        # убирает фоновая очистка (collect_dangling_edges), отрисовка базу не меняет
+        snapshot.children = [(f"{type_}:{id_}", name) for _, type_, id_, name in rows]
+
+    # Навигация меняется только в памяти (см. database.sessions)
+    if page != pages[-1]:
+        pages[-1] = page
+        sessions.update(chat_id, pages=pages)
+
+    # Сбрасываем режим удаления если нет элементов
+    if snapshot.children_count == 0 and delete_mode:
+        snapshot.delete_mode = 0
+        sessions.update(chat_id, delete_mode=0)
+
+    return snapshot
+
+
+def reset_navigation(chat_id: int) -> None:
+    """
+    Возвращает пользователя в корневую папку (при поврежденном пути).
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+    """
+    try:
+        root = sessions.get(chat_id).path[0]
+    except ValueError:
+        # Путь в базе поврежден - исправляем строку Users напрямую
+        root = get_value_db("Users", "path", chat_id).split("\\")[0]
+        set_value_db("Users", "path", chat_id, root)
+        set_value_db("Users", "pages", chat_id, "1")
+        return
+
+    sessions.update(chat_id, path=[root], pages=[1])
+
+
+def set_navigation(
+    chat_id: int,
+    path: Optional[List[str]] = None,
+    pages: Optional[List[int]] = None,
+    delete_mode: Optional[int] = None
+) -> None:
+    """
+    Изменяет навигационное состояние пользователя (без синхронной записи в базу).
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        path: Новый путь в формате ["U:1", "F:5", ...]
+        pages: Новый стек страниц
+        delete_mode: Новый режим удаления
+    """
+    sessions.update(chat_id, path=path, pages=pages, delete_mode=delete_mode)
+
+
+def get_session(chat_id: int) -> Session:
+    """Возвращает навигационную сессию пользователя."""
+    return sessions.get(chat_id)
+
+
+def track_messages(chat_id: int, message_ids: List[int]) -> None:
+    """
+    Запоминает id сообщений чата для последующей очистки (без записи в базу).
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        message_ids: Id отправленных или полученных сообщений
+    """
+    sessions.add_messages(chat_id, message_ids)
+
+
+def take_messages(chat_id: int, keep: List[int]) -> List[int]:
+    """
+    Забирает запомненные id сообщений чата, кроме оставляемых.
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        keep: Id сообщений, которые нужно оставить
+        
+    Returns:
+        List[int]: Id сообщений для удаления
+    """
+    return sessions.take_messages(chat_id, keep)
+
+
+def flush_sessions() -> int:
+    """
+    Записывает измененные навигационные сессии в базу.
+    
+    Returns:
+        int: Количество записанных сессий
+    """
+    return sessions.flush()
 
 
 def create_user(chat_id: int, chat_type: str, name: str) -> int:
@@ -252,7 +1020,7 @@ def create_user(chat_id: int, chat_type: str, name: str) -> int:
     """
     private_mode = 1 if chat_type == "private" else 0
 
-    with sqlite3.connect(DB_PATH) as con:
+    with get_pool().connection() as con:
         cur = con.cursor()
         cur.execute(
             "INSERT INTO Folders (name, autor_id, private_mode) "
@@ -291,14 +1059,11 @@ def create(
     Returns:
         int: ID созданного объекта
     """
-    vertex_id = int(get_value_db("Users", "path", chat_id).split("\\")[-1].split(":")[-1])
-
-    next_vertices = get_value_db("Folders", "next_vertices", vertex_id).split(";")
-    next_vertices = [] if next_vertices[0] == "" else next_vertices
+    vertex_id = sessions.get(chat_id).folder_id
 
     cnt_users = get_value_db("Folders", "count_of_users", vertex_id) if lvl == "fold" else None
 
-    with sqlite3.connect(DB_PATH) as con:
+    with get_pool().connection() as con:
         cur = con.cursor()
         if lvl == "fold":
             cur.execute(
@@ -312,17 +1077,49 @@ def create(
                 (file_id, name, file_type)
             )
         last_row_id = cur.lastrowid
-    
-    set_value_db(
-        "Folders", 
-        "next_vertices", 
-        vertex_id, 
-        ";".join([*next_vertices, f"{'F' if lvl == 'fold' else 'D'}:{last_row_id}"])
-    )
-    
+        _append_edge(cur, vertex_id, "F" if lvl == "fold" else "D", last_row_id)
+
+    _invalidate_folders(vertex_id)
     return last_row_id
 
 
+def create_files(chat_id: int, files: List[Tuple[str, str, str]]) -> List[int]:
+    """
+    Создает несколько файлов в текущей папке пользователя одной транзакцией
+    (например, альбом): вставки в Files и один executemany в Edges.
+    
+    Args:
+        chat_id: Идентификатор чата пользователя
+        files: Файлы в порядке добавления [(file_id, имя, тип файла), ...]
+        
+    Returns:
+        List[int]: ID созданных файлов
+    """
+    if not files:
+        return []
+    vertex_id = sessions.get(chat_id).folder_id
+
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        # id выдает SQLite: ничего не читаем до первой вставки, которая и
+        # берет блокировку записи (иначе воркер между чтением MAX(id) и
+        # вставкой мог занять те же id). Позиции считаются в той же
+        # инструкции INSERT, уже под блокировкой
+        ids = []
+        for file in files:
+            cur.execute("INSERT INTO Files (file_id, name, file_type) VALUES (?, ?, ?)", file)
+            ids.append(cur.lastrowid)
+
+        cur.executemany(
+            "INSERT INTO Edges (parent_id, child_type, child_id, position) "
+            "SELECT ?, 'D', ?, COALESCE(MAX(position), 0) + 1 FROM Edges WHERE parent_id = ?",
+            [(vertex_id, id_, vertex_id) for id_ in ids]
+        )
+
+    _invalidate_folders(vertex_id)
+    return ids
+
+
 def add_folder(chat_id: int, new_vertex_type: str, new_vertex_id: int) -> None:
     """
     Добавляет существующую папку в текущую директорию пользователя.
@@ -333,29 +1130,28 @@ def add_folder(chat_id: int, new_vertex_type: str, new_vertex_id: int) -> None:
         new_vertex_id: ID добавляемой вершины
         
     Raises:
+        TypeError: Если добавляемой папки не существует
         KeyError: При попытке добавить папку, которая создаст цикл
+        ValueError: Если будет превышена максимальная глубина вложенности
     """
-    vertex_type, vertex_id = get_value_db("Users", "path", chat_id).split("\\")[-1].split(":")
-    vertex_id = int(vertex_id)
+    path = sessions.get(chat_id).path
+    vertex_id = int(path[-1].split(":")[-1])
+    path_id = [int(ids.split(":")[-1]) for ids in path]
 
-    path_id = [
-        int(ids.split(":")[-1]) 
-        for ids in get_value_db("Users", "path", chat_id).split("\\")
-    ]
+    # Несуществующая папка: fetchone() вернет None, как и раньше - TypeError
+    get_value_db("Folders", "id", new_vertex_id)
     
-    if not cycle_BFS([new_vertex_id], path_id):
+    found, depth = reachability([new_vertex_id], path_id, len(path_id))
+    if found:
         raise KeyError("You cannot add the same folder to a folder")
+    if depth > MAX_DEPTH:
+        raise ValueError(f"Folder nesting depth exceeds {MAX_DEPTH}")
 
-    next_vertices = get_value_db("Folders", "next_vertices", vertex_id).split(";")
-    next_vertices = [] if next_vertices[0] == "" else next_vertices
+    with get_pool().connection() as con:
+        _append_edge(con.cursor(), vertex_id, "F", new_vertex_id)
+        change_cnt_DFS(new_vertex_type, new_vertex_id, 1)
 
-    set_value_db(
-        "Folders", 
-        "next_vertices", 
-        vertex_id, 
-        ";".join([*next_vertices, f"F:{new_vertex_id}"])
-    )
-    change_cnt_DFS(new_vertex_type, new_vertex_id, 1)
+    _invalidate_folders(vertex_id)
 
     
 def delete(chat_id: int, vertex: str) -> None:
@@ -365,19 +1161,33 @@ def delete(chat_id: int, vertex: str) -> None:
     Args:
         chat_id: Идентификатор чата пользователя
         vertex: Строка с типом и ID удаляемого объекта (формат "тип:id")
+        
+    Raises:
+        ValueError: Если элемента нет в текущей директории
     """
     vertex_type, vertex_id = vertex.split(":")
-    delete_id = delete_DFS(vertex_type, int(vertex_id), chat_id)
-    
-    id_ = get_value_db("Users", "path", chat_id).split("\\")[-1].split(":")[-1]
-    next_vertices = get_value_db("Folders", "next_vertices", id_).split(";")
-    next_vertices = [] if next_vertices[0] == "" else next_vertices
-    
-    next_vertices.remove(vertex)
-    set_value_db("Folders", "next_vertices", id_, ";".join(next_vertices))
+    vertex_id = int(vertex_id)
 
-    with sqlite3.connect(DB_PATH) as con:
+    # Все удаления и изменения счетчиков - в одной транзакции
+    with get_pool().connection() as con:
         cur = con.cursor()
+        parent_id = sessions.get(chat_id).folder_id
+        delete_id = delete_DFS(vertex_type, vertex_id, chat_id)
+
+        # Убираем первое вхождение элемента из текущей папки
+        cur.execute(
+            "DELETE FROM Edges WHERE parent_id = ? AND position = ("
+            "SELECT MIN(position) FROM Edges "
+            "WHERE parent_id = ? AND child_type = ? AND child_id = ?)",
+            (parent_id, parent_id, vertex_type, vertex_id)
+        )
+        if cur.rowcount == 0:
+            raise ValueError(f"{vertex} нет в папке {parent_id}")
+
+        cur.executemany(
+            'DELETE FROM Edges WHERE parent_id = ?', 
+            [(id,) for id in delete_id["F"]]
+        )
         cur.executemany(
             'DELETE FROM Folders WHERE id = ?', 
             [(id,) for id in delete_id["F"]]
@@ -386,6 +1196,129 @@ def delete(chat_id: int, vertex: str) -> None:
             'DELETE FROM Files WHERE id = ?', 
             [(id,) for id in delete_id["D"]]
         )
+        cur.executemany(
+            'DELETE FROM ShareTokens WHERE folder_id = ?', 
+            [(id,) for id in delete_id["F"]]
+        )
+        change_cnt_DFS("F", delete_id["change_cnt"], -1)
+
+    _invalidate_folders(parent_id, *delete_id["F"])
+    cache.invalidate(*(("file", id_) for id_ in delete_id["D"]))
+    cache.invalidate(*(("share", id_) for id_ in delete_id["F"]))
+
+def collect_dangling_edges(after_id: int, limit: int) -> Tuple[Optional[int], int]:
+    """
+    Удаляет ребра, ведущие к удаленным папкам и файлам или из удаленных папок,
+    для следующей пачки папок (по возрастанию id).
+    
+    Args:
+        after_id: Последний id папки, обработанный предыдущим вызовом (0 - с начала)
+        limit: Количество папок в пачке
+        
+    Returns:
+        Кортеж (id, с которого продолжать, или None если проход закончен;
+        количество удаленных ребер)
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM Folders WHERE id > ? ORDER BY id LIMIT ?)",
+            (after_id, limit)
+        )
+        last_id = cur.fetchone()[0]
+
+        # Диапазон (after_id, last_id] захватывает и ребра удаленных папок между id;
+        # последний проход - до конца таблицы
+        cur.execute(
+            "SELECT e.parent_id, e.position FROM Edges e "
+            "LEFT JOIN Folders p ON p.id = e.parent_id "
+            "LEFT JOIN Folders f ON e.child_type = 'F' AND f.id = e.child_id "
+            "LEFT JOIN Files d ON e.child_type = 'D' AND d.id = e.child_id "
+            "WHERE e.parent_id > ? AND (? IS NULL OR e.parent_id <= ?) "
+            "AND (p.id IS NULL OR (f.id IS NULL AND d.id IS NULL))",
+            (after_id, last_id, last_id)
+        )
+        dangling = cur.fetchall()
+        cur.executemany("DELETE FROM Edges WHERE parent_id = ? AND position = ?", dangling)
+
+    if dangling:
+        _invalidate_folders(*(parent_id for parent_id, _ in dangling))
+    return last_id, len(dangling)
+
+
+def collect_orphan_files(after_id: int, limit: int) -> Tuple[Optional[int], int]:
+    """
+    Удаляет файлы следующей пачки (по возрастанию id), на которые не ссылается ни одна папка.
+    
+    Args:
+        after_id: Последний id файла, обработанный предыдущим вызовом (0 - с начала)
+        limit: Количество файлов в пачке
+        
+    Returns:
+        Кортеж (id, с которого продолжать, или None если проход закончен;
+        количество удаленных файлов)
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM Files WHERE id > ? ORDER BY id LIMIT ?)",
+            (after_id, limit)
+        )
+        last_id = cur.fetchone()[0]
+        if last_id is None:
+            return None, 0
+
+        cur.execute(
+            "SELECT d.id FROM Files d WHERE d.id > ? AND d.id <= ? AND NOT EXISTS ("
+            "SELECT 1 FROM Edges e WHERE e.child_type = 'D' AND e.child_id = d.id)",
+            (after_id, last_id)
+        )
+        orphans = [(id_,) for id_, in cur.fetchall()]
+        cur.executemany("DELETE FROM Files WHERE id = ?", orphans)
+
+    cache.invalidate(*(("file", id_) for id_, in orphans))
+    return last_id, len(orphans)
+
+
+def collect_dead_folders(after_id: int, limit: int) -> Tuple[Optional[int], int]:
+    """
+    Удаляет папки следующей пачки (по возрастанию id) с count_of_users <= 0,
+    на которые не ссылается ни одна папка и которые не являются корнем пользователя.
+    
+    Вместе с папкой удаляются ее ребра и токены ссылок. Ее подпапки и файлы,
+    оставшиеся без ссылок, удаляются следующими проходами очистки.
+    
+    Args:
+        after_id: Последний id папки, обработанный предыдущим вызовом (0 - с начала)
+        limit: Количество папок в пачке
+        
+    Returns:
+        Кортеж (id, с которого продолжать, или None если проход закончен;
+        количество удаленных папок)
+    """
+    with get_pool().connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM Folders WHERE id > ? ORDER BY id LIMIT ?)",
+            (after_id, limit)
+        )
+        last_id = cur.fetchone()[0]
+        if last_id is None:
+            return None, 0
+
+        # Корень - первый элемент Users.path ("U:id" или "U:id\..."): поиск по idx_users_path
+        cur.execute(
+            "SELECT f.id FROM Folders f WHERE f.id > ? AND f.id <= ? AND f.count_of_users <= 0 "
+            "AND NOT EXISTS (SELECT 1 FROM Edges e WHERE e.child_type = 'F' AND e.child_id = f.id) "
+            "AND NOT EXISTS (SELECT 1 FROM Users u WHERE u.path = 'U:' || f.id "
+            "OR (u.path > 'U:' || f.id || '\\' AND u.path < 'U:' || f.id || ']'))",
+            (after_id, last_id)
+        )
+        dead = [(id_,) for id_, in cur.fetchall()]
+        cur.executemany("DELETE FROM Edges WHERE parent_id = ?", dead)
+        cur.executemany("DELETE FROM Folders WHERE id = ?", dead)
+        cur.executemany("DELETE FROM ShareTokens WHERE folder_id = ?", dead)
 
-    for id_ in delete_id["change_cnt"]:
-        change_cnt_DFS("F", id_, -1)
\ No newline at end of file
+    _invalidate_folders(*(id_ for id_, in dead))
+    cache.invalidate(*(("share", id_) for id_, in dead))
+    return last_id, len(dead)
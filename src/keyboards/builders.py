@@ -1,12 +1,15 @@
+from functools import lru_cache
+
 from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardMarkup
 )
-import database.сore as core
 import texts.messages as messages
-from math import ceil
+
+# Сколько разных клавиатур навигации хранить в кеше
+START_KB_CACHE_SIZE = 4096
 
 
 def inline_start_kb(
@@ -16,11 +19,17 @@ def inline_start_kb(
     vertex_type: str,
     private_mode: int,
     delete_mode: bool,
-    next_vertices: list[str]
+    children: list[tuple[str, str]],
+    page: int,
+    cnt_page: int
 ) -> InlineKeyboardMarkup:
     """
     Создает инлайн-клавиатуру для навигации по папкам и файлам.
     
+    Клавиатуры кешируются по всем параметрам: страница папки, которая не
+    менялась, повторно не строится. Возвращаемый объект общий - его
+    нельзя изменять.
+    
     Args:
         chat_id: ID чата пользователя
         autor_id: ID автора текущей папки
@@ -28,26 +37,46 @@ def inline_start_kb(
         vertex_type: Тип текущей вершины ('U' - пользователь, 'F' - папка, 'D' - файл)
         private_mode: Режим приватности (0/1)
         delete_mode: Флаг режима удаления
-        next_vertices: Список дочерних элементов в формате ["тип:id", ...]
+        children: Элементы текущей страницы в формате [("тип:id", имя), ...]
+        page: Текущая страница
+        cnt_page: Общее количество страниц
         
     Returns:
         InlineKeyboardMarkup: Объект клавиатуры для Telegram бота
     """
-    # Получаем информацию о текущей странице
-    pages = [
-        int(page) 
-        for page in core.get_value_db("Users", "pages", chat_id).split("\\")
-    ]
-    cnt_page = ceil(len(next_vertices) / 10)  # Общее количество страниц
-    page = pages[-1]  # Текущая страница
+    # Клавиатура зависит от chat_id только через авторство - так
+    # одинаковые страницы общих папок разделяются между пользователями
+    return _inline_start_kb(
+        autor_id == chat_id,
+        chat_type,
+        vertex_type,
+        private_mode,
+        bool(delete_mode),
+        tuple(children),
+        page,
+        cnt_page
+    )
+
 
+@lru_cache(maxsize=START_KB_CACHE_SIZE)
+def _inline_start_kb(
+    is_author: bool,
+    chat_type: str,
+    vertex_type: str,
+    private_mode: int,
+    delete_mode: bool,
+    children: tuple[tuple[str, str], ...],
+    page: int,
+    cnt_page: int
+) -> InlineKeyboardMarkup:
+    """Строит клавиатуру навигации (см. inline_start_kb)."""
     kb = []  # Будущая клавиатура
 
     # Обработка случая, когда нет элементов
     if cnt_page == 0:
         # Кнопки для пустой папки
         if (chat_type == "private" and 
-            ((private_mode == 1 and autor_id == chat_id) or private_mode == 0)):
+            ((private_mode == 1 and is_author) or private_mode == 0)):
             kb += [
                 [InlineKeyboardButton(
                     text="Изменить текст папки", 
@@ -70,52 +99,14 @@ def inline_start_kb(
 
         return InlineKeyboardMarkup(inline_keyboard=kb)
 
-    # Корректировка номера страницы, если он некорректен
-    if page < 1:
-        pages[-1] = 1
-        core.set_value_db(
-            "Users", 
-            "pages", 
-            chat_id, 
-            "\\".join(str(p) for p in pages)
-        )
-        page = 1
-
-    # Вычисляем диапазон элементов для текущей страницы
-    start = (page - 1) * 10
-    stop = min(len(next_vertices), start + 10)
-
-    # Дополнительная проверка на выход за границы
-    while start >= stop:
-        pages[-1] -= 1
-        core.set_value_db(
-            "Users", 
-            "pages", 
-            chat_id, 
-            "\\".join(str(p) for p in pages)
-        )
-        page -= 1
-        start = (page - 1) * 10
-        stop = min(len(next_vertices), start + 10)
-
     # Добавляем кнопки для элементов текущей страницы
-    for ind in range(start, stop):
-        try:
-            vert_type, vert_id = next_vertices[ind].split(":")
-            vert_id = int(vert_id)
-            
-            # Получаем имя папки/файла
-            table = "Folders" if vert_type == "F" else "Files"
-            name = core.get_value_db(table, "name", vert_id)
-            
-            kb.append([
-                InlineKeyboardButton(
-                    text=name,
-                    callback_data=next_vertices[ind]
-                )
-            ])
-        except Exception:
-            continue  # Пропускаем некорректные элементы
+    for vertex, name in children:
+        kb.append([
+            InlineKeyboardButton(
+                text=name,
+                callback_data=vertex
+            )
+        ])
 
     # Добавляем пагинацию
     kb += [
@@ -128,8 +119,15 @@ def inline_start_kb(
 
     # Добавляем дополнительные кнопки в зависимости от режима
     if not delete_mode:
+        kb += [
+            [InlineKeyboardButton(
+                text="Отправить все файлы", 
+                callback_data="send_all"
+            )]
+        ]
+
         if (chat_type == "private" and 
-            ((private_mode == 1 and autor_id == chat_id) or private_mode == 0)):
+            ((private_mode == 1 and is_author) or private_mode == 0)):
             kb += [
                 [
                     InlineKeyboardButton(
@@ -167,6 +165,50 @@ def inline_start_kb(
     )
 
 
+def inline_send_all_kb() -> InlineKeyboardMarkup:
+    """
+    Создает инлайн-клавиатуру для сообщения о ходе отправки файлов папки.
+    
+    Returns:
+        InlineKeyboardMarkup: Клавиатура с кнопкой отмены
+    """
+    kb = [
+        [InlineKeyboardButton(text="Отменить отправку", callback_data="send_all_cancel")]
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
+def inline_search_kb(hits: list[tuple[str, int, str, int]], page: int) -> InlineKeyboardMarkup:
+    """
+    Создает инлайн-клавиатуру страницы результатов поиска.
+    
+    Args:
+        hits: Результаты страницы в формате [(тип, id, имя, id папки), ...]
+        page: Текущая страница
+        
+    Returns:
+        InlineKeyboardMarkup: Кнопки перехода в папки результатов и пагинация
+    """
+    kb = [
+        [InlineKeyboardButton(
+            text=f"{'📁' if type_ == 'F' else '📄'} {name}",
+            callback_data=f"search_open:{folder_id}"
+        )]
+        for type_, _, name, folder_id in hits
+    ]
+
+    kb += [
+        [
+            InlineKeyboardButton(text="<<", callback_data=f"search_page:{page - 1}"),
+            InlineKeyboardButton(text=f"{page}", callback_data="search_view"),
+            InlineKeyboardButton(text=">>", callback_data=f"search_page:{page + 1}")
+        ]
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
 def reply_choose_private_kb() -> ReplyKeyboardMarkup:
     """
     Создает reply-клавиатуру для выбора типа папки (приватная/публичная).
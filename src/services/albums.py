@@ -0,0 +1,105 @@
+"""
+Сборка альбомов из входящих сообщений.
+
+Telegram присылает альбом (до 10 фото, видео, документов или аудио)
+отдельными сообщениями с общим media_group_id. Раньше каждое из них
+сохранялось отдельной транзакцией и получало свой ответ "N медиа
+добавлено". Теперь сообщения альбома копятся, пока не пройдет window
+секунд без новых частей, и передаются обработчику одним списком.
+
+Обработчик сообщения сразу возвращает управление: иначе при
+последовательной обработке обновлений одного чата (sharding.ChatSequencer)
+следующие части альбома ждали бы окончания окна.
+
+Каждой части при поступлении присваивается номер (для имен файлов без
+имени): его резервирует вызывающий код, пока окно еще открыто, поэтому
+одиночные файлы и другие альбомы, пришедшие за это время, не получат
+те же номера.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+AlbumHandler = Callable[[List[Message], List[int], FSMContext], Awaitable[None]]
+
+
+class _Album:
+    """Части одного альбома с их номерами и время прихода последней."""
+
+    def __init__(self, state: FSMContext) -> None:
+        self.state = state
+        self.parts: List[Tuple[Message, int]] = []
+        self.updated = time.monotonic()
+
+
+class AlbumCollector:
+    """Копит сообщения с общим media_group_id и передает их обработчику пачкой."""
+
+    def __init__(self, handler: AlbumHandler, window: float = 0.5) -> None:
+        """
+        Args:
+            handler: Обработчик альбома (сообщения в порядке message_id, их номера и FSM чата)
+            window: Сколько секунд ждать следующую часть альбома
+        """
+        self.handler = handler
+        self.window = window
+        self._albums: Dict[Tuple[int, str], _Album] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.albums = 0
+        self.messages = 0
+
+    def add(self, message: Message, state: FSMContext, number: int) -> None:
+        """
+        Добавляет часть альбома (message.media_group_id не пустой).
+
+        Args:
+            message: Часть альбома
+            state: FSM чата
+            number: Зарезервированный за частью номер
+        """
+        key = (message.chat.id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = _Album(state)
+            task = asyncio.create_task(self._flush(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        album.parts.append((message, number))
+        album.updated = time.monotonic()
+        self.messages += 1
+
+    async def _flush(self, key: Tuple[int, str]) -> None:
+        """Дожидается конца альбома и вызывает обработчик."""
+        album = self._albums[key]
+        while (wait := album.updated + self.window - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+        del self._albums[key]
+
+        self.albums += 1
+        parts = sorted(album.parts, key=lambda part: part[0].message_id)
+        try:
+            await self.handler(
+                [message for message, _ in parts],
+                [number for _, number in parts],
+                album.state
+            )
+        except Exception as ex:
+            print(f"Ошибка обработки альбома {key[1]} в чате {key[0]}: {ex}")
+
+    async def close(self) -> None:
+        """Дожидается обработки накопленных альбомов (при остановке бота)."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: обработанные альбомы, их части и ожидающие альбомы."""
+        return {
+            "albums": self.albums,
+            "messages": self.messages,
+            "pending": len(self._albums),
+        }
@@ -0,0 +1,168 @@
+"""
+Очистка приватного чата от старых сообщений.
+
+Раньше при каждом /start бот перебирал id сообщений от текущего до 1 и
+удалял их по одному (delete_message), останавливаясь на первой ошибке.
+Теперь бот запоминает id сообщений, которые реально появились в чате
+(отправленные ботом и входящие), и удаляет их пачками по 100 методом
+deleteMessages в фоне, не задерживая обработчик.
+
+Запомненные id хранятся в навигационной сессии пользователя и
+записываются в Users.messages_id вместе с ней (см. database.sessions).
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set
+
+import database.async_core as acore
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message, TelegramObject
+
+# Максимум id в одном вызове deleteMessages (ограничение Bot API)
+MAX_BATCH_SIZE = 100
+
+
+class ChatCleaner:
+    """Пакетное удаление запомненных сообщений с ограничением параллельности."""
+
+    def __init__(self, bot: Bot, concurrency: int = 4, batch_size: int = MAX_BATCH_SIZE) -> None:
+        """
+        Args:
+            bot: Экземпляр бота
+            concurrency: Максимум одновременных вызовов deleteMessages
+            batch_size: Id сообщений в одном вызове (не больше 100)
+        """
+        self.bot = bot
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.cleanups = 0
+        self.deleted = 0
+        self.calls = 0
+        self.failed_calls = 0
+
+    async def track(self, chat_id: int, message_ids: Iterable[int]) -> None:
+        """Запоминает сообщения чата (чаты без пользователя в базе пропускаются)."""
+        try:
+            await acore.track_messages(chat_id, list(message_ids))
+        except (LookupError, ValueError):
+            pass
+
+    def schedule(self, chat_id: int, keep: Iterable[int] = ()) -> None:
+        """
+        Запускает очистку чата в фоне.
+
+        Args:
+            chat_id: Идентификатор чата
+            keep: Id сообщений, которые нужно оставить (например, новое меню)
+        """
+        task = asyncio.create_task(self.cleanup(chat_id, keep))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def cleanup(self, chat_id: int, keep: Iterable[int] = ()) -> int:
+        """
+        Удаляет все запомненные сообщения чата, кроме keep.
+
+        Returns:
+            int: Количество вызовов deleteMessages
+        """
+        try:
+            message_ids = await acore.take_messages(chat_id, list(keep))
+        except (LookupError, ValueError):
+            return 0
+        if not message_ids:
+            return 0
+
+        batches = [
+            message_ids[i:i + self.batch_size]
+            for i in range(0, len(message_ids), self.batch_size)
+        ]
+        await asyncio.gather(*(self._delete_batch(chat_id, batch) for batch in batches))
+
+        self.cleanups += 1
+        self.deleted += len(message_ids)
+        return len(batches)
+
+    async def _delete_batch(self, chat_id: int, message_ids: List[int]) -> None:
+        """Удаляет одну пачку сообщений."""
+        async with self._semaphore:
+            self.calls += 1
+            try:
+                await self.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+            except TelegramAPIError as ex:
+                # Недоступные сообщения повторно не удаляем - id уже забыты
+                self.failed_calls += 1
+                print(f"Ошибка очистки чата {chat_id}: {ex}")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Возвращает счетчики очистки.
+
+        calls_saved - сколько вызовов сэкономлено по сравнению с удалением
+        каждого сообщения отдельным delete_message.
+        """
+        return {
+            "cleanups": self.cleanups,
+            "deleted": self.deleted,
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "calls_saved": self.deleted - self.calls,
+            "pending": len(self._tasks),
+        }
+
+    async def close(self) -> None:
+        """Дожидается завершения фоновых очисток (при остановке бота)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class OutgoingMessagesMiddleware(BaseRequestMiddleware):
+    """Запоминает сообщения, отправленные ботом в приватные чаты."""
+
+    def __init__(self, cleaner: ChatCleaner) -> None:
+        self.cleaner = cleaner
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # Несмотря на аннотацию Response, по цепочке возвращается уже результат
+        # метода: sendMessage, sendPhoto... - Message, sendMediaGroup - список
+        result = await make_request(bot, method)
+        sent = result if isinstance(result, list) else [result]
+        sent = [
+            message for message in sent
+            if isinstance(message, Message) and message.chat.type == "private"
+        ]
+        if sent and type(method).__name__.startswith(("Send", "Forward", "Copy")):
+            await self.cleaner.track(sent[0].chat.id, [message.message_id for message in sent])
+        return result
+
+
+class IncomingMessagesMiddleware(BaseMiddleware):
+    """Запоминает входящие сообщения приватных чатов."""
+
+    def __init__(self, cleaner: ChatCleaner) -> None:
+        self.cleaner = cleaner
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Message) and event.chat.type == "private":
+            await self.cleaner.track(event.chat.id, [event.message_id])
+        return await handler(event, data)
@@ -0,0 +1,85 @@
+"""
+Фоновая очистка графа папок.
+
+Раньше отрисовка папки проверяла дочерние элементы текущей страницы и
+удаляла ссылки на несуществующие - поэтому каждый показ меню шел через
+поток-писатель. Теперь отрисовка только читает, а данные приводит в
+порядок Compactor: небольшими пачками по возрастанию id он по кругу
+- удаляет ребра к удаленным папкам и файлам и ребра удаленных папок;
+- удаляет файлы, на которые не ссылается ни одна папка;
+- удаляет папки с count_of_users <= 0 без входящих ссылок (не корни).
+
+Каждая пачка - отдельная короткая транзакция в потоке-писателе, между
+пачками - пауза interval, поэтому очистка не задерживает обработчики.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import database.async_core as acore
+
+# Шаг очистки: (id, после которого продолжать; размер пачки) -> (следующий id или None; удалено)
+Step = Callable[[int, int], Awaitable[Tuple[Optional[int], int]]]
+
+
+class Compactor:
+    """Инкрементальная очистка висячих ребер, файлов-сирот и мертвых папок."""
+
+    def __init__(self, batch_size: int = 500, interval: float = 1.0) -> None:
+        """
+        Args:
+            batch_size: Папок или файлов в одной пачке
+            interval: Пауза между пачками в секундах
+        """
+        self.batch_size = batch_size
+        self.interval = interval
+        self._steps: List[Tuple[str, Step]] = [
+            ("edges", acore.collect_dangling_edges),
+            ("files", acore.collect_orphan_files),
+            ("folders", acore.collect_dead_folders),
+        ]
+        self._phase = 0
+        self._after_id = 0
+
+        self.batches = 0
+        self.passes = 0
+        self.removed: Dict[str, int] = {name: 0 for name, _ in self._steps}
+
+    async def step(self) -> int:
+        """
+        Обрабатывает следующую пачку текущего шага очистки.
+
+        Returns:
+            int: Количество удаленных строк
+        """
+        name, step = self._steps[self._phase]
+        next_id, removed = await step(self._after_id, self.batch_size)
+        self.batches += 1
+        self.removed[name] += removed
+
+        if next_id is None:
+            # Шаг закончен - переходим к следующему, после последнего - новый проход
+            self._after_id = 0
+            self._phase = (self._phase + 1) % len(self._steps)
+            if self._phase == 0:
+                self.passes += 1
+        else:
+            self._after_id = next_id
+        return removed
+
+    async def run(self) -> None:
+        """Выполняет очистку по кругу (фоновая задача)."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.step()
+            except Exception as ex:
+                print(f"Ошибка фоновой очистки: {ex}")
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: пачки, полные проходы и удаленные строки по шагам."""
+        return {
+            "batches": self.batches,
+            "passes": self.passes,
+            **{f"removed_{name}": count for name, count in self.removed.items()},
+        }
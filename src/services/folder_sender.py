@@ -0,0 +1,214 @@
+"""
+Отправка всех файлов папки одной кнопкой.
+
+Раньше каждый файл нужно было открывать отдельно: нажатие - два запроса
+к базе и один sendPhoto/sendVideo/... Теперь файлы папки читаются одним
+запросом (core.get_folder_files), подряд идущие совместимые файлы
+собираются в альбомы sendMediaGroup по 10 штук, остальные отправляются
+по одному. Частоту запросов ограничивает services.scheduler.
+
+Отправка идет в фоне: обработчик нажатия сразу завершается, а в чате
+появляется сообщение с прогрессом и кнопкой отмены.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import keyboards.builders as builders
+import texts.messages as messages
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+
+# Максимум файлов в одном sendMediaGroup (ограничение Bot API)
+MAX_ALBUM_SIZE = 10
+# Как часто обновлять сообщение с прогрессом (секунды)
+PROGRESS_INTERVAL = 3.0
+
+# Типы, которые можно отправлять альбомом: фото и видео смешиваются,
+# документы и аудио группируются только с файлами своего типа
+_ALBUM_KINDS = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+_INPUT_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+# (telegram file_id, тип файла)
+FileRef = Tuple[str, str]
+
+
+def plan_batches(files: Sequence[FileRef]) -> List[List[FileRef]]:
+    """
+    Разбивает файлы на вызовы Bot API с сохранением порядка.
+
+    Args:
+        files: Файлы папки в порядке добавления
+
+    Returns:
+        Список пачек: пачка из нескольких файлов отправляется альбомом,
+        из одного - отдельным запросом
+    """
+    batches: List[List[FileRef]] = []
+    current: List[FileRef] = []
+    current_kind: Optional[str] = None
+
+    for file in files:
+        kind = _ALBUM_KINDS.get(file[1])
+        if current and (kind is None or kind != current_kind or len(current) == MAX_ALBUM_SIZE):
+            batches.append(current)
+            current = []
+        if kind is None:
+            batches.append([file])
+            current_kind = None
+            continue
+        current.append(file)
+        current_kind = kind
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def send_file(bot: Bot, chat_id: int, file_id: str, file_type: str) -> None:
+    """
+    Отправляет один файл методом, соответствующим его типу.
+
+    Raises:
+        ValueError: Если тип файла неизвестен
+    """
+    match file_type:
+        case "photo":
+            await bot.send_photo(chat_id=chat_id, photo=file_id)
+        case "video":
+            await bot.send_video(chat_id=chat_id, video=file_id)
+        case "document":
+            await bot.send_document(chat_id=chat_id, document=file_id)
+        case "audio":
+            await bot.send_audio(chat_id=chat_id, audio=file_id)
+        case "voice":
+            await bot.send_voice(chat_id=chat_id, voice=file_id)
+        case "sticker":
+            await bot.send_sticker(chat_id=chat_id, sticker=file_id)
+        case "video_note":
+            await bot.send_video_note(chat_id=chat_id, video_note=file_id)
+        case _:
+            raise ValueError(f"Неизвестный тип файла: {file_type}")
+
+
+class FolderSender:
+    """Фоновая отправка файлов папки: не больше одной отправки на чат."""
+
+    def __init__(self, bot: Bot) -> None:
+        """
+        Args:
+            bot: Экземпляр бота
+        """
+        self.bot = bot
+        self._jobs: Dict[int, asyncio.Task] = {}
+
+        self.started = 0
+        self.cancelled = 0
+        self.files = 0
+        self.calls = 0
+
+    def is_running(self, chat_id: int) -> bool:
+        """Идет ли отправка в чат."""
+        return chat_id in self._jobs
+
+    def start(self, chat_id: int, files: Sequence[FileRef]) -> bool:
+        """
+        Запускает отправку файлов в фоне.
+
+        Returns:
+            bool: False если в этот чат уже идет отправка
+        """
+        if chat_id in self._jobs:
+            return False
+        task = asyncio.create_task(self._send(chat_id, list(files)))
+        self._jobs[chat_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(chat_id, None))
+        self.started += 1
+        return True
+
+    def cancel(self, chat_id: int) -> bool:
+        """
+        Отменяет отправку в чат.
+
+        Returns:
+            bool: False если отправки не было
+        """
+        task = self._jobs.get(chat_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def _send(self, chat_id: int, files: List[FileRef]) -> None:
+        """Отправляет файлы пачками и обновляет сообщение с прогрессом."""
+        total = len(files)
+        progress = await self.bot.send_message(
+            chat_id=chat_id,
+            text=messages.send_all_progress_text(0, total),
+            reply_markup=builders.inline_send_all_kb()
+        )
+
+        sent = 0
+        shown = time.monotonic()
+        try:
+            for batch in plan_batches(files):
+                if len(batch) == 1:
+                    await send_file(self.bot, chat_id, *batch[0])
+                else:
+                    await self.bot.send_media_group(
+                        chat_id=chat_id,
+                        media=[_INPUT_MEDIA[file_type](media=file_id) for file_id, file_type in batch]
+                    )
+                sent += len(batch)
+                self.files += len(batch)
+                self.calls += 1
+
+                # Прогресс - не чаще PROGRESS_INTERVAL, чтобы не тратить лимит чата
+                if sent < total and time.monotonic() - shown >= PROGRESS_INTERVAL:
+                    await progress.edit_text(
+                        text=messages.send_all_progress_text(sent, total),
+                        reply_markup=builders.inline_send_all_kb()
+                    )
+                    shown = time.monotonic()
+            text = messages.send_all_done_text(total)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            text = messages.send_all_cancelled_text(sent, total)
+        except (TelegramAPIError, ValueError) as ex:
+            print(f"Ошибка отправки файлов в чат {chat_id}: {ex}")
+            text = messages.send_all_failed_text(sent, total)
+
+        try:
+            await progress.edit_text(text=text)
+        except TelegramAPIError:
+            pass
+
+    async def close(self) -> None:
+        """Отменяет все отправки (при остановке бота)."""
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: запущенные и отмененные отправки, файлы и вызовы Bot API."""
+        return {
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "running": len(self._jobs),
+            "files": self.files,
+            "calls": self.calls,
+        }
@@ -0,0 +1,412 @@
+"""
+Метрики бота в формате Prometheus.
+
+Собирается:
+- время обработки обновлений по обработчикам (гистограмма) и их ошибки;
+- вызовы функций database.сore: количество, время и ошибки по функциям;
+- на одно обновление: вызовы функций database.сore (вместе с вложенными),
+  выполненные запросы SQL и зафиксированные транзакции с изменениями;
+- запросы к Bot API по методам: количество, время, ошибки и ответы 429;
+- состояние пула соединений, кеша и очереди запросов к Bot API.
+
+Метрики отдаются по HTTP (GET /metrics) отдельным aiohttp-сервером.
+Все подключается функцией install только при METRICS_ENABLED=1: при
+выключенных метриках обработчики и функции базы не оборачиваются и
+не платят ничего.
+
+Отдельный формат без сторонних библиотек: нужны только счетчики и
+гистограммы, а зависимостей у бота немного.
+"""
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+# Границы корзин гистограмм времени (секунды)
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Границы корзин числа вызовов базы на одно обновление
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# (имя, {метка: значение}, значение)
+Sample = Tuple[str, Dict[str, str], float]
+# (имя, тип, описание, значения)
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """Строка одного значения в текстовом формате Prometheus."""
+    if labels:
+        pairs = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        name = f"{name}{{{pairs}}}"
+    if value == int(value):
+        return f"{name} {int(value)}"
+    return f"{name} {value}"
+
+
+class Counter:
+    """Счетчик с метками."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Увеличивает счетчик для значений меток labels."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            (self.name, dict(zip(self.labelnames, labels)), value)
+            for labels, value in sorted(items)
+        ]
+
+
+class Histogram:
+    """Гистограмма с метками (накопительные корзины, сумма и количество)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [количество по корзинам..., +Inf, сумма]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Добавляет наблюдение value для значений меток labels."""
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(labels, list(row)) for labels, row in self._values.items()]
+
+        result: List[Sample] = []
+        for labels, row in sorted(items):
+            base = dict(zip(self.labelnames, labels))
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                result.append((f"{self.name}_bucket", {**base, "le": le}, total))
+            result.append((f"{self.name}_sum", base, row[-1]))
+            result.append((f"{self.name}_count", base, total))
+        return result
+
+
+class Registry:
+    """Набор метрик и функций, собирающих значения в момент запроса."""
+
+    def __init__(self) -> None:
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help_: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, help_, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Добавляет функцию, возвращающую метрики на момент запроса."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        families: List[Family] = [
+            (metric.name, metric.kind, metric.help, metric.samples()) for metric in self._metrics
+        ]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as ex:
+                print(f"Ошибка сбора метрик: {ex}")
+
+        lines = []
+        for name, kind, help_, samples in families:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_format_sample(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram(
+    "bot_handler_seconds", "Время обработки обновления", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler",)
+)
+update_db_calls = registry.histogram(
+    "bot_update_db_calls", "Вызовов функций database.сore (вместе с вложенными) на одно обновление",
+    ("handler",), COUNT_BUCKETS
+)
+update_db_statements = registry.histogram(
+    "bot_update_db_statements", "Запросов SQL (execute/executemany) на одно обновление",
+    ("handler",), COUNT_BUCKETS
+)
+update_db_commits = registry.histogram(
+    "bot_update_db_commits", "Фиксаций транзакций с изменениями на одно обновление",
+    ("handler",), COUNT_BUCKETS
+)
+db_calls = registry.counter("bot_db_calls_total", "Вызовы функций database.сore", ("function",))
+db_errors = registry.counter("bot_db_errors_total", "Исключения в функциях database.сore", ("function",))
+db_seconds = registry.histogram("bot_db_seconds", "Время вызова функций database.сore", ("function",))
+api_requests = registry.counter("bot_api_requests_total", "Запросы к Bot API", ("method",))
+api_errors = registry.counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method",))
+api_flood_waits = registry.counter(
+    "bot_api_flood_waits_total", "Ответы 429 (retry_after) от Bot API", ("method",)
+)
+api_seconds = registry.histogram("bot_api_request_seconds", "Время запроса к Bot API", ("method",))
+
+# Счетчики базы текущего обновления [вызовы, запросы, фиксации]; копируются
+# в потоки database.async_core вместе с контекстом (изменяемый список - общий)
+_update_db: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar(
+    "update_db", default=None
+)
+
+
+class UpdateDbObserver:
+    """Считает запросы и фиксации пула соединений для текущего обновления."""
+
+    def statement(self) -> None:
+        counter = _update_db.get()
+        if counter is not None:
+            counter[1] += 1
+
+    def commit(self) -> None:
+        counter = _update_db.get()
+        if counter is not None:
+            counter[2] += 1
+
+
+def instrument_module(module: ModuleType, exclude: Iterable[str] = ()) -> List[str]:
+    """
+    Оборачивает публичные функции модуля подсчетом вызовов и времени.
+
+    Функции модуля вызывают друг друга через его глобальные имена, поэтому
+    учитываются и вложенные вызовы.
+
+    Args:
+        module: Модуль (database.сore)
+        exclude: Имена функций, которые не нужно оборачивать
+
+    Returns:
+        List[str]: Имена обернутых функций
+    """
+    wrapped = []
+    for name, func in list(vars(module).items()):
+        if (
+            name.startswith("_")
+            or name in exclude
+            or not inspect.isfunction(func)
+            or func.__module__ != module.__name__
+            or getattr(func, "__metrics__", False)
+        ):
+            continue
+
+        def make(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                counter = _update_db.get()
+                if counter is not None:
+                    counter[0] += 1
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    db_errors.inc(name)
+                    raise
+                finally:
+                    db_seconds.observe(time.perf_counter() - start, name)
+                    db_calls.inc(name)
+
+            wrapper.__metrics__ = True  # type: ignore[attr-defined]
+            return wrapper
+
+        setattr(module, name, make(name, func))
+        wrapped.append(name)
+    return wrapped
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время и ошибки обработчиков, вызовы, запросы и фиксации базы на одно обновление."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+
+        counter = [0, 0, 0]
+        token = _update_db.set(counter)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+            update_db_calls.observe(counter[0], name)
+            update_db_statements.observe(counter[1], name)
+            update_db_commits.observe(counter[2], name)
+            _update_db.reset(token)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Запросы к Bot API по методам: количество, время, ошибки, 429."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_flood_waits.inc(name)
+            raise
+        except TelegramAPIError:
+            api_errors.inc(name)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - start, name)
+            api_requests.inc(name)
+
+
+def stats_collector(
+    prefix: str,
+    stats: Callable[[], Dict[str, float]],
+    counters: Iterable[str] = ()
+) -> Callable[[], List[Family]]:
+    """
+    Превращает метод stats() компонента бота в метрики.
+
+    Args:
+        prefix: Префикс имен метрик (например, "bot_db_pool")
+        stats: Функция, возвращающая словарь счетчиков
+        counters: Ключи, которые только растут (остальные - gauge)
+    """
+    counters = set(counters)
+
+    def collect() -> List[Family]:
+        families = []
+        for key, value in stats().items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            kind = "counter" if key in counters else "gauge"
+            name = f"{prefix}_{key}" + ("_total" if kind == "counter" else "")
+            families.append((name, kind, f"{prefix}: {key}", [(name, {}, value)]))
+        return families
+
+    return collect
+
+
+def install(
+    dp: Dispatcher,
+    bot: Bot,
+    db_module: ModuleType,
+    db_exclude: Iterable[str] = ()
+) -> None:
+    """
+    Подключает сбор метрик к диспетчеру, сессии бота и модулю базы.
+
+    Middleware запросов регистрируется последним, поэтому учитывается
+    каждая реальная попытка запроса (после ожидания в очереди и повторов).
+    Учет запросов SQL подключается к пулам, созданным после вызова
+    (модуль базы передает db_module.observer в ConnectionPool).
+    """
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+    instrument_module(db_module, db_exclude)
+    db_module.observer = UpdateDbObserver()
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """GET /metrics."""
+    return web.Response(
+        text=registry.render(),
+        content_type="text/plain",
+        charset="utf-8"
+    )
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запускает HTTP-сервер метрик.
+
+    Returns:
+        web.AppRunner: Для остановки (runner.cleanup())
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return runner
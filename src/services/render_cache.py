@@ -0,0 +1,61 @@
+"""
+Запоминание последней отрисовки меню в каждом чате.
+
+send_start_message при каждом нажатии заново формировал текст и
+клавиатуру и вызывал edit_text, даже если меню не изменилось (например,
+повторное нажатие на ту же кнопку). Telegram отвечает на такой вызов
+ошибкой "message is not modified", а запрос расходует лимит чата.
+Теперь для каждого чата хранится отпечаток последнего отрисованного
+меню, и одинаковая отрисовка того же сообщения пропускается.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
+
+class RenderCache:
+    """Отпечатки последних отрисованных меню (LRU по чатам)."""
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        """
+        Args:
+            maxsize: Сколько чатов помнить
+        """
+        self.maxsize = maxsize
+        self._last: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+
+        self.skipped = 0
+        self.rendered = 0
+
+    @staticmethod
+    def fingerprint(*parts: Hashable) -> int:
+        """Отпечаток отрисовки (текст и параметры клавиатуры)."""
+        return hash(parts)
+
+    def is_same(self, chat_id: int, message_id: int, fingerprint: int) -> bool:
+        """Отрисовано ли в этом сообщении то же самое (тогда edit_text не нужен)."""
+        if self._last.get(chat_id) == (message_id, fingerprint):
+            self._last.move_to_end(chat_id)
+            self.skipped += 1
+            return True
+        return False
+
+    def remember(self, chat_id: int, message_id: int, fingerprint: int) -> None:
+        """Запоминает отрисованное меню чата."""
+        self._last[chat_id] = (message_id, fingerprint)
+        self._last.move_to_end(chat_id)
+        self.rendered += 1
+        if len(self._last) > self.maxsize:
+            self._last.popitem(last=False)
+
+    def forget(self, chat_id: int) -> None:
+        """Забывает меню чата (например, сообщение удалено)."""
+        self._last.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: отрисованные и пропущенные меню, число чатов."""
+        return {
+            "rendered": self.rendered,
+            "skipped": self.skipped,
+            "chats": len(self._last),
+        }
@@ -0,0 +1,275 @@
+"""
+Планировщик исходящих запросов к Bot API.
+
+Подключается к сессии бота как request middleware и пропускает запросы
+через два "ведра токенов": общее (ограничение Telegram около 30 сообщений
+в секунду на бота) и отдельное для каждого чата (около 1 сообщения в
+секунду в личном чате и 20 новых сообщений в минуту в группе;
+редактирование и удаление в группе идут только через общее ведро). Пока
+токенов нет, запросы ждут в очереди, откуда первыми выходят интерактивные (ответы на нажатия,
+редактирование меню, текст), затем отправка файлов, затем массовые
+операции (удаление сообщений, альбомы).
+
+Ответ 429 (TelegramRetryAfter) приостанавливает ведро чата (или общее,
+если запрос не относится к чату) на retry_after секунд, после чего
+запрос повторяется автоматически - обработчик просто дольше ждет.
+
+Запросы без чата (getUpdates, getMe, setWebhook...) проходят без очереди.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# Приоритеты (меньше - раньше)
+INTERACTIVE, MEDIA, BULK = 0, 1, 2
+
+_PRIORITIES: Dict[str, int] = {
+    "AnswerCallbackQuery": INTERACTIVE,
+    "EditMessageText": INTERACTIVE,
+    "EditMessageReplyMarkup": INTERACTIVE,
+    "SendMessage": INTERACTIVE,
+    "DeleteMessage": BULK,
+    "DeleteMessages": BULK,
+    "SendMediaGroup": BULK,
+}
+
+# Методы без chat_id, которые все равно расходуют общий лимит
+_GLOBAL_ONLY = {"AnswerCallbackQuery"}
+
+# Методы, на которые действует лимит группы (20 новых сообщений в минуту);
+# редактирование и удаление в группе ограничены только общим лимитом
+_GROUP_LIMITED = ("Send", "Forward", "Copy")
+
+ChatId = Union[int, str]
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst подряд."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - уже сейчас)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """Расходует токен (после проверки delay)."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Останавливает выдачу токенов (ответ 429)."""
+        self.paused_until = max(self.paused_until, now + seconds)
+        # После паузы доступен ровно один запрос, дальше - по rate
+        self.tokens = min(1, self.capacity)
+        self.updated = self.paused_until
+
+    def is_idle(self, now: float) -> bool:
+        """Ведро полное и не на паузе - его можно забыть."""
+        return now >= self.paused_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class RequestScheduler(BaseRequestMiddleware):
+    """Очередь исходящих запросов с общим и поканальным ограничением частоты."""
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        max_retries: int = 3,
+        max_chats: int = 10000
+    ) -> None:
+        """
+        Args:
+            global_rate: Запросов в секунду на весь бот
+            chat_rate: Запросов в секунду в личный чат
+            chat_burst: Сколько запросов в чат можно отправить подряд
+            group_rate: Запросов в секунду в группу (chat_id < 0)
+            max_retries: Повторов после ответа 429
+            max_chats: Сколько ведер чатов хранить (простаивающие забываются)
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: Dict[ChatId, TokenBucket] = {}
+
+        self._waiters: List[Tuple[int, int, Optional[ChatId], asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.granted = 0
+        self.delayed = 0
+        self.retries = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                now = time.monotonic()
+                for key in [key for key, value in self._chats.items() if value.is_idle(now)]:
+                    del self._chats[key]
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1 if is_group else self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: Optional[ChatId], priority: int) -> None:
+        """Дожидается разрешения на запрос."""
+        now = time.monotonic()
+        # Быстрый путь: очередь пуста и токены есть
+        if not self._waiters and self.global_bucket.delay(now) == 0 and (
+            chat_id is None or self._chat_bucket(chat_id).delay(now) == 0
+        ):
+            self._take(chat_id, now)
+            return
+
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), chat_id, future))
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        self.delayed += 1
+        self._wake.set()
+
+        start = time.monotonic()
+        await future
+        self.total_wait += time.monotonic() - start
+
+    def _take(self, chat_id: Optional[ChatId], now: float) -> None:
+        self.global_bucket.take(now)
+        if chat_id is not None:
+            self._chat_bucket(chat_id).take(now)
+        self.granted += 1
+
+    async def _dispatch(self) -> None:
+        """Выдает разрешения ожидающим запросам в порядке приоритета."""
+        while True:
+            if not self._waiters:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self.global_bucket.delay(now)
+            if wait == 0:
+                # Первый по приоритету запрос, чей чат не исчерпал лимит
+                ready = None
+                wait = float("inf")
+                for _, _, chat_id, future in sorted(self._waiters):
+                    if future.cancelled():
+                        continue
+                    chat_wait = 0.0 if chat_id is None else self._chat_bucket(chat_id).delay(now)
+                    if chat_wait == 0:
+                        ready = (chat_id, future)
+                        break
+                    wait = min(wait, chat_wait)
+
+                self._waiters = [item for item in self._waiters if not item[3].cancelled()]
+                if ready is not None:
+                    chat_id, future = ready
+                    self._waiters = [item for item in self._waiters if item[3] is not future]
+                    heapq.heapify(self._waiters)
+                    self._take(chat_id, now)
+                    future.set_result(None)
+                    continue
+                heapq.heapify(self._waiters)
+                if not self._waiters:
+                    continue
+
+            # Ждем токен или новый запрос (он может быть в другом чате)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None and name not in _GLOBAL_ONLY:
+            return await make_request(bot, method)
+
+        # Ведро чата, через которое проходит запрос (None - только общее)
+        bucket_chat = chat_id
+        is_group = isinstance(chat_id, str) or (chat_id is not None and chat_id < 0)
+        if is_group and not name.startswith(_GROUP_LIMITED):
+            bucket_chat = None
+
+        priority = _PRIORITIES.get(name, MEDIA)
+        attempt = 0
+        while True:
+            await self.acquire(bucket_chat, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as ex:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                if bucket_chat is None and chat_id is not None:
+                    # Редактирование в группе: ждет только этот запрос,
+                    # общее ведро и отправка в группу не приостанавливаются
+                    await asyncio.sleep(ex.retry_after)
+                    continue
+                bucket = self.global_bucket if bucket_chat is None else self._chat_bucket(bucket_chat)
+                bucket.pause(time.monotonic(), ex.retry_after)
+                if self._wake is not None:
+                    self._wake.set()
+
+    def stats(self) -> Dict[str, float]:
+        """Счетчики планировщика: глубина очереди по приоритетам, ожидания, повторы."""
+        depth = {INTERACTIVE: 0, MEDIA: 0, BULK: 0}
+        for priority, *_ in self._waiters:
+            depth[priority] += 1
+        return {
+            "queued_interactive": depth[INTERACTIVE],
+            "queued_media": depth[MEDIA],
+            "queued_bulk": depth[BULK],
+            "max_depth": self.max_depth,
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "retries": self.retries,
+            "mean_wait_ms": self.total_wait / self.delayed * 1000 if self.delayed else 0.0,
+            "chats": len(self._chats),
+        }
@@ -0,0 +1,52 @@
+"""
+Последние поисковые запросы чатов.
+
+Кнопки страниц результатов /search не вмещают текст запроса (callback_data
+ограничена 64 байтами), а состояние FSM сбрасывается при каждом нажатии
+inline-кнопки. Поэтому запрос хранится здесь, а страница результатов
+каждый раз заново читается из индекса: это быстро и показывает
+актуальное содержимое папок.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class SearchQueries:
+    """Последний запрос каждого чата (LRU по чатам)."""
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        """
+        Args:
+            maxsize: Сколько чатов помнить
+        """
+        self.maxsize = maxsize
+        self._queries: "OrderedDict[int, str]" = OrderedDict()
+
+        self.searches = 0
+        self.expired = 0
+
+    def remember(self, chat_id: int, query: str) -> None:
+        """Запоминает новый запрос чата."""
+        self._queries[chat_id] = query
+        self._queries.move_to_end(chat_id)
+        self.searches += 1
+        if len(self._queries) > self.maxsize:
+            self._queries.popitem(last=False)
+
+    def get(self, chat_id: int) -> Optional[str]:
+        """Последний запрос чата (None - забыт или бот перезапущен)."""
+        query = self._queries.get(chat_id)
+        if query is None:
+            self.expired += 1
+        else:
+            self._queries.move_to_end(chat_id)
+        return query
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: выполненные поиски, устаревшие кнопки, число чатов."""
+        return {
+            "searches": self.searches,
+            "expired": self.expired,
+            "chats": len(self._queries),
+        }
@@ -0,0 +1,42 @@
+"""
+Метка запросов SQLite для трассировки (см. database.tracing).
+
+Middleware обработчиков записывает в database.tracing.query_tag id
+текущего обновления и имя обработчика. Контекст копируется в потоки
+database.async_core, поэтому каждый запрос, выполненный ради обновления,
+попадает в журнал медленных запросов с его меткой.
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from database.tracing import query_tag
+
+
+class QueryTagMiddleware(BaseMiddleware):
+    """Помечает запросы к базе id обновления и именем обработчика."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update = data.get("event_update")
+        handler_object = data.get("handler")
+        token = query_tag.set((
+            update.update_id if update is not None else None,
+            handler_object.callback.__name__ if handler_object is not None else "unknown"
+        ))
+        try:
+            return await handler(event, data)
+        finally:
+            query_tag.reset(token)
+
+
+def install(dp: Dispatcher) -> None:
+    """Подключает метки запросов к обработчикам сообщений и кнопок."""
+    dp.message.middleware(QueryTagMiddleware())
+    dp.callback_query.middleware(QueryTagMiddleware())
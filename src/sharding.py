@@ -0,0 +1,402 @@
+"""
+Шардирование обработки обновлений по процессам.
+
+Фронтовый процесс получает обновления (long polling или webhook, по
+config.BOT_MODE) и, не разбирая их, раздает config.SHARD_WORKERS
+процессам-воркерам по chat.id: один чат всегда попадает в один воркер,
+поэтому порядок обработки внутри чата сохраняется, а разные чаты
+обрабатываются параллельно на разных ядрах.
+
+Воркер - обычный бот (обработчики из bot.py) без собственного получения
+обновлений. Внутри воркера обновления одного чата выполняются строго по
+очереди, разных чатов - параллельно (не больше config.SHARD_INFLIGHT).
+
+Надежность:
+    - воркер раз в секунду обновляет пульс; фронт перезапускает процесс,
+      если тот завершился или пульса нет дольше SHARD_HEARTBEAT_TIMEOUT
+      (обновления, уже переданные упавшему воркеру, теряются, а его
+      очередь хранится во фронте и достается новому процессу);
+    - база открывается в режиме WAL с busy_timeout, а изменяющие
+      транзакции начинаются с BEGIN IMMEDIATE, так что писатели разных
+      процессов выстраиваются в очередь на блокировке SQLite;
+    - кеш папок в воркерах живет SHARD_CACHE_TTL секунд, потому что не
+      видит изменений, сделанных другими воркерами.
+"""
+
+import asyncio
+import functools
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.sharedctypes import Synchronized
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+import webhook
+from services import metrics
+
+# Поля обновления, в которых лежит объект с чатом или пользователем
+_CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "business_message", "edited_business_message", "my_chat_member",
+    "chat_member", "chat_join_request", "message_reaction",
+    "message_reaction_count", "chat_boost", "removed_chat_boost",
+)
+
+
+def update_chat_id(data: Dict[str, Any]) -> int:
+    """
+    Определяет чат необработанного обновления (словаря из Bot API).
+
+    Для нажатий кнопок - чат сообщения с кнопкой, для остальных событий без
+    чата - id пользователя, для совсем неизвестных - 0.
+    """
+    for name in _CHAT_FIELDS:
+        event = data.get(name)
+        if event:
+            chat = event.get("chat")
+            if chat:
+                return chat["id"]
+
+    for event in data.values():
+        if isinstance(event, dict):
+            message = event.get("message")
+            if isinstance(message, dict) and "chat" in message:
+                return message["chat"]["id"]
+            user = event.get("from") or event.get("user")
+            if isinstance(user, dict):
+                return user["id"]
+    return 0
+
+
+def shard_of(chat_id: int, workers: int) -> int:
+    """Номер воркера для чата."""
+    return abs(chat_id) % workers
+
+
+class ChatSequencer:
+    """Выполняет задачи одного чата по очереди, разных чатов - параллельно."""
+
+    def __init__(self) -> None:
+        self._tails: Dict[int, asyncio.Task] = {}
+
+    def submit(self, chat_id: int, job: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        """Ставит задачу после последней задачи того же чата."""
+        previous = self._tails.get(chat_id)
+        task = asyncio.create_task(self._run(previous, job))
+        self._tails[chat_id] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._tails.get(chat_id) is done:
+                del self._tails[chat_id]
+
+        task.add_done_callback(forget)
+        return task
+
+    @staticmethod
+    async def _run(previous: Optional[asyncio.Task], job: Callable[[], Awaitable[None]]) -> None:
+        if previous is not None:
+            # Ошибка предыдущего обновления не должна останавливать чат
+            await asyncio.wait([previous])
+        await job()
+
+    async def join(self) -> None:
+        """Дожидается всех поставленных задач."""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+async def _consume(connection: Connection, heartbeat: Synchronized) -> None:
+    """Обрабатывает обновления, получаемые от фронта, до получения None."""
+    from bot import bot, dp
+
+    loop = asyncio.get_running_loop()
+    inflight = asyncio.Semaphore(config.SHARD_INFLIGHT)
+    chats = ChatSequencer()
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    async def beat() -> None:
+        while True:
+            heartbeat.value = time.time()
+            await asyncio.sleep(1)
+
+    async def process(update: Update) -> None:
+        try:
+            await dp.feed_update(bot, update, **workflow_data)
+        except Exception as ex:
+            print(f"Ошибка обработки обновления {update.update_id}: {ex}")
+        finally:
+            inflight.release()
+
+    beater = asyncio.create_task(beat())
+    await dp.emit_startup(bot=bot, **workflow_data)
+    try:
+        while True:
+            await inflight.acquire()
+            try:
+                data = await loop.run_in_executor(None, connection.recv)
+            except EOFError:
+                # Фронт завершился
+                data = None
+            if data is None:
+                inflight.release()
+                break
+
+            try:
+                update = Update.model_validate(data, context={"bot": bot})
+            except ValueError as ex:
+                inflight.release()
+                print(f"Некорректное обновление: {ex}")
+                continue
+            chats.submit(update_chat_id(data), functools.partial(process, update))
+
+        await chats.join()
+    finally:
+        beater.cancel()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+
+
+async def _worker(index: int, connection: Connection, heartbeat: Synchronized) -> None:
+    """Воркер: бот без собственного получения обновлений."""
+    import bot as app
+    import database.сore as core
+
+    # Несколько процессов пишут в одну базу
+    core.init_pool(wal=True, immediate=True)
+    if config.SHARD_CACHE_TTL:
+        core.cache.ttl = config.SHARD_CACHE_TTL
+    else:
+        core.cache.enabled = False
+
+    try:
+        await app.serve(
+            functools.partial(_consume, connection, heartbeat),
+            # Порт METRICS_PORT занят фронтом
+            metrics_port=config.METRICS_PORT + 1 + index,
+            # Одной фоновой очистки базы достаточно
+            compaction=index == 0
+        )
+    finally:
+        await app.bot.session.close()
+
+
+def worker_main(index: int, connection: Connection, heartbeat: Synchronized) -> None:
+    """Точка входа процесса-воркера."""
+    # Остановкой управляет фронт (None в очереди), Ctrl+C игнорируем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(index, connection, heartbeat))
+    print(f"Воркер {index} остановлен")
+
+
+class Front:
+    """Раздача обновлений воркерам и контроль их работоспособности."""
+
+    def __init__(self, workers: int) -> None:
+        """
+        Args:
+            workers: Количество процессов-воркеров
+        """
+        # spawn: воркеры не наследуют соединения SQLite и потоки фронта
+        self._ctx = mp.get_context("spawn")
+        self.workers = workers
+        # Очередь воркера хранится во фронте и передается ему по pipe отдельным
+        # потоком: убитый воркер не может оставить захваченной блокировку очереди
+        self.buffers: List["queue.Queue[Optional[Dict[str, Any]]]"] = [
+            queue.Queue(maxsize=config.SHARD_INFLIGHT * 4) for _ in range(workers)
+        ]
+        self.connections: List[Optional[Connection]] = [None] * workers
+        self.heartbeats: List[Synchronized] = [self._ctx.Value("d", 0.0) for _ in range(workers)]
+        self.processes: List[Optional[mp.Process]] = [None] * workers
+        self._feeders: List[threading.Thread] = []
+
+        self.forwarded = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def start_worker(self, index: int) -> None:
+        """Запускает (или перезапускает) воркер с номером index."""
+        reader, writer = self._ctx.Pipe(duplex=False)
+        # Время на запуск процесса до первого пульса
+        self.heartbeats[index].value = time.time()
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(index, reader, self.heartbeats[index]),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        # Читающий конец остается только у воркера - после его смерти send упадет
+        reader.close()
+        self.connections[index], self.processes[index] = writer, process
+
+    def _feed(self, index: int) -> None:
+        """Передает обновления из очереди фронта воркеру (отдельный поток)."""
+        while True:
+            data = self.buffers[index].get()
+            while True:
+                try:
+                    self.connections[index].send(data)
+                    break
+                except (OSError, AttributeError):
+                    # Воркер перезапускается - ждем новое соединение
+                    time.sleep(0.1)
+            if data is None:
+                return
+
+    def start(self) -> None:
+        """Запускает все воркеры и потоки передачи обновлений."""
+        for index in range(self.workers):
+            self.start_worker(index)
+            feeder = threading.Thread(target=self._feed, args=(index,), daemon=True)
+            feeder.start()
+            self._feeders.append(feeder)
+
+    def forward(self, data: Dict[str, Any]) -> bool:
+        """Передает обновление воркеру без ожидания (False - очередь переполнена)."""
+        index = shard_of(update_chat_id(data), self.workers)
+        try:
+            self.buffers[index].put_nowait(data)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.forwarded += 1
+        return True
+
+    async def put(self, data: Dict[str, Any]) -> None:
+        """Передает обновление воркеру, дожидаясь места в очереди."""
+        index = shard_of(update_chat_id(data), self.workers)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.buffers[index].put, data)
+        self.forwarded += 1
+
+    def check_workers(self) -> None:
+        """Перезапускает завершившиеся и зависшие воркеры."""
+        now = time.time()
+        for index, process in enumerate(self.processes):
+            silent_for = now - self.heartbeats[index].value
+            if process is not None and process.is_alive() and silent_for < config.SHARD_HEARTBEAT_TIMEOUT:
+                continue
+
+            reason = "нет пульса" if process is not None and process.is_alive() else "завершился"
+            print(f"Воркер {index} {reason}, перезапуск")
+            if process is not None:
+                process.kill()
+                process.join()
+            self.connections[index].close()
+            self.start_worker(index)
+            self.restarts += 1
+
+    async def monitor(self, interval: float = 1.0) -> None:
+        """Периодически проверяет воркеры (фоновая задача)."""
+        while True:
+            await asyncio.sleep(interval)
+            self.check_workers()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Останавливает воркеры после обработки их очередей."""
+        deadline = time.monotonic() + timeout
+        for buffer in self.buffers:
+            buffer.put(None)
+        for feeder in self._feeders:
+            feeder.join(max(deadline - time.monotonic(), 0))
+        for process in self.processes:
+            if process is not None:
+                process.join(max(deadline - time.monotonic(), 0))
+                if process.is_alive():
+                    process.kill()
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счетчики фронта."""
+        return {
+            "workers": self.workers,
+            "forwarded": self.forwarded,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+
+async def poll_updates(front: Front, allowed_updates: List[str]) -> None:
+    """
+    Long polling без разбора обновлений: getUpdates напрямую через aiohttp.
+
+    Фронт только пересылает словари воркерам, поэтому модели aiogram
+    строятся уже в воркерах, параллельно.
+    """
+    url = f"https://api.telegram.org/bot{config.BOT_TOKEN}/getUpdates"
+    offset = 0
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.post(
+                    url,
+                    json={"offset": offset, "timeout": 30, "allowed_updates": allowed_updates},
+                    proxy=config.BOT_PROXY or None,
+                    timeout=aiohttp.ClientTimeout(total=40)
+                ) as response:
+                    body = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as ex:
+                print(f"Ошибка getUpdates: {ex}")
+                await asyncio.sleep(1)
+                continue
+
+            if not body.get("ok"):
+                retry_after = body.get("parameters", {}).get("retry_after", 1)
+                print(f"Ошибка getUpdates: {body.get('description')}")
+                await asyncio.sleep(retry_after)
+                continue
+
+            for data in body["result"]:
+                await front.put(data)
+                offset = data["update_id"] + 1
+
+
+async def run_front(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Запускает воркеры и раздает им обновления до сигнала остановки.
+
+    Args:
+        bot: Экземпляр бота (для регистрации webhook)
+        dp: Диспетчер (список используемых типов обновлений)
+    """
+    front = Front(config.SHARD_WORKERS)
+    front.start()
+    monitor = asyncio.create_task(front.monitor())
+
+    metrics_runner = None
+    if config.METRICS_ENABLED:
+        metrics.registry.add_collector(
+            metrics.stats_collector("bot_shard_front", front.stats, ("forwarded", "rejected", "restarts"))
+        )
+        metrics_runner = await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        if config.BOT_MODE == "webhook":
+            await webhook.run_webhook(bot, dp, stop, forward=front.forward)
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(poll_updates(front, dp.resolve_used_update_types()))
+            await stop.wait()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+    finally:
+        monitor.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await loop.run_in_executor(None, front.stop)
+        await bot.session.close()
+        print(f"Шардирование остановлено: {front.stats()}")
@@ -11,7 +11,7 @@ from aiogram.client.bot import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 
 
-session = AiohttpSession(proxy='http://proxy.server:3128')
+session = AiohttpSession(proxy=config.BOT_PROXY) if config.BOT_PROXY else None
 bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML), session=session)
 dp = Dispatcher()
 
@@ -4,6 +4,8 @@
 Все текстовые константы и шаблоны сообщений для взаимодействия с пользователем.
 """
 
+from html import escape
+
 # Сообщения пагинации
 FIRST_PAGE_ANSWER = "Вы находитесь на первой странице."
 LAST_PAGE_ANSWER = "Вы находитесь на последней странице."
@@ -14,6 +16,43 @@ def now_page_answer(page: int, cnt: int) -> str:
     return f"Вы находитесь на {page} из {cnt} страниц."
 
 
+# Сообщения отправки всех файлов папки
+SEND_ALL_EMPTY_ANSWER = "В этой папке нет файлов."
+SEND_ALL_BUSY_ANSWER = "Файлы уже отправляются. Дождитесь окончания или отмените отправку."
+
+
+def send_all_progress_text(sent: int, total: int) -> str:
+    """Генерирует сообщение о ходе отправки файлов папки."""
+    return f"Отправлено файлов: {sent} из {total}."
+
+
+def send_all_done_text(total: int) -> str:
+    """Генерирует сообщение об окончании отправки файлов папки."""
+    return f"Отправлены все файлы папки: {total}."
+
+
+def send_all_cancelled_text(sent: int, total: int) -> str:
+    """Генерирует сообщение об отмене отправки файлов папки."""
+    return f"Отправка отменена. Отправлено файлов: {sent} из {total}."
+
+
+def send_all_failed_text(sent: int, total: int) -> str:
+    """Генерирует сообщение об ошибке отправки файлов папки."""
+    return f"Не удалось отправить все файлы. Отправлено: {sent} из {total}."
+
+
+# Сообщения поиска
+SEARCH_USAGE_TEXT = "Напишите запрос после команды, например: <code>/search отчет 2023</code>."
+SEARCH_EMPTY_TEXT = "Ничего не найдено."
+SEARCH_EXPIRED_ANSWER = "Результаты поиска устарели. Повторите /search."
+SEARCH_NOT_FOUND_ANSWER = "Эта папка больше недоступна."
+
+
+def search_results_text(query: str, page: int) -> str:
+    """Генерирует заголовок страницы результатов поиска."""
+    return f"Результаты поиска «{escape(query)}», страница {page}:"
+
+
 # Сообщения об ошибках
 LONG_NAME_ERROR = (
     "Слишком длинное название. Пожалуйста, используйте не более 50 символов в имени папки."
@@ -21,6 +60,8 @@ LONG_NAME_ERROR = (
 PRIVATE_FOLDER_ERROR = "Эта папка приватная. Ее нельзя добавить."
 LINK_IS_NOT_VALID_ERROR = "Ссылка на папку не действительна."
 DOUBLICATE_FOLDER_ERROR = "Нельзя добавить в папку ту же самую папку."
+DEPTH_LIMIT_ERROR = "Нельзя добавить папку: слишком большая глубина вложенности."
+REVOKE_LINK_FORBIDDEN_ERROR = "Отозвать ссылку может только создатель папки."
 INCORRECTLY_PRIVATE_CHOSEN_ERROR = (
     "Пожалуйста, выберите один из вариантов из списка ниже:"
 )
@@ -47,6 +88,7 @@ ADD_VERTEX_TEXT = (
 )
 
 COMPLETE_HEAD_TEXT = "Текст добавлен."
+REVOKE_LINK_TEXT = "Прежние ссылки на папку больше не действуют. Новая ссылка - в сообщении ниже."
 CHOOSE_NAME_TEXT = "Выберите приватность папки:"
 ADD_HEAD_TEXT = (
     "Напишите текст (например, описание папки или заметка). "
@@ -96,6 +138,8 @@ HELP_INSTRUCTION = """
 <b>Команды, доступные пользователю:</b>
    /start – Начало работы с ботом. Команда очищает историю чата (за последние два дня) и показывает пользователю все его папки по страницам.
    /help – Подробная инструкция пользования ботом.
+   /revoke_link – Отозвать ссылки на текущую папку (только для создателя папки) и получить новую.
+   /search <i>запрос</i> – Найти папки и файлы по названию и тексту среди ваших папок. Нажмите на результат, чтобы открыть папку.
 """
 
 ADD_GROUP_FOLDER = "Отправьте название папки"
@@ -0,0 +1,240 @@
+"""
+Получение обновлений через webhook (альтернатива long polling).
+
+aiohttp-сервер принимает POST-запросы Telegram на config.WEBHOOK_PATH,
+проверяет секретный токен (заголовок X-Telegram-Bot-Api-Secret-Token)
+и кладет обновление в ограниченную очередь, сразу отвечая 200. Обработку
+ведут config.WEBHOOK_WORKERS задач через dp.feed_update. Если очередь
+переполнена, сервер отвечает 503 и Telegram повторит доставку позже.
+
+При остановке (SIGINT/SIGTERM) сервер перестает принимать запросы,
+дообрабатывает очередь и только потом завершает работу.
+
+Для локальной проверки достаточно BOT_MODE=webhook без WEBHOOK_URL
+(webhook в Telegram не регистрируется) и скрипта
+benchmarks/replay_updates.py, который отправляет записанные обновления.
+Без секрета сервер слушает только локальный адрес (WEBHOOK_HOST по
+умолчанию 127.0.0.1): иначе поддельные обновления мог бы прислать кто угодно.
+
+В режиме шардирования (sharding.py) сервер работает во фронтовом
+процессе и не разбирает обновления, а передает их функции forward.
+"""
+
+import asyncio
+import hmac
+import ipaddress
+import signal
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+import config
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def is_loopback(host: str) -> bool:
+    """Проверяет, что адрес доступен только с этой машины."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class WebhookServer:
+    """Webhook-сервер с ограниченной очередью и пулом обработчиков."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        path: str = "/webhook",
+        secret: str = "",
+        queue_size: int = 1000,
+        workers: int = 16,
+        forward: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> None:
+        """
+        Args:
+            bot: Экземпляр бота
+            dp: Диспетчер с обработчиками
+            path: Путь, на который приходят обновления
+            secret: Секретный токен (пусто - проверка отключена)
+            queue_size: Максимум принятых, но не обработанных обновлений
+            workers: Количество параллельных обработчиков
+            forward: Передает необработанное обновление дальше (вместо очереди
+                и dp.feed_update); False - некуда передать, ответ 503
+        """
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.secret = secret
+        self.workers = workers
+        self.forward = forward
+        self.queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=queue_size)
+        # Те же данные, что получают обработчики при polling
+        self.workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+        self._tasks: List[asyncio.Task] = []
+
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def app(self) -> web.Application:
+        """Создает aiohttp-приложение с обработчиком обновлений."""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принимает обновление от Telegram."""
+        if self.secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret
+        ):
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        if self.forward is not None:
+            if not self.forward(data):
+                self.rejected += 1
+                return web.Response(status=503)
+            self.accepted += 1
+            return web.Response()
+
+        try:
+            update = Update.model_validate(data, context={"bot": self.bot})
+        except ValidationError:
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку - так нагрузка не копится в памяти
+            self.rejected += 1
+            return web.Response(status=503)
+
+        self.accepted += 1
+        return web.Response()
+
+    async def _worker(self) -> None:
+        """Обрабатывает обновления из очереди."""
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update, **self.workflow_data)
+                self.processed += 1
+            except Exception as ex:
+                self.failed += 1
+                print(f"Ошибка обработки обновления {update.update_id}: {ex}")
+            finally:
+                self.queue.task_done()
+
+    def start_workers(self) -> None:
+        """Запускает обработчики очереди."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def drain(self) -> None:
+        """Дожидается обработки принятых обновлений и останавливает обработчики."""
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счетчики сервера."""
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "queued": self.queue.qsize(),
+        }
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    stop: Optional[asyncio.Event] = None,
+    forward: Optional[Callable[[Dict[str, Any]], bool]] = None
+) -> None:
+    """
+    Запускает webhook-сервер и работает до сигнала остановки.
+
+    Args:
+        bot: Экземпляр бота
+        dp: Диспетчер с обработчиками
+        stop: Событие остановки (по умолчанию - SIGINT/SIGTERM)
+        forward: Передача обновлений в другие процессы (см. WebhookServer)
+
+    Raises:
+        RuntimeError: Если сервер доступен извне, а секрет не задан
+    """
+    # Без секрета обновления на открытый порт мог бы прислать кто угодно
+    if config.WEBHOOK_URL and not config.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_URL задан без WEBHOOK_SECRET")
+    if not config.WEBHOOK_SECRET and not is_loopback(config.WEBHOOK_HOST):
+        raise RuntimeError(
+            f"WEBHOOK_HOST={config.WEBHOOK_HOST} без WEBHOOK_SECRET: "
+            "задайте секрет или слушайте локальный адрес"
+        )
+
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows: остается KeyboardInterrupt
+                pass
+
+    server = WebhookServer(
+        bot,
+        dp,
+        path=config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET,
+        queue_size=config.WEBHOOK_QUEUE_SIZE,
+        workers=0 if forward else config.WEBHOOK_WORKERS,
+        forward=forward
+    )
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+
+    # Запуск диспетчера без polling (on_startup-обработчики и т.п.)
+    if forward is None:
+        await dp.emit_startup(bot=bot, **server.workflow_data)
+    server.start_workers()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(config.WEBHOOK_WORKERS, 100)
+        )
+    print(f"Webhook слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    try:
+        await stop.wait()
+    finally:
+        # Сначала перестаем принимать запросы, затем дообрабатываем очередь
+        await site.stop()
+        await server.drain()
+        await runner.cleanup()
+        if forward is None:
+            await dp.emit_shutdown(bot=bot, **server.workflow_data)
+        await bot.session.close()
+        print(f"Webhook остановлен: {server.stats()}")